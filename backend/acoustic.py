@@ -0,0 +1,150 @@
+"""Vectorized acoustic anomaly detection for EVP clips.
+
+Works on mono float32 PCM (see ``audio_codec.decode_pcm``). The signal is cut
+into 25 ms frames with a 10 ms hop, and per-frame features are computed with
+NumPy in fixed-size blocks so memory stays bounded on long clips:
+
+- energy (RMS, dBFS) and SNR against an estimated noise floor
+- spectral flatness (tonal/voiced vs. noise-like)
+- share of energy in the speech band (300-3400 Hz)
+- formant-band peaks (F1 250-1000 Hz, F2 850-2500 Hz)
+
+Frames are then grouped into timestamped segments: short loud speech-band
+``burst``s and longer ``voice_like`` stretches with formant structure. The
+result drives the analysis confidence score and lets clips with nothing in
+them skip the paid transcription and GPT calls.
+"""
+import numpy as np
+
+FRAME_SECONDS = 0.025
+HOP_SECONDS = 0.010
+BLOCK_FRAMES = 4096
+EPSILON = 1e-10
+
+SPEECH_BAND = (300.0, 3400.0)
+F1_BAND = (250.0, 1000.0)
+F2_BAND = (850.0, 2500.0)
+
+
+def _frames(samples, frame_length, hop_length):
+    if len(samples) < frame_length:
+        samples = np.pad(samples, (0, frame_length - len(samples)))
+    windows = np.lib.stride_tricks.sliding_window_view(samples, frame_length)
+    return windows[::hop_length]
+
+
+def _band_mask(freqs, band):
+    return (freqs >= band[0]) & (freqs < band[1])
+
+
+def frame_features(samples, sample_rate):
+    """Per-frame energy_db, flatness, speech_ratio and formant flag arrays"""
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    hop_length = int(sample_rate * HOP_SECONDS)
+    frames = _frames(samples.astype(np.float32, copy=False), frame_length, hop_length)
+    window = np.hanning(frame_length).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame_length, 1.0 / sample_rate)
+    speech = _band_mask(freqs, SPEECH_BAND)
+    f1 = _band_mask(freqs, F1_BAND)
+    f2 = _band_mask(freqs, F2_BAND)
+
+    count = len(frames)
+    energy_db = np.empty(count, dtype=np.float32)
+    flatness = np.empty(count, dtype=np.float32)
+    speech_ratio = np.empty(count, dtype=np.float32)
+    formant = np.empty(count, dtype=bool)
+
+    for start in range(0, count, BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES]
+        stop = start + len(block)
+
+        rms = np.sqrt(np.mean(np.square(block), axis=1))
+        energy_db[start:stop] = 20.0 * np.log10(rms + EPSILON)
+
+        power = np.square(np.abs(np.fft.rfft(block * window, axis=1))).astype(np.float32) + EPSILON
+        total = power.sum(axis=1)
+        flatness[start:stop] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        speech_ratio[start:stop] = power[:, speech].sum(axis=1) / total
+
+        # A formant band "has a peak" when its strongest bin stands well above the band median
+        f1_power = power[:, f1]
+        f2_power = power[:, f2]
+        formant[start:stop] = (
+            (f1_power.max(axis=1) > 8.0 * np.median(f1_power, axis=1))
+            & (f2_power.max(axis=1) > 4.0 * np.median(f2_power, axis=1))
+        )
+
+    return energy_db, flatness, speech_ratio, formant
+
+
+def _segments(mask, min_frames):
+    """(start_frame, end_frame) runs of True at least ``min_frames`` long"""
+    if not mask.any():
+        return []
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    starts, ends = edges[::2], edges[1::2]
+    keep = (ends - starts) >= min_frames
+    return list(zip(starts[keep].tolist(), ends[keep].tolist()))
+
+
+def analyze_signal(samples, sample_rate):
+    """Score a clip and list timestamped anomalies"""
+    duration = len(samples) / sample_rate if sample_rate else 0.0
+    if len(samples) == 0:
+        return {"duration_seconds": 0.0, "confidence": 0.0, "snr_db": 0.0, "anomalies": []}
+
+    energy_db, flatness, speech_ratio, formant = frame_features(samples, sample_rate)
+
+    noise_floor_db = float(np.percentile(energy_db, 10))
+    peak_db = float(np.percentile(energy_db, 95))
+    snr_db = max(peak_db - noise_floor_db, 0.0)
+    frame_snr = energy_db - noise_floor_db
+
+    active = frame_snr > 6.0
+    voiced = active & (flatness < 0.3) & (speech_ratio > 0.6) & formant
+    bursts = (frame_snr > 12.0) & (speech_ratio > 0.5)
+
+    anomalies = []
+    for start, end in _segments(voiced, min_frames=15):  # >= 150 ms
+        anomalies.append({
+            "type": "voice_like",
+            "start": round(start * HOP_SECONDS, 2),
+            "end": round(end * HOP_SECONDS + FRAME_SECONDS, 2),
+            "peak_snr_db": round(float(frame_snr[start:end].max()), 1),
+            "mean_flatness": round(float(flatness[start:end].mean()), 3),
+        })
+    for start, end in _segments(bursts, min_frames=2):
+        if end - start > 30:  # longer than 300 ms is sustained sound, not a burst
+            continue
+        anomalies.append({
+            "type": "burst",
+            "start": round(start * HOP_SECONDS, 2),
+            "end": round(end * HOP_SECONDS + FRAME_SECONDS, 2),
+            "peak_snr_db": round(float(frame_snr[start:end].max()), 1),
+        })
+    anomalies.sort(key=lambda anomaly: anomaly["start"])
+
+    voiced_seconds = float(voiced.sum()) * HOP_SECONDS
+    voiced_share = voiced_seconds / duration if duration else 0.0
+    voice_segments = sum(1 for anomaly in anomalies if anomaly["type"] == "voice_like")
+    burst_count = len(anomalies) - voice_segments
+
+    # Weighted evidence: clean SNR, voice-like segments, how much of the clip is voiced, bursts
+    confidence = (
+        35.0 * min(snr_db / 30.0, 1.0)
+        + 35.0 * min(voice_segments / 3.0, 1.0)
+        + 20.0 * min(voiced_share * 5.0, 1.0)
+        + 10.0 * min(burst_count / 5.0, 1.0)
+    )
+    if voice_segments == 0 and burst_count == 0:
+        confidence = min(confidence, 10.0)
+
+    return {
+        "duration_seconds": round(duration, 2),
+        "confidence": round(confidence, 1),
+        "snr_db": round(snr_db, 1),
+        "noise_floor_db": round(noise_floor_db, 1),
+        "voiced_seconds": round(voiced_seconds, 2),
+        "anomalies": anomalies,
+    }
@@ -0,0 +1,193 @@
+"""Async client for the upstream AI provider (Whisper + GPT).
+
+All calls go through a bulkhead: at most ``max_concurrency`` requests are in
+flight against the provider, at most ``max_queue`` more may wait for a slot,
+and every call is bounded by a timeout. Anything beyond that is rejected
+straight away so a burst of analyses can never starve the rest of the API.
+A streamed chat completion holds its slot until the stream ends, and its
+timeout applies to each chunk rather than the whole reply.
+
+The OpenAI SDK client is created on first use in each process, so importing
+this module stays cheap and a client is never shared across a fork.
+"""
+import asyncio
+import io
+import os
+import time
+from contextlib import asynccontextmanager
+
+
+class AIClientError(Exception):
+    """Base error for upstream AI failures"""
+
+
+class AIBusyError(AIClientError):
+    """Raised when the bulkhead queue is full"""
+
+
+class AITimeoutError(AIClientError):
+    """Raised when an upstream call exceeds its timeout"""
+
+
+class AIClient:
+    def __init__(self, api_key, max_concurrency=4, max_queue=32, timeout=60.0, on_call=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        # on_call(operation, seconds, outcome) is told about every upstream call
+        self.on_call = on_call
+        self.api_key = api_key
+        self._client = None
+        self._client_pid = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+        self._stats = {
+            "calls": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "max_queue_depth": 0,
+            "wait_seconds_total": 0.0,
+            "run_seconds_total": 0.0,
+        }
+
+    @property
+    def client(self):
+        if self._client is None or self._client_pid != os.getpid():
+            # Deferred: the SDK is a large share of the server's import time
+            import openai
+
+            self._client = openai.AsyncOpenAI(api_key=self.api_key, max_retries=1)
+            self._client_pid = os.getpid()
+        return self._client
+
+    @asynccontextmanager
+    async def _slot(self, operation):
+        """Hold a bulkhead slot for one upstream call and record its outcome"""
+        if self._waiting >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise AIBusyError("AI upstream is saturated, try again shortly")
+
+        self._waiting += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._waiting)
+        queued_at = time.monotonic()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+
+        started_at = time.monotonic()
+        self._stats["wait_seconds_total"] += started_at - queued_at
+        self._in_flight += 1
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            outcome = "timeout"
+            raise AITimeoutError("AI upstream call timed out")
+        except (asyncio.CancelledError, GeneratorExit):
+            # Caller went away (client disconnect, abandoned stream)
+            outcome = "cancelled"
+            raise
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started_at
+            self._in_flight -= 1
+            self._semaphore.release()
+            self._stats["calls"] += 1
+            self._stats["run_seconds_total"] += elapsed
+            if self.on_call:
+                self.on_call(operation, elapsed, outcome)
+
+    async def _run(self, call, timeout=None, operation="call"):
+        async with self._slot(operation):
+            return await asyncio.wait_for(call(), timeout or self.timeout)
+
+    async def transcribe(self, audio_bytes, filename="audio.m4a", model="whisper-1", timeout=None):
+        """Transcribe audio bytes with Whisper and return the text"""
+        async def call():
+            audio_file = io.BytesIO(audio_bytes)
+            audio_file.name = filename
+            return await self.client.audio.transcriptions.create(
+                model=model,
+                file=audio_file,
+                response_format="text"
+            )
+
+        return await self._run(call, timeout, "transcribe")
+
+    async def transcribe_segments(self, audio_bytes, filename="audio.wav", model="whisper-1", timeout=None):
+        """Transcribe with Whisper segment timestamps; returns [{"start", "end", "text"}]"""
+        async def call():
+            audio_file = io.BytesIO(audio_bytes)
+            audio_file.name = filename
+            response = await self.client.audio.transcriptions.create(
+                model=model,
+                file=audio_file,
+                response_format="verbose_json"
+            )
+            return [
+                {"start": segment.start, "end": segment.end, "text": segment.text}
+                for segment in response.segments or []
+            ]
+
+        return await self._run(call, timeout, "transcribe_segments")
+
+    async def chat(self, messages, model="gpt-4", temperature=0.7, timeout=None):
+        """Run a chat completion and return the message content"""
+        async def call():
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature
+            )
+            return response.choices[0].message.content
+
+        return await self._run(call, timeout, "chat")
+
+    async def chat_stream(self, messages, model="gpt-4", temperature=0.7, timeout=None):
+        """Run a chat completion, yielding content deltas as they arrive"""
+        timeout = timeout or self.timeout
+        async with self._slot("chat_stream"):
+            stream = await asyncio.wait_for(
+                self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True
+                ),
+                timeout
+            )
+            try:
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                # Stops the upstream generation if the caller went away early
+                await stream.close()
+
+    def metrics(self):
+        """Snapshot of bulkhead state and counters"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "timeout_seconds": self.timeout,
+            "in_flight": self._in_flight,
+            "queue_depth": self._waiting,
+            **self._stats,
+        }
+
+    async def close(self):
+        if self._client is not None and self._client_pid == os.getpid():
+            await self._client.close()
+        self._client = None
@@ -0,0 +1,177 @@
+"""Audio decoding and re-encoding for server-side processing.
+
+WAV is decoded in-process with the standard library. Everything else (the
+phone's m4a/AAC recordings) goes through an ``ffmpeg`` subprocess, which is
+an optional system dependency: without it ``decode_pcm`` raises
+``AudioDecodeError`` and callers fall back to text-only analysis, and
+``normalize_for_transcription`` only handles WAV input.
+"""
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import wave
+
+import numpy as np
+
+FFMPEG = shutil.which("ffmpeg")
+
+
+class AudioDecodeError(Exception):
+    """Raised when audio cannot be decoded to PCM"""
+
+
+def _decode_wav(audio_bytes):
+    with wave.open(io.BytesIO(audio_bytes)) as wav:
+        channels = wav.getnchannels()
+        sample_width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if sample_width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise AudioDecodeError(f"Unsupported WAV sample width: {sample_width}")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, sample_rate
+
+
+def _resample(samples, source_rate, target_rate):
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    duration = len(samples) / source_rate
+    target_length = int(round(duration * target_rate))
+    positions = np.linspace(0, len(samples) - 1, target_length, dtype=np.float64)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def _write_temp(audio_bytes):
+    fd, path = tempfile.mkstemp(prefix="audio-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(audio_bytes)
+    return path
+
+
+async def _run_ffmpeg(audio_bytes, *output_args):
+    """Run ffmpeg over ``audio_bytes`` and return its stdout.
+
+    Input goes through a temp file rather than a pipe: phone m4a files usually
+    put the moov atom at the end, which ffmpeg can't read from a non-seekable pipe.
+    """
+    if not FFMPEG:
+        raise AudioDecodeError("ffmpeg is not installed")
+    path = await asyncio.to_thread(_write_temp, audio_bytes)
+    try:
+        process = await asyncio.create_subprocess_exec(
+            FFMPEG, "-hide_banner", "-loglevel", "error",
+            "-i", path,
+            *output_args,
+            "pipe:1",
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate()
+    finally:
+        await asyncio.to_thread(os.remove, path)
+    if process.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+    return stdout
+
+
+async def _ffmpeg_pcm(audio_bytes, sample_rate):
+    stdout = await _run_ffmpeg(audio_bytes, "-f", "f32le", "-ac", "1", "-ar", str(sample_rate))
+    return np.frombuffer(stdout, dtype="<f4")
+
+
+def is_wav(audio_bytes):
+    return audio_bytes[:4] == b"RIFF" and audio_bytes[8:12] == b"WAVE"
+
+
+async def decode_pcm(audio_bytes, sample_rate=16000):
+    """Decode any supported audio to mono float32 samples at ``sample_rate``"""
+    if is_wav(audio_bytes):
+        try:
+            samples, source_rate = await asyncio.to_thread(_decode_wav, audio_bytes)
+        except (wave.Error, EOFError) as e:
+            raise AudioDecodeError(f"Invalid WAV data: {e}")
+        return await asyncio.to_thread(_resample, samples, source_rate, sample_rate)
+    return await _ffmpeg_pcm(audio_bytes, sample_rate)
+
+
+def encode_wav(samples, sample_rate):
+    """Encode mono float32 samples as 16-bit PCM WAV bytes"""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+class NormalizationStats:
+    """Running before/after byte counts for normalized uploads"""
+
+    def __init__(self):
+        self.clips = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, bytes_in, bytes_out):
+        self.clips += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def snapshot(self):
+        return {
+            "clips": self.clips,
+            "skipped": self.skipped,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+        }
+
+
+async def normalize_for_transcription(audio_bytes, filename, stats=None, sample_rate=16000, bitrate="24k"):
+    """Downmix to mono, resample to ``sample_rate`` and re-encode compactly.
+
+    With ffmpeg the output is Ogg/Opus at ``bitrate``; without it only WAV input
+    is handled (re-encoded as 16-bit mono WAV). Returns (bytes, filename); the
+    original is returned whenever normalizing fails or wouldn't shrink it.
+    """
+    try:
+        if FFMPEG:
+            output = await _run_ffmpeg(
+                audio_bytes,
+                "-ac", "1", "-ar", str(sample_rate),
+                "-c:a", "libopus", "-b:a", bitrate, "-application", "voip",
+                "-f", "ogg",
+            )
+            output_name = "audio.ogg"
+        elif is_wav(audio_bytes):
+            samples = await decode_pcm(audio_bytes, sample_rate)
+            output = await asyncio.to_thread(encode_wav, samples, sample_rate)
+            output_name = "audio.wav"
+        else:
+            output = None
+    except AudioDecodeError:
+        output = None
+
+    if not output or len(output) >= len(audio_bytes):
+        if stats:
+            stats.skipped += 1
+        return audio_bytes, filename
+
+    if stats:
+        stats.record(len(audio_bytes), len(output))
+    return output, output_name
@@ -0,0 +1,514 @@
+"""Hermetic load test for the API.
+
+Boots ``server.app`` under uvicorn against local stand-ins, with no network
+access and no real credentials:
+
+- Mongo: an in-memory mock (``mongomock-motor``, in requirements.txt), or a throwaway local
+  mongod via ``--mongo-url``. The benchmark writes to its ``ghost_hunting``
+  database, so never point it at real data.
+- OpenAI and PayPal: one local HTTP stand-in serving the endpoints the server
+  uses, with configurable latency, jitter and failure rate.
+- Audio blobs: the filesystem blob store in a temporary directory.
+
+The database is seeded with sessions, recordings, EMF telemetry and
+subscribers, then a fixed number of concurrent clients run a request mix for
+a fixed time. The result is JSON with p50/p95/p99 latency and requests per
+second per endpoint; pass a previous result as ``--compare`` to print
+changes and fail on regressions.
+
+    python benchmark.py --scenario browse --concurrency 32 --duration 30 --output browse.json
+    python benchmark.py --scenario browse --compare browse.json
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from datetime import datetime
+
+import httpx
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+SAMPLE_RATE = 16000
+
+
+# Upstream stand-ins
+class Latency:
+    def __init__(self, mean_ms, jitter_ms, failure_rate):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+
+    async def wait(self):
+        """Sleep for one simulated upstream call; returns False if the call should fail"""
+        delay = random.uniform(self.mean_ms - self.jitter_ms, self.mean_ms + self.jitter_ms)
+        await asyncio.sleep(max(delay, 0.0) / 1000)
+        return random.random() >= self.failure_rate
+
+    def describe(self):
+        return {"mean_ms": self.mean_ms, "jitter_ms": self.jitter_ms, "failure_rate": self.failure_rate}
+
+
+def create_upstream_app(openai_latency, paypal_latency):
+    """Starlette app answering the OpenAI and PayPal calls the server makes"""
+    upstream_error = JSONResponse(
+        {"error": {"message": "Stand-in failure", "type": "server_error"}}, status_code=500
+    )
+
+    async def transcriptions(request):
+        form = await request.form()
+        if not await openai_latency.wait():
+            return upstream_error
+        text = "help me here"
+        if form.get("response_format") == "verbose_json":
+            return JSONResponse({
+                "task": "transcribe",
+                "language": "english",
+                "duration": 1.0,
+                "text": text,
+                "segments": [{
+                    "id": 0, "seek": 0, "start": 0.0, "end": 1.0, "text": f" {text}", "tokens": [],
+                    "temperature": 0.0, "avg_logprob": -0.2, "compression_ratio": 1.0, "no_speech_prob": 0.1,
+                }],
+            })
+        return PlainTextResponse(text)
+
+    async def chat_completions(request):
+        body = await request.json()
+        if not await openai_latency.wait():
+            return upstream_error
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "Faint voice-like pattern; likely environmental."},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 12, "total_tokens": 112},
+        })
+
+    async def paypal_token(request):
+        if not await paypal_latency.wait():
+            return JSONResponse({"error": "server_error"}, status_code=500)
+        return JSONResponse({"access_token": f"A21-{uuid.uuid4().hex}", "token_type": "Bearer", "expires_in": 32400})
+
+    async def create_subscription(request):
+        body = await request.json()
+        if not await paypal_latency.wait():
+            return JSONResponse({"name": "INTERNAL_SERVICE_ERROR"}, status_code=500)
+        subscription_id = f"I-{uuid.uuid4().hex[:12].upper()}"
+        return JSONResponse({
+            "id": subscription_id,
+            "status": "APPROVAL_PENDING",
+            "custom_id": body.get("custom_id"),
+            "links": [{"rel": "approve", "href": f"https://paypal.invalid/approve/{subscription_id}"}],
+        }, status_code=201)
+
+    async def get_subscription(request):
+        if not await paypal_latency.wait():
+            return JSONResponse({"name": "INTERNAL_SERVICE_ERROR"}, status_code=500)
+        return JSONResponse({"id": request.path_params["subscription_id"], "status": "ACTIVE"})
+
+    async def cancel_subscription(request):
+        if not await paypal_latency.wait():
+            return JSONResponse({"name": "INTERNAL_SERVICE_ERROR"}, status_code=500)
+        return Response(status_code=204)
+
+    return Starlette(routes=[
+        Route("/v1/audio/transcriptions", transcriptions, methods=["POST"]),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/oauth2/token", paypal_token, methods=["POST"]),
+        Route("/v1/billing/subscriptions", create_subscription, methods=["POST"]),
+        Route("/v1/billing/subscriptions/{subscription_id}", get_subscription, methods=["GET"]),
+        Route("/v1/billing/subscriptions/{subscription_id}/cancel", cancel_subscription, methods=["POST"]),
+    ])
+
+
+def serve_in_thread(app):
+    """Run an ASGI app with uvicorn on a free local port; returns (base_url, server)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Server failed to start")
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}", server
+
+
+def load_server(upstream_url, mongo_url, blob_dir):
+    """Import server.py configured against the stand-ins"""
+    os.environ.update({
+        "OPENAI_BASE_URL": f"{upstream_url}/v1",
+        "EMERGENT_LLM_KEY": "sk-benchmark",
+        "PAYPAL_BASE_URL": upstream_url,
+        "PAYPAL_CLIENT_ID": "benchmark",
+        "PAYPAL_SECRET": "benchmark",
+        "PAYPAL_PLAN_ID": "P-BENCHMARK",
+        "BLOB_STORE": "filesystem",
+        "BLOB_STORE_PATH": blob_dir,
+    })
+    if mongo_url:
+        os.environ["MONGO_URL"] = mongo_url
+    else:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("In-memory Mongo needs mongomock-motor (pip install mongomock-motor), or pass --mongo-url")
+        import motor.motor_asyncio
+        motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: AsyncMongoMockClient()
+
+    import server
+    return server
+
+
+# Test data
+def make_clip(seconds, rng):
+    """WAV bytes of room noise with a few short voice-like bursts"""
+    length = int(seconds * SAMPLE_RATE)
+    samples = rng.standard_normal(length).astype(np.float32) * 0.003
+    t = np.arange(int(SAMPLE_RATE * 0.5)) / SAMPLE_RATE
+    voice = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 12)).astype(np.float32) * 0.1
+    for _ in range(rng.integers(1, 4)):
+        start = int(rng.integers(0, max(length - len(voice), 1)))
+        samples[start:start + len(voice)] += voice[:length - start]
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def unique_clip(clip, rng):
+    """Same clip with its last samples changed, so the transcription cache misses"""
+    data = bytearray(clip)
+    data[-8:] = rng.bytes(8)
+    return bytes(data)
+
+
+class Fixture:
+    def __init__(self, seed):
+        self.rng = np.random.default_rng(seed)
+        self.session_ids = []
+        self.recordings = {}  # session_id -> [recording_id]
+        self.recording_ids = []
+        self.user_ids = []
+        self.clips = [make_clip(float(self.rng.uniform(3, 8)), self.rng) for _ in range(16)]
+
+
+async def seed(client, fixture, sessions, recordings_per_session, users):
+    """Populate the database through the API"""
+    semaphore = asyncio.Semaphore(16)
+
+    async def call(method, url, **kwargs):
+        async with semaphore:
+            response = await client.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response.json()
+
+    async def seed_session(index):
+        session = await call("POST", "/api/sessions", json={
+            "name": f"Benchmark session {index}",
+            "location": "Stand-in manor",
+            "date": datetime.utcnow().date().isoformat(),
+            "notes": "Seeded by benchmark.py",
+        })
+        session_id = session["session"]["id"]
+        xyz = (fixture.rng.standard_normal(3000 * 3).astype("<f4") * 5 + 45).tobytes()
+        await call("POST", f"/api/sessions/{session_id}/emf", json={
+            "start_ms": 1_700_000_000_000, "interval_ms": 100, "xyz": base64.b64encode(xyz).decode(),
+        })
+        recording_ids = []
+        for _ in range(recordings_per_session):
+            clip = fixture.clips[int(fixture.rng.integers(len(fixture.clips)))]
+            recording = await call(
+                "POST", "/api/recordings/upload",
+                data={"session_id": session_id, "type": "evp", "timestamp": datetime.utcnow().isoformat()},
+                files={"file": ("clip.wav", clip, "audio/wav")},
+            )
+            recording_ids.append(recording["recording"]["id"])
+        fixture.session_ids.append(session_id)
+        fixture.recordings[session_id] = recording_ids
+        fixture.recording_ids.extend(recording_ids)
+
+    async def seed_user(index):
+        user_id = f"bench-user-{index}"
+        fixture.user_ids.append(user_id)
+        # Half the users are subscribers, the rest exercise the negative cache
+        if index % 2 == 0:
+            await call("POST", "/api/subscription/dev-activate", json={"user_id": user_id})
+
+    await asyncio.gather(*(seed_session(index) for index in range(sessions)))
+    await asyncio.gather(*(seed_user(index) for index in range(users)))
+
+
+# Request mixes: (weight, endpoint label, builder(fixture, rng) -> (method, url, request kwargs))
+def _session(fixture, rng):
+    return fixture.session_ids[rng.randrange(len(fixture.session_ids))]
+
+
+def _recording(fixture, rng):
+    return fixture.recording_ids[rng.randrange(len(fixture.recording_ids))]
+
+
+def _user(fixture, rng):
+    # Skewed towards a hot set, like app launches after a push notification
+    index = min(int(rng.expovariate(1 / 20)), len(fixture.user_ids) - 1)
+    return fixture.user_ids[index]
+
+
+def _clip(fixture, rng):
+    return unique_clip(fixture.clips[rng.randrange(len(fixture.clips))], fixture.rng)
+
+
+BROWSE = [
+    (35, "GET /api/sessions", lambda f, r: ("GET", "/api/sessions?limit=50", {})),
+    (15, "GET /api/sessions/{session_id}", lambda f, r: ("GET", f"/api/sessions/{_session(f, r)}", {})),
+    (30, "GET /api/recordings/{session_id}", lambda f, r: ("GET", f"/api/recordings/{_session(f, r)}?limit=50", {})),
+    (10, "GET /api/sessions/{session_id}/emf", lambda f, r: ("GET", f"/api/sessions/{_session(f, r)}/emf?points=500", {})),
+    (10, "GET /api/recordings/{recording_id}/audio", lambda f, r: (
+        "GET", f"/api/recordings/{_recording(f, r)}/audio", {"headers": {"Range": "bytes=0-65535"}}
+    )),
+]
+
+SUBSCRIPTION_STORM = [
+    (90, "GET /api/subscription/status", lambda f, r: ("GET", f"/api/subscription/status?user_id={_user(f, r)}", {})),
+    (4, "POST /api/subscription/create-checkout", lambda f, r: (
+        "POST", "/api/subscription/create-checkout", {"json": {"user_id": _user(f, r)}}
+    )),
+    (3, "POST /api/subscription/verify", lambda f, r: (
+        "POST", f"/api/subscription/verify?subscription_id=I-BENCH{r.randrange(10**6)}&user_id={_user(f, r)}", {}
+    )),
+    (3, "POST /api/subscription/webhook", lambda f, r: ("POST", "/api/subscription/webhook", {"json": {
+        "id": f"WH-{uuid.uuid4().hex}",
+        "event_type": "BILLING.SUBSCRIPTION.ACTIVATED",
+        "resource": {"id": f"I-BENCH{r.randrange(10**6)}", "custom_id": _user(f, r)},
+    }})),
+]
+
+EVP_BURST = [
+    (40, "POST /api/recordings/upload", lambda f, r: ("POST", "/api/recordings/upload", {
+        "data": {"session_id": _session(f, r), "type": "evp", "timestamp": datetime.utcnow().isoformat()},
+        "files": {"file": ("clip.wav", _clip(f, r), "audio/wav")},
+    })),
+    (30, "POST /api/transcribe", lambda f, r: ("POST", "/api/transcribe", {
+        "files": {"file": ("clip.wav", _clip(f, r), "audio/wav")},
+    })),
+    (30, "POST /api/evp-jobs", lambda f, r: ("POST", "/api/evp-jobs", {
+        "data": {"recording_id": _recording(f, r)},
+    })),
+]
+
+
+def _mix(*weighted):
+    return [(weight * share, label, build) for share, operations in weighted for weight, label, build in operations]
+
+
+SCENARIOS = {
+    "browse": BROWSE,
+    "subscription-storm": SUBSCRIPTION_STORM,
+    "evp-burst": EVP_BURST,
+    "mixed": _mix((0.6, BROWSE), (0.3, SUBSCRIPTION_STORM), (0.1, EVP_BURST)),
+}
+
+
+# Load generation and reporting
+async def drive(client, fixture, operations, concurrency, duration, warmup, seed):
+    """Run `concurrency` closed-loop clients; returns ({label: [(latency_s, status)]}, measured seconds)"""
+    weights = [operation[0] for operation in operations]
+    samples = {label: [] for _, label, _ in operations}
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def client_loop(index):
+        rng = random.Random(seed + index)
+        while True:
+            _, label, build = rng.choices(operations, weights)[0]
+            method, url, kwargs = build(fixture, rng)
+            sent = time.perf_counter()
+            if sent >= deadline:
+                return
+            try:
+                response = await client.request(method, url, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            if sent >= measure_from:
+                samples[label].append((time.perf_counter() - sent, status))
+
+    await asyncio.gather(*(client_loop(index) for index in range(concurrency)))
+    return samples, time.perf_counter() - measure_from
+
+
+def summarize(results, elapsed):
+    """Per-endpoint and overall latency percentiles (ms), throughput and errors"""
+    def stats(entries):
+        if not entries:
+            return {"requests": 0, "errors": 0, "rps": 0.0}
+        latencies = np.array([latency for latency, _ in entries]) * 1000
+        statuses = {}
+        for _, status in entries:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            "requests": len(entries),
+            "errors": sum(1 for _, status in entries if status == 0 or status >= 500),
+            "rps": round(len(entries) / elapsed, 2),
+            "mean_ms": round(float(latencies.mean()), 2),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+            "max_ms": round(float(latencies.max()), 2),
+            "status": statuses,
+        }
+
+    return (
+        {label: stats(entries) for label, entries in results.items()},
+        stats([entry for entries in results.values() for entry in entries]),
+    )
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, max_regression):
+    """Print p95/rps changes against a previous report; returns True if p95 regressed too far"""
+    regressed = False
+    print(f"{'endpoint':48} {'p95 ms':>18} {'rps':>18}", file=sys.stderr)
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for label, current in rows:
+        previous = baseline["total"] if label == "TOTAL" else baseline["endpoints"].get(label)
+        if not previous or not previous.get("requests") or not current.get("requests"):
+            continue
+        p95_change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0.0
+        rps_change = (current["rps"] - previous["rps"]) / previous["rps"] * 100 if previous["rps"] else 0.0
+        flag = ""
+        if p95_change > max_regression:
+            regressed = True
+            flag = "  REGRESSION"
+        print(
+            f"{label:48} {previous['p95_ms']:>7.1f} -> {current['p95_ms']:>7.1f} "
+            f"{previous['rps']:>7.1f} -> {current['rps']:>7.1f}  ({p95_change:+.0f}% p95, {rps_change:+.0f}% rps){flag}",
+            file=sys.stderr,
+        )
+    return regressed
+
+
+async def run(args):
+    openai_latency = Latency(args.openai_latency_ms, args.openai_jitter_ms, args.openai_failure_rate)
+    paypal_latency = Latency(args.paypal_latency_ms, args.paypal_jitter_ms, args.paypal_failure_rate)
+    upstream_url, upstream = serve_in_thread(create_upstream_app(openai_latency, paypal_latency))
+
+    with tempfile.TemporaryDirectory(prefix="benchmark-blobs-") as blob_dir:
+        server = load_server(upstream_url, args.mongo_url, blob_dir)
+        api_url, api = serve_in_thread(server.app)
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency + 16, max_keepalive_connections=args.concurrency + 16)
+            async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=args.timeout) as client:
+                fixture = Fixture(args.seed)
+                seed_started = time.perf_counter()
+                await seed(client, fixture, args.sessions, args.recordings_per_session, args.users)
+                print(f"Seeded in {time.perf_counter() - seed_started:.1f}s; running {args.scenario}", file=sys.stderr)
+
+                results, elapsed = await drive(
+                    client, fixture, SCENARIOS[args.scenario], args.concurrency, args.duration, args.warmup, args.seed
+                )
+        finally:
+            api.should_exit = True
+            upstream.should_exit = True
+
+    endpoints, total = summarize(results, elapsed)
+    return {
+        "scenario": args.scenario,
+        "started_at": datetime.utcnow().isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "concurrency": args.concurrency,
+        "duration_seconds": round(elapsed, 2),
+        "warmup_seconds": args.warmup,
+        "mongo": "local mongod" if args.mongo_url else "in-memory",
+        "seed": {
+            "sessions": args.sessions,
+            "recordings_per_session": args.recordings_per_session,
+            "users": args.users,
+        },
+        "upstream": {"openai": openai_latency.describe(), "paypal": paypal_latency.describe()},
+        "endpoints": endpoints,
+        "total": total,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before measuring")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request client timeout")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--recordings-per-session", type=int, default=5)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--mongo-url", help="throwaway local mongod instead of the in-memory mock")
+    parser.add_argument("--openai-latency-ms", type=float, default=400.0)
+    parser.add_argument("--openai-jitter-ms", type=float, default=150.0)
+    parser.add_argument("--openai-failure-rate", type=float, default=0.0)
+    parser.add_argument("--paypal-latency-ms", type=float, default=150.0)
+    parser.add_argument("--paypal-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--paypal-failure-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="p95 increase (%%) that fails --compare")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Binary storage for recording audio.
+
+Audio is kept out of the ``recordings`` documents and written to a blob store
+in fixed-size chunks. Reads are ranged, so serving a recording never needs the
+whole file in memory. Two backends are available, selected with ``BLOB_STORE``:
+
+- ``gridfs`` (default): GridFS bucket in the same Mongo database
+- ``filesystem``: plain files under ``BLOB_STORE_PATH``
+"""
+import asyncio
+import os
+import uuid
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+CHUNK_SIZE = 256 * 1024
+
+
+class BlobNotFound(Exception):
+    """Raised when a blob id does not exist in the store"""
+
+
+class BlobStore:
+    """Interface implemented by every blob backend"""
+
+    async def put_stream(self, chunks, filename, content_type):
+        """Write an async iterable of byte chunks; return (blob_id, size)"""
+        raise NotImplementedError
+
+    async def put_bytes(self, data, filename, content_type):
+        async def chunks():
+            for offset in range(0, len(data), CHUNK_SIZE):
+                yield data[offset:offset + CHUNK_SIZE]
+
+        return await self.put_stream(chunks(), filename, content_type)
+
+    async def size(self, blob_id):
+        raise NotImplementedError
+
+    def iter_range(self, blob_id, start, end):
+        """Async iterator over bytes ``start``..``end`` (inclusive)"""
+        raise NotImplementedError
+
+    async def delete(self, blob_id):
+        raise NotImplementedError
+
+
+class GridFSBlobStore(BlobStore):
+    def __init__(self, db, bucket_name="audio"):
+        self._db = db
+        self._bucket_name = bucket_name
+        self._gridfs = None
+
+    @property
+    def _bucket(self):
+        # Created on first use: a GridFS bucket binds the Motor client to the
+        # current event loop, which at import time is not the server's
+        if self._gridfs is None:
+            self._gridfs = AsyncIOMotorGridFSBucket(
+                self._db, bucket_name=self._bucket_name, chunk_size_bytes=CHUNK_SIZE
+            )
+        return self._gridfs
+
+    @staticmethod
+    def _object_id(blob_id):
+        try:
+            return ObjectId(blob_id)
+        except (InvalidId, TypeError):
+            raise BlobNotFound(blob_id)
+
+    async def put_stream(self, chunks, filename, content_type):
+        grid_in = self._bucket.open_upload_stream(filename, metadata={"content_type": content_type})
+        size = 0
+        try:
+            async for chunk in chunks:
+                await grid_in.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            await grid_in.abort()
+            raise
+        await grid_in.close()
+        return str(grid_in._id), size
+
+    async def _open(self, blob_id):
+        try:
+            return await self._bucket.open_download_stream(self._object_id(blob_id))
+        except NoFile:
+            raise BlobNotFound(blob_id)
+
+    async def size(self, blob_id):
+        grid_out = await self._open(blob_id)
+        return grid_out.length
+
+    async def iter_range(self, blob_id, start, end):
+        grid_out = await self._open(blob_id)
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await grid_out.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    async def delete(self, blob_id):
+        try:
+            await self._bucket.delete(self._object_id(blob_id))
+        except (NoFile, BlobNotFound):
+            pass
+
+
+class FilesystemBlobStore(BlobStore):
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, blob_id):
+        # Ids are generated here; reject anything that could escape the root
+        if not blob_id or not all(c in "0123456789abcdef" for c in blob_id):
+            raise BlobNotFound(blob_id)
+        return os.path.join(self.root, blob_id[:2], blob_id)
+
+    async def put_stream(self, chunks, filename, content_type):
+        blob_id = uuid.uuid4().hex
+        path = self._path(blob_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = 0
+        f = await asyncio.to_thread(open, path, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(f.write, chunk)
+                size += len(chunk)
+        except BaseException:
+            await asyncio.to_thread(f.close)
+            await asyncio.to_thread(os.remove, path)
+            raise
+        await asyncio.to_thread(f.close)
+        return blob_id, size
+
+    async def size(self, blob_id):
+        try:
+            return (await asyncio.to_thread(os.stat, self._path(blob_id))).st_size
+        except FileNotFoundError:
+            raise BlobNotFound(blob_id)
+
+    async def iter_range(self, blob_id, start, end):
+        try:
+            f = await asyncio.to_thread(open, self._path(blob_id), "rb")
+        except FileNotFoundError:
+            raise BlobNotFound(blob_id)
+        try:
+            await asyncio.to_thread(f.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def delete(self, blob_id):
+        try:
+            await asyncio.to_thread(os.remove, self._path(blob_id))
+        except (FileNotFoundError, BlobNotFound):
+            pass
+
+
+def create_blob_store(db):
+    backend = os.getenv("BLOB_STORE", "gridfs")
+    if backend == "filesystem":
+        return FilesystemBlobStore(os.getenv("BLOB_STORE_PATH", "./blobs"))
+    if backend == "gridfs":
+        return GridFSBlobStore(db)
+    raise ValueError(f"Unknown BLOB_STORE backend: {backend}")
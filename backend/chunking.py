@@ -0,0 +1,103 @@
+"""Splitting long recordings into chunks for parallel transcription.
+
+``plan_chunks`` cuts the signal near every ``chunk_seconds`` at the quietest
+stretch it can find, and pads each chunk with ``overlap_seconds`` of audio
+from its neighbours so a word caught on a cut is still heard whole by one
+side. Each chunk *owns* only the span between its two cuts; ``stitch_segments``
+keeps the segments whose midpoint falls in that span and trims words repeated
+across the seam, giving one timestamped transcript for the whole recording.
+"""
+import re
+
+import numpy as np
+
+FRAME_SECONDS = 0.030
+SMOOTH_SECONDS = 0.3
+EPSILON = 1e-10
+
+
+def _frame_energy_db(samples, sample_rate):
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    count = len(samples) // frame_length
+    frames = samples[:count * frame_length].reshape(count, frame_length)
+    energy_db = 20.0 * np.log10(np.sqrt(np.mean(np.square(frames), axis=1)) + EPSILON)
+    # Prefer sustained pauses over a single quiet frame between syllables
+    width = max(int(SMOOTH_SECONDS / FRAME_SECONDS), 1)
+    return np.convolve(energy_db, np.ones(width) / width, mode="same")
+
+
+def plan_chunks(samples, sample_rate, chunk_seconds=120.0, overlap_seconds=2.0, search_seconds=15.0):
+    """List of (start, end, owned_start, owned_end) sample indices covering ``samples``"""
+    total = len(samples)
+    chunk = int(chunk_seconds * sample_rate)
+    if total <= chunk * 1.25:
+        return [(0, total, 0, total)]
+
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    energy_db = _frame_energy_db(samples, sample_rate)
+    search = int(search_seconds / FRAME_SECONDS)
+
+    cuts = [0]
+    # Stop before the remainder would become a sliver of a chunk
+    while total - cuts[-1] > chunk * 1.25:
+        target = (cuts[-1] + chunk) // frame_length
+        low = max(target - search, cuts[-1] // frame_length + 1)
+        quietest = low + int(np.argmin(energy_db[low:target + 1]))
+        cuts.append(quietest * frame_length)
+    cuts.append(total)
+
+    overlap = int(overlap_seconds * sample_rate)
+    return [
+        (max(start - overlap, 0), min(end + overlap, total), start, end)
+        for start, end in zip(cuts[:-1], cuts[1:])
+    ]
+
+
+def _words(text):
+    return [re.sub(r"[^\w']", "", word).lower() for word in text.split()]
+
+
+def _drop_repeated_prefix(previous_text, text, max_words=8):
+    """Strip the leading words of ``text`` that repeat the tail of ``previous_text``"""
+    tail = _words(previous_text)[-max_words:]
+    words = text.split()
+    head = _words(text)[:max_words]
+    for size in range(min(len(tail), len(head)), 0, -1):
+        if tail[-size:] == head[:size] and any(head[:size]):
+            return " ".join(words[size:])
+    return text
+
+
+def stitch_segments(chunks, results, sample_rate):
+    """Merge per-chunk segment lists into one transcript in original time.
+
+    ``results[i]`` holds Whisper segments for ``chunks[i]`` with times relative
+    to the chunk start. Returns [{"start", "end", "text"}].
+    """
+    stitched = []
+    total = chunks[-1][1]
+    for (start, _end, owned_start, owned_end), segments in zip(chunks, results):
+        offset = start / sample_rate
+        owned_from, owned_to = owned_start / sample_rate, owned_end / sample_rate
+        lead_in = owned_from - offset
+        first = True
+        for segment in segments:
+            segment_start = offset + segment["start"]
+            segment_end = offset + segment["end"]
+            middle = (segment_start + segment_end) / 2
+            # The last chunk also keeps anything Whisper timestamps past the end
+            if middle < owned_from or (middle >= owned_to and owned_end != total):
+                continue
+            text = segment["text"].strip()
+            if first and stitched and segment_start < owned_from + lead_in:
+                # Whisper may hear the same words on both sides of a seam
+                text = _drop_repeated_prefix(stitched[-1]["text"], text)
+            first = False
+            if not text:
+                continue
+            stitched.append({
+                "start": round(segment_start, 2),
+                "end": round(segment_end, 2),
+                "text": text
+            })
+    return stitched
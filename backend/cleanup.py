@@ -0,0 +1,98 @@
+"""Cascading deletes and orphan sweeping.
+
+Deleting a session removes its recordings, their audio blobs, their EVP
+analyses and search entries in bounded batches, then its EMF telemetry and
+finally the session document itself. Everything here runs from the cleanup
+job queue, never inside a request.
+"""
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+async def delete_recordings(db, blob_store, query, batch_size=200):
+    """Delete recordings matching ``query`` with their blobs and analyses; returns counts"""
+    counts = {"recordings": 0, "blobs": 0, "analyses": 0, "search_entries": 0}
+    while True:
+        batch = await db.recordings.find(query, {"_id": 1, "audio_blob_id": 1}).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return counts
+
+        for recording in batch:
+            if recording.get("audio_blob_id"):
+                await blob_store.delete(recording["audio_blob_id"])
+                counts["blobs"] += 1
+
+        recording_ids = [recording["_id"] for recording in batch]
+        related = {"recording_id": {"$in": [str(i) for i in recording_ids]}}
+        analyses = await db.evp_analyses.delete_many(related)
+        entries = await db.search_entries.delete_many(related)
+        recordings = await db.recordings.delete_many({"_id": {"$in": recording_ids}})
+        counts["analyses"] += analyses.deleted_count
+        counts["search_entries"] += entries.deleted_count
+        counts["recordings"] += recordings.deleted_count
+
+
+async def cascade_delete_session(db, blob_store, session_id, batch_size=200):
+    counts = await delete_recordings(db, blob_store, {"session_id": session_id}, batch_size)
+    emf = await db.emf_buckets.delete_many({"session_id": session_id})
+    counts["emf_buckets"] = emf.deleted_count
+    # Session goes last so an interrupted run can still be found and resumed
+    await db.sessions.delete_one({"_id": ObjectId(session_id)})
+    return counts
+
+
+def _object_id(value):
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+async def sweep_orphans(db, blob_store, batch_size=200):
+    """Reclaim data whose parent no longer exists; returns counts"""
+    totals = {
+        "sessions_resumed": 0, "recordings": 0, "blobs": 0, "analyses": 0, "search_entries": 0, "emf_buckets": 0
+    }
+
+    def add(counts):
+        for key, value in counts.items():
+            totals[key] += value
+
+    # Tombstoned sessions whose cascade never finished
+    async for session in db.sessions.find({"deleted_at": {"$exists": True}}, {"_id": 1}):
+        add(await cascade_delete_session(db, blob_store, str(session["_id"]), batch_size))
+        totals["sessions_resumed"] += 1
+
+    # Recordings pointing at sessions that are gone
+    session_ids = await db.recordings.distinct("session_id")
+    for start in range(0, len(session_ids), batch_size):
+        chunk = session_ids[start:start + batch_size]
+        object_ids = [oid for oid in map(_object_id, chunk) if oid]
+        existing = {doc["_id"] async for doc in db.sessions.find({"_id": {"$in": object_ids}}, {"_id": 1})}
+        missing = [str(oid) for oid in object_ids if oid not in existing]
+        if missing:
+            add(await delete_recordings(db, blob_store, {"session_id": {"$in": missing}}, batch_size))
+
+    # Analyses of stored recordings that are gone. Analyses made from
+    # client-side clips use non-ObjectId recording ids and are left alone.
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id else {}
+        batch = await db.evp_analyses.find(query, {"recording_id": 1}).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        referenced = {doc["_id"]: _object_id(doc.get("recording_id")) for doc in batch}
+        recording_ids = [oid for oid in referenced.values() if oid]
+        existing = {doc["_id"] async for doc in db.recordings.find({"_id": {"$in": recording_ids}}, {"_id": 1})}
+        orphaned = [analysis_id for analysis_id, oid in referenced.items() if oid and oid not in existing]
+        if orphaned:
+            result = await db.evp_analyses.delete_many({"_id": {"$in": orphaned}})
+            totals["analyses"] += result.deleted_count
+            entries = await db.search_entries.delete_many(
+                {"kind": "analysis", "source_id": {"$in": [str(i) for i in orphaned]}}
+            )
+            totals["search_entries"] += entries.deleted_count
+
+    return totals
@@ -0,0 +1,116 @@
+"""Declared Mongo indexes for every query path in server.py.
+
+``ensure_indexes`` is run at startup and is idempotent: building an index that
+already exists with the same spec is a no-op. ``index_report`` compares the
+declared set with what is actually on the server and with ``$indexStats``
+usage counters.
+"""
+import logging
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    # GET /api/sessions: sort + keyset pagination
+    "sessions": [
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id"),
+    ],
+    # GET /api/recordings/{session_id}, cascading session deletes
+    "recordings": [
+        IndexModel(
+            [("session_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="session_created_at_id",
+        ),
+    ],
+    # EMF range queries by session and time
+    "emf_buckets": [
+        IndexModel([("session_id", ASCENDING), ("t_min", ASCENDING)], name="session_t_min"),
+        IndexModel([("session_id", ASCENDING), ("t_max", DESCENDING)], name="session_t_max"),
+    ],
+    # GET /api/evp-analyses/{recording_id}
+    "evp_analyses": [
+        IndexModel([("recording_id", ASCENDING), ("created_at", DESCENDING)], name="recording_created_at"),
+    ],
+    # Status checks by user, webhook updates by PayPal subscription id
+    "subscriptions": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("paypal_subscription_id", ASCENDING)], name="paypal_subscription_id"),
+    ],
+    # Job workers claim the oldest queued (or lease-expired) job
+    "evp_jobs": [
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+    ],
+    # Webhook consumer claims by status; processed events kept 30 days for dedup
+    "webhook_events": [
+        IndexModel([("status", ASCENDING), ("received_at", ASCENDING)], name="status_received_at"),
+        IndexModel([("claimed_by", ASCENDING)], name="claimed_by", sparse=True),
+        IndexModel([("received_at", ASCENDING)], name="received_at_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+    "cleanup_jobs": [
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+    ],
+    # GET /api/search. No language: EVP phrases are mostly stop words
+    # ("get out", "help me here"), which stemming/stop lists would drop.
+    "search_entries": [
+        IndexModel(
+            [("transcription", TEXT), ("ai_analysis", TEXT)],
+            name="text",
+            weights={"transcription": 3, "ai_analysis": 1},
+            default_language="none",
+        ),
+        IndexModel([("terms", ASCENDING), ("created_at", DESCENDING)], name="terms_created_at"),
+        IndexModel([("kind", ASCENDING), ("source_id", ASCENDING)], name="kind_source_id_unique", unique=True),
+        IndexModel([("recording_id", ASCENDING)], name="recording_id"),
+    ],
+    # Persistent transcription cache tier, evicted by TTL
+    "transcription_cache": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    # AI admission token buckets (AI_RATE_LIMIT_BACKEND=mongo), dropped once idle
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+
+async def ensure_indexes(db):
+    """Build every declared index; returns a list of per-collection failures"""
+    failures = []
+    for collection_name, models in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            # e.g. duplicate user_id rows blocking the unique index; keep serving
+            logger.error("Index build failed on %s: %s", collection_name, e)
+            failures.append({"collection": collection_name, "error": str(e)})
+        except PyMongoError as e:
+            # Mongo unreachable: every other collection would fail the same way
+            logger.error("Index provisioning stopped at %s: %s", collection_name, e)
+            failures.append({"collection": collection_name, "error": str(e)})
+            break
+    return failures
+
+
+async def index_report(db):
+    """Missing, undeclared and unused indexes per collection"""
+    report = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        declared = {model.document["name"] for model in models}
+        existing = set((await collection.index_information()).keys()) - {"_id_"}
+
+        usage = {}
+        try:
+            async for stat in collection.aggregate([{"$indexStats": {}}]):
+                usage[stat["name"]] = stat["accesses"]["ops"]
+        except OperationFailure:
+            pass
+
+        report[collection_name] = {
+            "missing": sorted(declared - existing),
+            "undeclared": sorted(existing - declared),
+            "unused": sorted(name for name in existing if usage.get(name) == 0),
+        }
+    return report
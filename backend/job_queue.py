@@ -0,0 +1,257 @@
+"""Persisted background job queue backed by a Mongo collection.
+
+Jobs are documents with a ``status`` of ``queued``, ``running``, ``succeeded``
+or ``failed``. A fixed pool of worker tasks claims queued jobs atomically with
+``find_one_and_update`` and holds a lease while running, renewed every third
+of ``lease_seconds`` for as long as the handler runs. Jobs left running by a
+crashed or restarted process are picked up again once the lease expires,
+unless that was their last allowed attempt, in which case they fail.
+Jobs failing with a ``retry_on`` error are requeued with exponential backoff
+(``not_before``). ``on_finished(job)`` is awaited once a job succeeds or fails
+for good.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+class JobQueue:
+    def __init__(self, collection, handler, concurrency=2, lease_seconds=600,
+                 poll_interval=2.0, max_attempts=3, retry_on=(), retry_backoff_seconds=5.0, on_finished=None):
+        self.collection = collection
+        self.handler = handler
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_on = retry_on
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.on_finished = on_finished
+        self._workers = []
+        self._wakeup = asyncio.Event()
+        self._changed = asyncio.Condition()
+        self._stats = {
+            "started": 0,
+            "completed": 0,
+            "failed": 0,
+            "retried": 0,
+            "leases_lost": 0,
+            "wait_seconds_total": 0.0,
+            "run_seconds_total": 0.0,
+        }
+
+    async def submit(self, payload):
+        """Persist a new job and wake a worker; returns the job id"""
+        job = {
+            "status": "queued",
+            "payload": payload,
+            "attempts": 0,
+            "created_at": _now(),
+            "updated_at": _now(),
+        }
+        result = await self.collection.insert_one(job)
+        self._wakeup.set()
+        return str(result.inserted_id)
+
+    async def get(self, job_id):
+        try:
+            return await self.collection.find_one({"_id": ObjectId(job_id)})
+        except Exception:
+            return None
+
+    async def wait_for_change(self, timeout):
+        """Block until any job handled by this process changes state, or timeout"""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _fail_abandoned(self, now):
+        """Fail jobs whose lease expired on their last allowed attempt.
+
+        A job that keeps killing its worker (OOM, segfault in a decoder) would
+        otherwise be re-claimed forever.
+        """
+        while True:
+            job = await self.collection.find_one_and_update(
+                {
+                    "status": "running",
+                    "lease_expires_at": {"$lt": now.isoformat()},
+                    "attempts": {"$gte": self.max_attempts},
+                },
+                {
+                    "$set": {
+                        "status": "failed",
+                        "error": "Worker was lost while running the job",
+                        "finished_at": now.isoformat(),
+                        "updated_at": now.isoformat(),
+                    },
+                    "$unset": {"lease_expires_at": ""},
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                return
+            self._stats["failed"] += 1
+            await self._finished(job)
+            await self._notify()
+
+    async def _claim(self):
+        now = datetime.utcnow()
+        await self._fail_abandoned(now)
+        return await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    # Missing or past: a retried job waits out its backoff
+                    {"status": "queued", "not_before": {"$not": {"$gt": now.isoformat()}}},
+                    # Lease expired: the worker that held it is gone
+                    {
+                        "status": "running",
+                        "lease_expires_at": {"$lt": now.isoformat()},
+                        "attempts": {"$lt": self.max_attempts},
+                    },
+                ]
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "started_at": now.isoformat(),
+                    "updated_at": now.isoformat(),
+                    "lease_expires_at": (now + timedelta(seconds=self.lease_seconds)).isoformat(),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _finished(self, job):
+        if self.on_finished:
+            try:
+                await self.on_finished(job)
+            except Exception:
+                logger.exception("on_finished hook failed for job %s", job["_id"])
+
+    async def _finish(self, job, fields):
+        await self.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {**fields, "updated_at": _now()}, "$unset": {"lease_expires_at": ""}},
+        )
+        if fields["status"] in TERMINAL_STATUSES:
+            await self._finished({**job, **fields})
+        await self._notify()
+
+    async def _heartbeat(self, job):
+        """Extend the lease while the handler runs so no other worker re-claims the job"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            now = datetime.utcnow()
+            try:
+                result = await self.collection.update_one(
+                    {"_id": job["_id"], "status": "running", "attempts": job["attempts"]},
+                    {"$set": {
+                        "lease_expires_at": (now + timedelta(seconds=self.lease_seconds)).isoformat(),
+                        "updated_at": now.isoformat(),
+                    }},
+                )
+            except Exception:
+                logger.exception("Failed to renew the lease of job %s", job["_id"])
+                continue
+            if not result.matched_count:
+                self._stats["leases_lost"] += 1
+                logger.warning("Lost the lease of job %s; another worker may be running it", job["_id"])
+                return
+
+    async def _run_job(self, job):
+        started = time.monotonic()
+        self._stats["started"] += 1
+        self._stats["wait_seconds_total"] += (
+            datetime.fromisoformat(job["started_at"]) - datetime.fromisoformat(job["created_at"])
+        ).total_seconds()
+        await self._notify()
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await self.handler(job["payload"])
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back instead of waiting out the lease
+            await self._finish(job, {"status": "queued"})
+            raise
+        except Exception as e:
+            if isinstance(e, self.retry_on) and job["attempts"] < self.max_attempts:
+                self._stats["retried"] += 1
+                backoff = self.retry_backoff_seconds * 2 ** (job["attempts"] - 1)
+                not_before = (datetime.utcnow() + timedelta(seconds=backoff)).isoformat()
+                await self._finish(job, {"status": "queued", "error": str(e), "not_before": not_before})
+            else:
+                self._stats["failed"] += 1
+                await self._finish(job, {"status": "failed", "error": str(e), "finished_at": _now()})
+        else:
+            self._stats["completed"] += 1
+            await self._finish(job, {"status": "succeeded", "result": result, "error": None, "finished_at": _now()})
+        finally:
+            heartbeat.cancel()
+            self._stats["run_seconds_total"] += time.monotonic() - started
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception:
+                logger.exception("Failed to claim job")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Bookkeeping failed (e.g. Mongo blip); the lease will let another worker retry
+                logger.exception("Job %s failed outside its handler", job["_id"])
+
+    def start(self):
+        for _ in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def metrics(self):
+        depth = await self.collection.count_documents({"status": "queued"})
+        running = await self.collection.count_documents({"status": "running"})
+        started = self._stats["started"]
+        return {
+            "workers": len(self._workers),
+            "queue_depth": depth,
+            "running": running,
+            **self._stats,
+            "avg_wait_seconds": round(self._stats["wait_seconds_total"] / started, 3) if started else 0.0,
+            "avg_run_seconds": round(self._stats["run_seconds_total"] / started, 3) if started else 0.0,
+        }
@@ -0,0 +1,190 @@
+"""Prometheus instrumentation.
+
+- ``PrometheusMiddleware`` is a pure ASGI middleware (no per-request task or
+  body buffering) recording per-route latency, in-flight requests, status
+  codes and request/response payload bytes. Routes are labelled by their
+  path template, never the raw path, to keep label cardinality bounded.
+- ``upstream_observer`` builds the ``on_call`` hooks ``AIClient`` and
+  ``PayPalClient`` report each upstream call through.
+- ``admission_observer`` is the ``on_decision`` hook of the AI admission
+  controller.
+- ``MongoCommandMetrics`` is a pymongo command listener timing every
+  command Motor sends, labelled by collection and command.
+
+``render`` serves the registry, merging worker processes when
+``PROMETHEUS_MULTIPROC_DIR`` is set; each worker calls ``mark_process_dead``
+as it exits.
+"""
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+BYTE_BUCKETS = tuple(4 ** i for i in range(4, 14))  # 256 B .. 64 MiB
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status", ["method", "route", "status"]
+)
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to the end of the response body", ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being served", ["method", "route"],
+    multiprocess_mode="livesum",
+)
+HTTP_REQUEST_BYTES = Histogram(
+    "http_request_body_bytes", "Request body size", ["method", "route"], buckets=BYTE_BUCKETS
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    "http_response_body_bytes", "Response body size", ["method", "route"], buckets=BYTE_BUCKETS
+)
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Upstream API call time", ["service", "operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+AI_ADMISSIONS = Counter(
+    "ai_admissions_total", "AI requests admitted or rate limited", ["tier", "outcome"]
+)
+AI_ADMISSION_WAIT = Histogram(
+    "ai_admission_wait_seconds", "Time AI requests spent queued for a token", ["tier"],
+    buckets=LATENCY_BUCKETS,
+)
+MONGO_DURATION = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command time", ["collection", "command", "outcome"],
+    buckets=DB_BUCKETS,
+)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class PrometheusMiddleware:
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes  # the application's live route list
+        self._patterns = []
+
+    def _route(self, scope):
+        # Plain regex matching is much cheaper than Route.matches(), which also
+        # converts path params; rebuilt if routes were added since
+        if len(self._patterns) != len(self.routes):
+            self._patterns = [
+                (route.path_regex, getattr(route, "methods", None), route.path) for route in self.routes
+            ]
+        path = scope["path"]
+        method = scope["method"]
+        partial = None
+        for regex, methods, template in self._patterns:
+            if regex.match(path):
+                if methods is None or method in methods:
+                    return template
+                partial = partial or template
+        return partial or UNMATCHED_ROUTE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route(scope)
+        status = 500
+        request_bytes = 0
+        response_bytes = 0
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            in_flight.dec()
+            HTTP_DURATION.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            HTTP_REQUEST_BYTES.labels(method, route).observe(request_bytes)
+            HTTP_RESPONSE_BYTES.labels(method, route).observe(response_bytes)
+
+
+def upstream_observer(service):
+    """``on_call(operation, seconds, outcome)`` hook for an upstream client"""
+    def observe(operation, seconds, outcome):
+        UPSTREAM_DURATION.labels(service, operation, outcome).observe(seconds)
+    return observe
+
+
+def admission_observer(tier, outcome, waited):
+    AI_ADMISSIONS.labels(tier, outcome).inc()
+    if outcome == "admitted":
+        AI_ADMISSION_WAIT.labels(tier).observe(waited)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times Motor's commands; register via ``event_listeners`` on the client"""
+
+    # Connection handshakes and session bookkeeping, not application queries
+    IGNORED = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions", "buildInfo"}
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        if event.command_name in self.IGNORED:
+            return
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        self._collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def _finish(self, event, outcome):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            MONGO_DURATION.labels(collection, event.command_name, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+def mark_process_dead():
+    """On worker shutdown: drop this process's live gauges from the merged view"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def render():
+    """(body, content type) for the /metrics endpoint"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
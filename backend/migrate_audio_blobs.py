@@ -0,0 +1,55 @@
+"""Move inline audio_base64 payloads from recordings into the blob store.
+
+Run once after deploying the blob store:
+
+    python migrate_audio_blobs.py
+"""
+import asyncio
+import base64
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from blob_store import create_blob_store
+
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+
+
+async def migrate():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client.ghost_hunting
+    blob_store = create_blob_store(db)
+
+    migrated = 0
+    # Only pull ids first so we never hold more than one recording's audio at a time
+    ids = [doc["_id"] async for doc in db.recordings.find({"audio_base64": {"$exists": True}}, {"_id": 1})]
+    for recording_id in ids:
+        recording = await db.recordings.find_one({"_id": recording_id}, {"audio_base64": 1})
+        if not recording or "audio_base64" not in recording:
+            continue
+
+        audio_bytes = base64.b64decode(recording["audio_base64"])
+        blob_id, size = await blob_store.put_bytes(audio_bytes, "recording.m4a", "audio/mp4")
+        await db.recordings.update_one(
+            {"_id": recording_id},
+            {
+                "$set": {
+                    "audio_blob_id": blob_id,
+                    "audio_size": size,
+                    "audio_content_type": "audio/mp4",
+                    "audio_filename": "recording.m4a"
+                },
+                "$unset": {"audio_base64": ""}
+            }
+        )
+        migrated += 1
+
+    print(f"✅ Migrated {migrated} recordings to the blob store")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,122 @@
+"""Async PayPal REST client.
+
+A single pooled ``httpx.AsyncClient`` keeps TLS connections to PayPal alive
+between requests, and the OAuth access token is cached until shortly before
+it expires instead of being fetched again for every call. Concurrent callers
+that find the token stale share one refresh. The HTTP client is created on
+first use in each process, never inherited across a fork.
+"""
+import asyncio
+import os
+import time
+
+import httpx
+
+# Path segments kept as-is in call metrics; anything else is an id
+STATIC_SEGMENTS = {"v1", "oauth2", "token", "billing", "subscriptions", "plans", "cancel", "suspend", "activate"}
+
+
+def operation_name(method, path):
+    """Low-cardinality metrics label, e.g. POST /v1/billing/subscriptions/{id}/cancel"""
+    segments = [segment if segment in STATIC_SEGMENTS or not segment else "{id}" for segment in path.split("/")]
+    return f"{method} {'/'.join(segments)}"
+
+
+class PayPalClient:
+    def __init__(self, client_id, secret, base_url, refresh_margin=300, timeout=15.0,
+                 max_connections=20, max_keepalive_connections=10, on_call=None):
+        self.client_id = client_id
+        self.secret = secret
+        self.base_url = base_url
+        self.refresh_margin = refresh_margin
+        # on_call(operation, seconds, outcome) is told about every HTTP call
+        self.on_call = on_call
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=60.0,
+        )
+        self._timeout = timeout
+        self._http = None
+        self._http_pid = None
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+
+    @property
+    def http(self):
+        if self._http is None or self._http_pid != os.getpid():
+            self._http = httpx.AsyncClient(base_url=self.base_url, timeout=self._timeout, limits=self._limits)
+            self._http_pid = os.getpid()
+        return self._http
+
+    async def _send(self, method, path, **kwargs):
+        started_at = time.monotonic()
+        outcome = "error"
+        try:
+            response = await self.http.request(method, path, **kwargs)
+            outcome = str(response.status_code)
+            return response
+        finally:
+            if self.on_call:
+                self.on_call(operation_name(method, path), time.monotonic() - started_at, outcome)
+
+    def _token_is_fresh(self):
+        return self._token is not None and time.monotonic() < self._token_expires_at - self.refresh_margin
+
+    def invalidate_token(self):
+        self._token = None
+        self._token_expires_at = 0.0
+
+    async def get_access_token(self):
+        """Get a cached PayPal access token, refreshing it if close to expiry"""
+        if self._token_is_fresh():
+            return self._token
+
+        async with self._token_lock:
+            # Another caller may have refreshed while we waited for the lock
+            if self._token_is_fresh():
+                return self._token
+
+            response = await self._send(
+                "POST",
+                "/v1/oauth2/token",
+                headers={
+                    "Accept": "application/json",
+                    "Accept-Language": "en_US",
+                },
+                data={"grant_type": "client_credentials"},
+                auth=(self.client_id, self.secret),
+            )
+            if response.status_code != 200:
+                return None
+
+            payload = response.json()
+            self._token = payload["access_token"]
+            self._token_expires_at = time.monotonic() + float(payload.get("expires_in", 0))
+            return self._token
+
+    async def request(self, method, path, headers=None, **kwargs):
+        """Send an authenticated request. Returns None if authentication fails."""
+        for attempt in range(2):
+            access_token = await self.get_access_token()
+            if not access_token:
+                return None
+
+            request_headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {access_token}",
+                **(headers or {}),
+            }
+            response = await self._send(method, path, headers=request_headers, **kwargs)
+
+            # Token revoked or rotated server-side: drop it and retry once
+            if response.status_code == 401 and attempt == 0:
+                self.invalidate_token()
+                continue
+            return response
+
+    async def close(self):
+        if self._http is not None and self._http_pid == os.getpid():
+            await self._http.aclose()
+        self._http = None
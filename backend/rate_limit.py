@@ -0,0 +1,189 @@
+"""Token-bucket admission control for the AI endpoints.
+
+Every AI request takes a token from its user's bucket (sized by subscription
+tier) and then from one global bucket sized to the upstream quota. A request
+that finds either bucket empty is rejected with the time until a token will
+be available or, when the caller asked to queue, waits up to
+``max_wait_seconds`` for it.
+
+Bucket stores:
+
+- ``MemoryBucketStore``: in-process only (single worker, tests)
+- ``MongoBucketStore``: one atomic ``find_one_and_update`` per take, shared by
+  every worker and host
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+GLOBAL_KEY = "global"
+
+
+class RateLimited(Exception):
+    """Raised when a request is not admitted"""
+
+    def __init__(self, scope, retry_after):
+        super().__init__(f"AI rate limit exceeded ({scope}), retry in {retry_after:.1f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class BucketLimit:
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60.0  # tokens per second
+        self.capacity = float(burst)
+
+    @classmethod
+    def parse(cls, spec):
+        """From "<per_minute>/<burst>", e.g. "30/10\""""
+        per_minute, _, burst = spec.partition("/")
+        return cls(float(per_minute), float(burst or per_minute))
+
+    def describe(self):
+        return {"per_minute": round(self.rate * 60, 3), "burst": self.capacity}
+
+
+class MemoryBucketStore:
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at, limit), least recently used first
+
+    async def take(self, key, limit, cost=1.0):
+        """Take ``cost`` tokens; returns seconds until they'd be available (0 if taken)"""
+        now = time.monotonic()
+        tokens, updated_at, _ = self._buckets.get(key, (limit.capacity, now, limit))
+        tokens = min(limit.capacity, tokens + (now - updated_at) * limit.rate)
+        if tokens >= cost:
+            self._buckets[key] = (tokens - cost, now, limit)
+            wait = 0.0
+        else:
+            self._buckets[key] = (tokens, now, limit)
+            wait = (cost - tokens) / limit.rate
+        self._buckets.move_to_end(key)
+        self._evict()
+        return wait
+
+    def _evict(self):
+        # The longest idle buckets have refilled the most, so forgetting them
+        # (they restart full) loses the least; the global bucket is never forgotten
+        while len(self._buckets) > self.max_entries:
+            key = next(iter(self._buckets))
+            if key == GLOBAL_KEY:
+                self._buckets.move_to_end(key)
+                key = next(iter(self._buckets))
+            del self._buckets[key]
+
+    async def refund(self, key, limit, amount=1.0):
+        """Give back tokens taken for a request that was not admitted after all"""
+        if key in self._buckets:
+            tokens, updated_at, _ = self._buckets[key]
+            self._buckets[key] = (min(limit.capacity, tokens + amount), updated_at, limit)
+
+
+class MongoBucketStore:
+    """Buckets as documents updated atomically with a pipeline update"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def take(self, key, limit, cost=1.0):
+        now = time.time()
+        elapsed = {"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}]}
+        refilled = {"$min": [
+            limit.capacity,
+            {"$add": [{"$ifNull": ["$tokens", limit.capacity]}, {"$multiply": [elapsed, limit.rate]}]},
+        ]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {"granted": {"$gte": ["$tokens", cost]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$granted", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    # Idle buckets are full again by then; TTL-deleted
+                    "expires_at": datetime.utcnow() + timedelta(seconds=limit.capacity / limit.rate + 60),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["granted"]:
+            return 0.0
+        return (cost - bucket["tokens"]) / limit.rate
+
+    async def refund(self, key, limit, amount=1.0):
+        await self.collection.update_one(
+            {"_id": key},
+            [{"$set": {"tokens": {"$min": [limit.capacity, {"$add": ["$tokens", amount]}]}}}],
+        )
+
+
+class AdmissionController:
+    def __init__(self, store, tiers, global_limit, max_wait_seconds=0.0, on_decision=None):
+        self.store = store
+        self.tiers = tiers  # tier name -> BucketLimit
+        self.global_limit = global_limit
+        self.max_wait_seconds = max_wait_seconds
+        self.on_decision = on_decision  # (tier, outcome, seconds waited)
+        self._stats = {"admitted": 0, "rejected_user": 0, "rejected_global": 0, "queued": 0, "wait_seconds_total": 0.0}
+
+    async def _take(self, user_key, tier, cost):
+        """Returns (scope, seconds to wait), scope None once admitted"""
+        limit = self.tiers[tier]
+        wait = await self.store.take(f"user:{user_key}", limit, cost)
+        if wait:
+            return "user", wait
+        wait = await self.store.take(GLOBAL_KEY, self.global_limit, cost)
+        if wait:
+            # Not admitted: the user's tokens must not drain while it waits on others
+            await self.store.refund(f"user:{user_key}", limit, cost)
+            return "global", wait
+        return None, 0.0
+
+    def _decided(self, tier, outcome, waited):
+        self._stats[outcome] += 1
+        if self.on_decision:
+            self.on_decision(tier, outcome, waited)
+
+    async def admit(self, user_key, tier, cost=1.0, queue=False):
+        """Admit one request (``cost`` tokens) or raise ``RateLimited``"""
+        if cost > min(self.tiers[tier].capacity, self.global_limit.capacity):
+            # Could never be admitted, however long the caller waits
+            raise ValueError(f"Cost {cost} exceeds the {tier} burst size")
+        started = time.monotonic()
+        deadline = started + (self.max_wait_seconds if queue else 0.0)
+        queued = False
+        while True:
+            scope, wait = await self._take(user_key, tier, cost)
+            if scope is None:
+                self._decided(tier, "admitted", time.monotonic() - started)
+                return
+            if wait > deadline - time.monotonic():
+                self._decided(tier, f"rejected_{scope}", time.monotonic() - started)
+                raise RateLimited(scope, wait)
+            if not queued:
+                queued = True
+                self._stats["queued"] += 1
+            self._stats["wait_seconds_total"] += wait
+            await asyncio.sleep(wait)
+
+    def stats(self):
+        return {
+            **self._stats,
+            "max_wait_seconds": self.max_wait_seconds,
+            "tiers": {name: limit.describe() for name, limit in self.tiers.items()},
+            "global": self.global_limit.describe(),
+        }
+
+
+def create_admission_controller(db, backend, tiers, global_limit, **kwargs):
+    if backend == "mongo":
+        store = MongoBucketStore(db.rate_limits)
+    elif backend == "memory":
+        store = MemoryBucketStore()
+    else:
+        raise ValueError(f"Unknown AI_RATE_LIMIT_BACKEND: {backend}")
+    return AdmissionController(store, tiers, global_limit, **kwargs)
@@ -0,0 +1,34 @@
+"""Backfill search_entries from existing recordings and EVP analyses.
+
+Run once after deploying search (and any time the index needs repairing):
+
+    python rebuild_search_index.py
+"""
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from indexes import ensure_indexes
+from search import SearchIndex
+
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+
+
+async def rebuild():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client.ghost_hunting
+    await ensure_indexes(db)
+
+    search_index = SearchIndex(db.search_entries, db.recordings, db.sessions, db.evp_analyses)
+    counts = await search_index.rebuild()
+
+    print(f"✅ Indexed {counts['recordings']} recordings and {counts['analyses']} analyses for search")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(rebuild())
@@ -0,0 +1,233 @@
+"""Full-text search over what was said in recordings and EVP analyses.
+
+Searchable text is denormalized into ``search_entries``: one document per
+recording transcription and per EVP analysis, carrying its recording and
+session ids. The collection has a Mongo text index for ranked word and
+phrase matching, and a multikey ``terms`` index (the distinct lowercased
+words) for prefix matching, so a query is a single indexed ``find`` no
+matter how many transcripts there are. Entries are written when recordings
+and analyses are inserted; ``SearchIndex.rebuild`` backfills existing data.
+
+Query syntax: plain words are matched any-of and ranked by relevance,
+``"quoted phrases"`` must appear verbatim, and ``word*`` requires a word
+starting with that prefix.
+"""
+import re
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+
+WORD = re.compile(r"\w+(?:'\w+)*")
+PHRASE = re.compile(r'"([^"]*)"')
+MIN_PREFIX_LENGTH = 2
+MAX_QUERY_TERMS = 16
+SNIPPET_CHARS = 80
+
+
+class SearchQueryError(ValueError):
+    """Raised for empty or unusable search queries"""
+
+
+def tokenize(text):
+    return [word.lower() for word in WORD.findall(text or "")]
+
+
+def parse_query(query):
+    """Split a query into (phrases, words, prefixes)"""
+    phrases = [" ".join(tokenize(phrase)) for phrase in PHRASE.findall(query)]
+    phrases = [phrase for phrase in phrases if phrase]
+    rest = PHRASE.sub(" ", query)
+
+    words, prefixes = [], []
+    for raw in rest.split():
+        tokens = tokenize(raw)
+        if not tokens:
+            continue
+        if raw.endswith("*") and len(tokens) == 1:
+            if len(tokens[0]) < MIN_PREFIX_LENGTH:
+                raise SearchQueryError(f"Prefixes need at least {MIN_PREFIX_LENGTH} characters")
+            prefixes.append(tokens[0])
+        else:
+            words.extend(tokens)
+
+    if not (phrases or words or prefixes):
+        raise SearchQueryError("Search query is empty")
+    if len(phrases) + len(words) + len(prefixes) > MAX_QUERY_TERMS:
+        raise SearchQueryError(f"Search queries are limited to {MAX_QUERY_TERMS} terms")
+    return phrases, words, prefixes
+
+
+def build_filter(phrases, words, prefixes):
+    """Mongo filter for a parsed query; returns (filter, ranked)"""
+    query = {}
+    if phrases or words:
+        query["$text"] = {"$search": " ".join([f'"{phrase}"' for phrase in phrases] + words)}
+    if prefixes:
+        query["$and"] = [{"terms": {"$regex": "^" + re.escape(prefix)}} for prefix in prefixes]
+    return query, bool(phrases or words)
+
+
+def snippet(text, needles):
+    """Short excerpt of ``text`` around the first of ``needles`` found"""
+    if not text:
+        return ""
+    lowered = text.lower()
+    positions = [lowered.find(needle) for needle in needles]
+    positions = [position for position in positions if position >= 0]
+    start = max(min(positions) - SNIPPET_CHARS // 2, 0) if positions else 0
+    excerpt = text[start:start + SNIPPET_CHARS].strip()
+    if start > 0:
+        excerpt = "…" + excerpt
+    if start + SNIPPET_CHARS < len(text):
+        excerpt += "…"
+    return excerpt
+
+
+def _object_id(value):
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
+def recording_entry(recording):
+    return {
+        "kind": "recording",
+        "source_id": str(recording["_id"]),
+        "recording_id": str(recording["_id"]),
+        "session_id": recording.get("session_id"),
+        "recording_type": recording.get("type"),
+        "transcription": recording.get("transcription") or "",
+        "terms": sorted(set(tokenize(recording.get("transcription")))),
+        "created_at": recording.get("created_at"),
+    }
+
+
+def analysis_entry(analysis, recording=None):
+    text = f"{analysis.get('transcription') or ''} {analysis.get('ai_analysis') or ''}"
+    return {
+        "kind": "analysis",
+        "source_id": str(analysis["_id"]),
+        "recording_id": analysis.get("recording_id"),
+        # Analyses of client-side clips have no stored recording
+        "session_id": recording.get("session_id") if recording else None,
+        "recording_type": recording.get("type") if recording else None,
+        "transcription": analysis.get("transcription") or "",
+        "ai_analysis": analysis.get("ai_analysis") or "",
+        "terms": sorted(set(tokenize(text))),
+        "created_at": analysis.get("created_at"),
+    }
+
+
+def _upsert(entry):
+    return UpdateOne(
+        {"kind": entry["kind"], "source_id": entry["source_id"]}, {"$set": entry}, upsert=True
+    )
+
+
+class SearchIndex:
+    def __init__(self, entries, recordings, sessions, evp_analyses):
+        self.entries = entries
+        self.recordings = recordings
+        self.sessions = sessions
+        self.evp_analyses = evp_analyses
+
+    async def index_recording(self, recording):
+        """Index a stored recording's transcription, if it has one"""
+        if recording.get("transcription"):
+            await self.entries.bulk_write([_upsert(recording_entry(recording))])
+
+    async def index_analyses(self, analyses):
+        """Index stored EVP analyses (documents with their `_id`)"""
+        if not analyses:
+            return
+        recording_ids = {_object_id(analysis.get("recording_id")) for analysis in analyses} - {None}
+        recordings = {}
+        if recording_ids:
+            async for recording in self.recordings.find(
+                {"_id": {"$in": list(recording_ids)}}, {"session_id": 1, "type": 1}
+            ):
+                recordings[str(recording["_id"])] = recording
+        await self.entries.bulk_write(
+            [_upsert(analysis_entry(analysis, recordings.get(analysis.get("recording_id")))) for analysis in analyses],
+            ordered=False,
+        )
+
+    async def search(self, query, limit=20, offset=0):
+        """Ranked matches with session context; returns (results, has_more)"""
+        phrases, words, prefixes = parse_query(query)
+        mongo_filter, ranked = build_filter(phrases, words, prefixes)
+
+        projection = {"terms": 0}
+        if ranked:
+            projection["score"] = {"$meta": "textScore"}
+            sort = [("score", {"$meta": "textScore"}), ("created_at", -1)]
+        else:
+            sort = [("created_at", -1)]
+        docs = await self.entries.find(mongo_filter, projection).sort(sort).skip(offset).limit(limit + 1).to_list(
+            length=limit + 1
+        )
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+
+        session_ids = {_object_id(doc.get("session_id")) for doc in docs} - {None}
+        sessions = {}
+        if session_ids:
+            async for session in self.sessions.find(
+                {"_id": {"$in": list(session_ids)}}, {"name": 1, "location": 1, "date": 1}
+            ):
+                session["id"] = str(session.pop("_id"))
+                sessions[session["id"]] = session
+
+        needles = phrases + words + prefixes
+        results = []
+        for doc in docs:
+            # Excerpt whichever field matched, preferring what was said
+            text = next(
+                (doc[field] for field in ("transcription", "ai_analysis")
+                 if any(needle in (doc.get(field) or "").lower() for needle in needles)),
+                doc.get("transcription") or doc.get("ai_analysis") or "",
+            )
+            results.append({
+                "id": doc["source_id"],
+                "kind": doc["kind"],
+                "recording_id": doc.get("recording_id"),
+                "recording_type": doc.get("recording_type"),
+                "session": sessions.get(doc.get("session_id")),
+                "score": round(doc["score"], 4) if ranked else None,
+                "snippet": snippet(text, needles),
+                "transcription": doc.get("transcription", ""),
+                "created_at": doc.get("created_at"),
+            })
+        return results, has_more
+
+    async def rebuild(self, batch_size=500):
+        """Index every existing transcription and analysis; returns counts"""
+        counts = {"recordings": 0, "analyses": 0}
+        batch = []
+        async for recording in self.recordings.find(
+            {"transcription": {"$nin": [None, ""]}}, {"session_id": 1, "type": 1, "transcription": 1, "created_at": 1}
+        ):
+            batch.append(_upsert(recording_entry(recording)))
+            if len(batch) >= batch_size:
+                await self.entries.bulk_write(batch, ordered=False)
+                counts["recordings"] += len(batch)
+                batch = []
+        if batch:
+            await self.entries.bulk_write(batch, ordered=False)
+            counts["recordings"] += len(batch)
+
+        batch = []
+        async for analysis in self.evp_analyses.find(
+            {}, {"recording_id": 1, "transcription": 1, "ai_analysis": 1, "created_at": 1}
+        ):
+            batch.append(analysis)
+            if len(batch) >= batch_size:
+                await self.index_analyses(batch)
+                counts["analyses"] += len(batch)
+                batch = []
+        if batch:
+            await self.index_analyses(batch)
+            counts["analyses"] += len(batch)
+        return counts
@@ -0,0 +1,88 @@
+"""Production entry point: the API under N uvicorn worker processes.
+
+Workers are spawned, not forked, so each imports ``server`` itself and builds
+its own Motor, AI and PayPal clients. Per-worker settings are derived before
+spawning:
+
+- Mongo pools: ``MONGO_POOL_BUDGET`` connections (what the deployment may
+  hold open against the cluster) are split evenly, so adding workers never
+  multiplies the connection count.
+- State shared between workers: subscription cache invalidation and AI rate
+  limit buckets default to their Mongo backends, and Prometheus metrics are
+  aggregated through a multiprocess directory.
+
+Anything already set in the environment wins.
+
+    python serve.py --workers 8 --port 8001
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+
+def configure(workers, pool_budget):
+    """Environment for the worker processes"""
+    per_worker = max(pool_budget // workers, 2)
+    os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(per_worker))
+    # Keep a few warm connections so the first requests after idle skip the handshake
+    os.environ.setdefault("MONGO_MIN_POOL_SIZE", str(min(4, per_worker // 4)))
+    if workers > 1:
+        os.environ.setdefault("SUBSCRIPTION_CACHE_CHANNEL", "mongo")
+        os.environ.setdefault("AI_RATE_LIMIT_BACKEND", "mongo")
+
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not multiproc_dir:
+        multiproc_dir = tempfile.mkdtemp(prefix="ghost-hunting-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = multiproc_dir
+    else:
+        # Counters left over from a previous run would be merged into this one.
+        # The directory is the operator's: remove only the metric files in it.
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(multiproc_dir, "*.db")):
+            os.remove(stale)
+    return multiproc_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument(
+        "--mongo-pool-budget", type=int, default=int(os.getenv("MONGO_POOL_BUDGET", "200")),
+        help="Mongo connections across all workers",
+    )
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument(
+        "--graceful-shutdown", type=int, default=int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30")),
+        help="seconds in-flight requests get to finish on shutdown",
+    )
+    args = parser.parse_args()
+
+    workers = max(args.workers, 1)
+    created_multiproc_dir = not os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    multiproc_dir = configure(workers, args.mongo_pool_budget)
+    try:
+        uvicorn.run(
+            "server:app",
+            host=args.host,
+            port=args.port,
+            workers=workers,
+            log_level=args.log_level,
+            proxy_headers=True,
+            forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+            timeout_graceful_shutdown=args.graceful_shutdown,
+            app_dir=os.path.dirname(os.path.abspath(__file__)),
+        )
+    finally:
+        # Only a directory made above; never one from the environment
+        if created_multiproc_dir:
+            shutil.rmtree(multiproc_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,78 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import Depends, FastAPI, File, Form, Header, Query, Request, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
+from contextlib import asynccontextmanager
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+import asyncio
 import base64
-import openai
+import json
+import logging
+import math
+import numpy as np
+import orjson
 from bson import ObjectId
-import io
-import requests
+from pymongo.errors import DuplicateKeyError
+
+from ai_client import AIClient, AIBusyError, AITimeoutError
+from paypal_client import PayPalClient
+from blob_store import CHUNK_SIZE, BlobNotFound, create_blob_store
+from indexes import ensure_indexes, index_report
+from transcription_cache import TranscriptionCache, transcription_key
+from job_queue import JobQueue, TERMINAL_STATUSES
+from audio_codec import FFMPEG, AudioDecodeError, NormalizationStats, decode_pcm, encode_wav, normalize_for_transcription
+from acoustic import analyze_signal
+from subscription_cache import create_subscription_cache
+from webhook_queue import WebhookQueue
+from cleanup import cascade_delete_session, sweep_orphans
+from streaming import SilenceSegmenter
+from chunking import plan_chunks, stitch_segments
+from vad import build_trimmed_clip, detect_voiced_regions, map_to_original
+from zip_stream import ZipStream
+from search import SearchIndex, SearchQueryError
+from metrics import MongoCommandMetrics, PrometheusMiddleware, admission_observer, mark_process_dead, render as render_metrics, upstream_observer
+from rate_limit import BucketLimit, RateLimited, create_admission_controller
+from telemetry import BUCKET_MS, TelemetryError, bucket_updates, channel_values, decode_batch, downsample, downsample_summaries, unpack_buckets
 
 load_dotenv()
 
-app = FastAPI(title="Ghost Hunting API")
+@asynccontextmanager
+async def lifespan(app):
+    """Per-worker startup and shutdown.
+
+    Nothing below opens a connection at import time: Motor connects on its
+    first command and the AI and PayPal clients are created on first use, so
+    each worker process builds its own after it has started.
+    """
+    if not FFMPEG:
+        logger.warning(
+            "ffmpeg not found: non-WAV uploads (phone m4a) get no acoustic scoring, "
+            "VAD trimming, normalization or chunked transcription"
+        )
+    # In the background: an unreachable Mongo must not keep the API from starting
+    index_build = asyncio.create_task(ensure_indexes(db))
+    await subscription_cache.channel.start()  # also connects in the background
+    evp_jobs.start()
+    cleanup_jobs.start()
+    webhook_queue.start()
+    try:
+        yield
+    finally:
+        index_build.cancel()
+        await evp_jobs.stop()
+        await cleanup_jobs.stop()
+        await webhook_queue.stop()
+        await subscription_cache.channel.stop()
+        await ai_client.close()
+        await paypal_client.close()
+        client.close()
+        mark_process_dead()
+
+app = FastAPI(title="Ghost Hunting API", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -25,38 +83,230 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Prometheus: per-route latency, in-flight and payload sizes (served at /metrics)
+app.add_middleware(PrometheusMiddleware, routes=app.routes)
+
 # MongoDB
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-client = AsyncIOMotorClient(MONGO_URL)
+# Pool limits are per worker process; serve.py divides MONGO_POOL_BUDGET among them
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+    minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+    maxIdleTimeMS=int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000")),
+    waitQueueTimeoutMS=int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+    event_listeners=[MongoCommandMetrics()],
+)
 db = client.ghost_hunting
 
+logger = logging.getLogger(__name__)
+
+# Recording audio lives in the blob store, not in the recordings documents
+blob_store = create_blob_store(db)
+
+# Transcriptions and analyses are copied into search_entries as they are stored
+search_index = SearchIndex(db.search_entries, db.recordings, db.sessions, db.evp_analyses)
+
+async def index_for_search(index_call, *args):
+    """Best-effort search indexing; the stored document is already committed"""
+    try:
+        await index_call(*args)
+    except Exception:
+        logger.exception("Search indexing failed; run rebuild_search_index.py to backfill")
+
 # OpenAI with Emergent LLM Key
 EMERGENT_LLM_KEY = os.getenv("EMERGENT_LLM_KEY", "sk-emergent-9Cc27A503E11d92298")
-openai_client = openai.OpenAI(api_key=EMERGENT_LLM_KEY)
+ai_client = AIClient(
+    api_key=EMERGENT_LLM_KEY,
+    max_concurrency=int(os.getenv("AI_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("AI_MAX_QUEUE", "32")),
+    timeout=float(os.getenv("AI_TIMEOUT_SECONDS", "60")),
+    on_call=upstream_observer("openai"),
+)
+transcription_cache = TranscriptionCache(
+    db.transcription_cache,
+    max_entries=int(os.getenv("TRANSCRIPTION_CACHE_SIZE", "1024")),
+    ttl_seconds=int(os.getenv("TRANSCRIPTION_CACHE_TTL_SECONDS", str(30 * 24 * 3600))),
+)
+
+# Uploads are downmixed/resampled/re-encoded before going to Whisper
+AUDIO_NORMALIZE = os.getenv("AUDIO_NORMALIZE", "1") == "1"
+AUDIO_NORMALIZE_BITRATE = os.getenv("AUDIO_NORMALIZE_BITRATE", "24k")
+normalization_stats = NormalizationStats()
+
+async def transcribe_upstream(audio_bytes, filename, timestamps=False):
+    if AUDIO_NORMALIZE:
+        audio_bytes, filename = await normalize_for_transcription(
+            audio_bytes, filename, stats=normalization_stats, bitrate=AUDIO_NORMALIZE_BITRATE
+        )
+    if timestamps:
+        # Cached as JSON text alongside plain transcriptions
+        return json.dumps(await ai_client.transcribe_segments(audio_bytes, filename=filename))
+    return await ai_client.transcribe(audio_bytes, filename=filename)
+
+async def transcribe_cached(audio_bytes, filename, timestamps=False):
+    """Whisper transcription deduplicated by audio content.
+
+    Returns the text, or a list of {start, end, text} segments with `timestamps`.
+    """
+    # Keyed on the original bytes so cache hits skip normalization too
+    key = transcription_key(
+        audio_bytes, model="whisper-1", response_format="verbose_json" if timestamps else "text"
+    )
+    result = await transcription_cache.get_or_transcribe(
+        key, lambda: transcribe_upstream(audio_bytes, filename, timestamps)
+    )
+    return json.loads(result) if timestamps else result
+
+async def decode_clip(audio_bytes):
+    """16 kHz mono PCM of a clip, or None if it can't be decoded"""
+    try:
+        return await decode_pcm(audio_bytes, sample_rate=16000)
+    except AudioDecodeError:
+        return None
+
+# Long recordings are split on pauses and the chunks transcribed in parallel
+LONG_AUDIO_SECONDS = float(os.getenv("LONG_AUDIO_SECONDS", "180"))
+LONG_AUDIO_CHUNK_SECONDS = float(os.getenv("LONG_AUDIO_CHUNK_SECONDS", "120"))
+LONG_AUDIO_OVERLAP_SECONDS = float(os.getenv("LONG_AUDIO_OVERLAP_SECONDS", "2"))
+LONG_AUDIO_CONCURRENCY = int(os.getenv("LONG_AUDIO_CONCURRENCY", "4"))
+# Whisper rejects uploads above 25 MB; anything bigger must be chunked
+WHISPER_MAX_BYTES = 25 * 1024 * 1024
+
+async def transcribe_chunked(samples):
+    """Timestamped transcription of 16 kHz PCM via overlapping parallel chunks"""
+    chunks = await asyncio.to_thread(
+        plan_chunks, samples, 16000, LONG_AUDIO_CHUNK_SECONDS, LONG_AUDIO_OVERLAP_SECONDS
+    )
+    semaphore = asyncio.Semaphore(LONG_AUDIO_CONCURRENCY)
+
+    async def transcribe_chunk(start, end):
+        async with semaphore:
+            wav_bytes = await asyncio.to_thread(encode_wav, samples[start:end], 16000)
+            return await transcribe_cached(wav_bytes, "chunk.wav", timestamps=True)
+
+    tasks = [asyncio.create_task(transcribe_chunk(start, end)) for start, end, _, _ in chunks]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return stitch_segments(chunks, results, 16000)
+
+async def transcribe_pcm(samples, filename="audio.wav"):
+    """Timestamped transcription of 16 kHz PCM, chunked when it is long"""
+    if len(samples) > LONG_AUDIO_SECONDS * 16000:
+        return await transcribe_chunked(samples)
+    wav_bytes = await asyncio.to_thread(encode_wav, samples, 16000)
+    return await transcribe_cached(wav_bytes, filename, timestamps=True)
+
+def join_segments(segments):
+    return " ".join(segment["text"].strip() for segment in segments if segment["text"].strip())
 
 # PayPal configuration
 PAYPAL_CLIENT_ID = os.getenv("PAYPAL_CLIENT_ID", "")
 PAYPAL_SECRET = os.getenv("PAYPAL_SECRET", "")
 PAYPAL_PLAN_ID = os.getenv("PAYPAL_PLAN_ID", "")
 PAYPAL_MODE = os.getenv("PAYPAL_MODE", "sandbox")  # sandbox or live
-PAYPAL_BASE_URL = f"https://api-m.{PAYPAL_MODE}.paypal.com" if PAYPAL_MODE == "sandbox" else "https://api-m.paypal.com"
+PAYPAL_BASE_URL = os.getenv("PAYPAL_BASE_URL") or (
+    f"https://api-m.{PAYPAL_MODE}.paypal.com" if PAYPAL_MODE == "sandbox" else "https://api-m.paypal.com"
+)  # PAYPAL_BASE_URL overrides the API host, e.g. for the benchmark stand-in
 
-def get_paypal_access_token():
-    """Get PayPal access token"""
-    url = f"{PAYPAL_BASE_URL}/v1/oauth2/token"
-    headers = {
-        "Accept": "application/json",
-        "Accept-Language": "en_US",
-    }
-    data = {
-        "grant_type": "client_credentials"
-    }
-    
-    response = requests.post(url, headers=headers, data=data, auth=(PAYPAL_CLIENT_ID, PAYPAL_SECRET))
-    
-    if response.status_code == 200:
-        return response.json()["access_token"]
-    return None
+paypal_client = PayPalClient(
+    client_id=PAYPAL_CLIENT_ID,
+    secret=PAYPAL_SECRET,
+    base_url=PAYPAL_BASE_URL,
+    refresh_margin=int(os.getenv("PAYPAL_TOKEN_REFRESH_MARGIN", "300")),
+    on_call=upstream_observer("paypal"),
+)
+
+# Subscription status is cached per user; every write below must invalidate it
+subscription_cache = create_subscription_cache(
+    db,
+    os.getenv("SUBSCRIPTION_CACHE_CHANNEL", "local"),
+    ttl_seconds=int(os.getenv("SUBSCRIPTION_CACHE_TTL_SECONDS", "60")),
+    negative_ttl_seconds=int(os.getenv("SUBSCRIPTION_CACHE_NEGATIVE_TTL_SECONDS", "30")),
+)
+
+webhook_queue = WebhookQueue(
+    db.webhook_events,
+    db.subscriptions,
+    on_applied=subscription_cache.invalidate,
+    batch_size=int(os.getenv("WEBHOOK_BATCH_SIZE", "500")),
+)
+
+async def lookup_subscription_status(user_id):
+    """Subscription status for a user, through the cache"""
+    cached = subscription_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    generation = subscription_cache.generation()
+    subscription = await db.subscriptions.find_one({"user_id": user_id})
+
+    if not subscription:
+        status = {
+            "is_subscribed": False,
+            "status": "inactive"
+        }
+    else:
+        # Check if subscription is active
+        status = {
+            "is_subscribed": subscription.get("status") == "active",
+            "status": subscription.get("status", "inactive"),
+            "subscription_id": subscription.get("paypal_subscription_id")
+        }
+
+    subscription_cache.set(user_id, status, generation)
+    return status
+
+# AI admission control: a token bucket per user sized by subscription tier, and
+# a global one sized to the upstream quota. Limits are "<per minute>/<burst>";
+# use the mongo backend when running more than one worker. Off by default:
+# callers without a user_id are keyed by client address, which behind a proxy
+# is the proxy's unless FORWARDED_ALLOW_IPS trusts it (see serve.py).
+AI_RATE_LIMIT = os.getenv("AI_RATE_LIMIT", "0") == "1"
+
+ai_admission = create_admission_controller(
+    db,
+    os.getenv("AI_RATE_LIMIT_BACKEND", "memory"),
+    tiers={
+        "free": BucketLimit.parse(os.getenv("AI_RATE_LIMIT_FREE", "6/3")),
+        "subscriber": BucketLimit.parse(os.getenv("AI_RATE_LIMIT_SUBSCRIBER", "30/10")),
+    },
+    global_limit=BucketLimit.parse(os.getenv("AI_RATE_LIMIT_GLOBAL", "120/40")),
+    max_wait_seconds=float(os.getenv("AI_RATE_LIMIT_MAX_WAIT_SECONDS", "10")),
+    on_decision=admission_observer,
+)
+
+async def admit_ai_call(user_id, client, queue=False):
+    """Take an AI token for one upstream call or raise RateLimited.
+
+    Only a user_id with an active subscription gets its own bucket; anything
+    else is client-supplied and unverified, so it shares the free tier per
+    client address (a fresh random user_id must not mean a fresh bucket).
+    """
+    if not AI_RATE_LIMIT:
+        return
+    if user_id and (await lookup_subscription_status(user_id))["is_subscribed"]:
+        await ai_admission.admit(user_id, "subscriber", queue=queue)
+        return
+    await ai_admission.admit(f"ip:{client.host if client else 'unknown'}", "free", queue=queue)
+
+def rate_limited_error(e):
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+async def require_ai_admission(request: Request, user_id: Optional[str] = None, queue: bool = False):
+    """Route dependency: `queue` waits for a token instead of failing fast"""
+    try:
+        await admit_ai_call(user_id, request.client, queue=queue)
+    except RateLimited as e:
+        raise rate_limited_error(e)
 
 # Models
 class Session(BaseModel):
@@ -76,7 +326,55 @@ class EVPAnalysis(BaseModel):
     recording_id: str
     anomalies_detected: List[str]
     ai_analysis: str
-    confidence: float
+    confidence: Optional[float] = None
+
+class EMFBatch(BaseModel):
+    start_ms: int  # epoch milliseconds of the first sample; a retried batch with the same start_ms is stored once
+    interval_ms: float = 100.0
+    xyz: str  # base64 little-endian float32 x,y,z triples
+    offsets_ms: Optional[str] = None  # base64 little-endian uint32 per-sample offsets
+
+class BatchAnalysisRequest(BaseModel):
+    session_id: Optional[str] = None
+    recording_ids: Optional[List[str]] = None
+    concurrency: Optional[int] = None
+    force: bool = False
+
+# Response models: list endpoints are serialized by pydantic-core instead of
+# FastAPI's generic encoder. Extra stored fields pass through unchanged.
+class SessionOut(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: str
+    name: Optional[str] = None
+    location: Optional[str] = None
+    date: Optional[str] = None
+    notes: Optional[str] = None
+    created_at: Optional[str] = None
+
+class RecordingOut(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    id: str
+    session_id: Optional[str] = None
+    type: Optional[str] = None
+    timestamp: Optional[str] = None
+    transcription: Optional[str] = None
+    audio_blob_id: Optional[str] = None
+    audio_size: Optional[int] = None
+    audio_content_type: Optional[str] = None
+    audio_filename: Optional[str] = None
+    created_at: Optional[str] = None
+
+class SessionList(BaseModel):
+    success: bool
+    sessions: List[SessionOut]
+    next_cursor: Optional[str] = None
+
+class RecordingList(BaseModel):
+    success: bool
+    recordings: List[RecordingOut]
+    next_cursor: Optional[str] = None
 
 # Helper function
 def serialize_doc(doc):
@@ -85,10 +383,150 @@ def serialize_doc(doc):
         del doc["_id"]
     return doc
 
+# Fields left out of list responses unless explicitly requested via `fields`
+HEAVY_FIELDS = {
+    "sessions": [],
+    "recordings": ["audio_base64"],
+}
+
+def encode_cursor(doc):
+    # Legacy rows may lack created_at; they sort after every dated row
+    payload = json.dumps({"c": doc.get("created_at"), "i": str(doc["_id"])})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return payload["c"], ObjectId(payload["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def list_projection(collection_name, fields):
+    """Projection for list endpoints: requested fields, or everything but the heavy ones"""
+    if fields:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        if any(name.startswith("$") for name in names):
+            raise HTTPException(status_code=400, detail="Invalid field name")
+        # created_at is always needed to build the next cursor
+        return {name: 1 for name in names + ["created_at"]}
+    heavy = HEAVY_FIELDS[collection_name]
+    return {name: 0 for name in heavy} if heavy else None
+
+def keyset_find(collection, query, cursor=None, fields=None):
+    """Newest-first Motor cursor on (created_at, _id), resuming after `cursor`"""
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        after = [{"created_at": created_at, "_id": {"$lt": last_id}}]
+        if created_at is not None:
+            # Undated rows (null or missing created_at) come last in descending order
+            after += [{"created_at": {"$lt": created_at}}, {"created_at": None}]
+        query = {**query, "$or": after}
+
+    projection = list_projection(collection.name, fields)
+    return collection.find(query, projection).sort([("created_at", -1), ("_id", -1)])
+
+async def paginate(collection, query, limit, cursor=None, fields=None):
+    """Keyset pagination on (created_at, _id), newest first. Returns (docs, next_cursor)."""
+    docs = await keyset_find(collection, query, cursor, fields).limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return [serialize_doc(doc) for doc in docs[:limit]], next_cursor
+
+NDJSON_BATCH_SIZE = 500
+NDJSON_FLUSH_BYTES = 64 * 1024
+
+def ndjson_response(collection, query, cursor=None, fields=None):
+    """Stream every matching document as NDJSON while the cursor yields them.
+
+    Documents are encoded one at a time and flushed in ~64 KiB writes, so
+    memory stays flat and the first bytes go out after the first batch.
+    """
+    find = keyset_find(collection, query, cursor, fields).batch_size(NDJSON_BATCH_SIZE)
+
+    async def lines():
+        buffer = bytearray()
+        async for doc in find:
+            buffer += orjson.dumps(serialize_doc(doc), default=str)
+            buffer += b"\n"
+            if len(buffer) >= NDJSON_FLUSH_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def parse_range_header(range_header, size):
+    """Parse a single HTTP byte range into inclusive (start, end) offsets"""
+    try:
+        unit, _, spec = range_header.partition("=")
+        if unit.strip() != "bytes" or "," in spec:
+            raise ValueError
+        first, _, last = spec.strip().partition("-")
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the final N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        start, end = size, -1
+
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+async def upload_chunks(file):
+    """Read an UploadFile in blob-sized chunks"""
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+async def read_blob(blob_id):
+    size = await blob_store.size(blob_id)
+    return b"".join([chunk async for chunk in blob_store.iter_range(blob_id, 0, size - 1)])
+
+async def load_recording_audio(recording):
+    """Full audio bytes of a recording, from the blob store or legacy inline base64"""
+    if recording.get("audio_blob_id"):
+        return await read_blob(recording["audio_blob_id"])
+    return base64.b64decode(recording.get("audio_base64", ""))
+
+async def store_recording(recording_dict, blob_id, size, content_type, filename):
+    """Insert a recording document that references its audio blob"""
+    recording_dict.update({
+        "audio_blob_id": blob_id,
+        "audio_size": size,
+        "audio_content_type": content_type,
+        "audio_filename": filename,
+        "created_at": datetime.utcnow().isoformat()
+    })
+    try:
+        result = await db.recordings.insert_one(recording_dict)
+    except Exception:
+        await blob_store.delete(blob_id)
+        raise
+    await index_for_search(search_index.index_recording, recording_dict)
+    recording_dict["id"] = str(result.inserted_id)
+    return serialize_doc(recording_dict)
+
 @app.get("/")
 async def root():
     return {"message": "Ghost Hunting API", "status": "active"}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
 # Session endpoints
 @app.post("/api/sessions")
 async def create_session(session: Session):
@@ -98,93 +536,575 @@ async def create_session(session: Session):
     session_dict["id"] = str(result.inserted_id)
     return {"success": True, "session": serialize_doc(session_dict)}
 
-@app.get("/api/sessions")
-async def get_sessions():
-    sessions = []
-    async for session in db.sessions.find().sort("created_at", -1):
-        sessions.append(serialize_doc(session))
-    return {"success": True, "sessions": sessions}
+@app.get("/api/sessions", response_model=SessionList, response_model_exclude_unset=True)
+async def get_sessions(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """List sessions; `format=ndjson` streams all of them (from `cursor`) instead of one page"""
+    query = {"deleted_at": {"$exists": False}}
+    if format == "ndjson":
+        return ndjson_response(db.sessions, query, cursor, fields)
+    sessions, next_cursor = await paginate(db.sessions, query, limit, cursor, fields)
+    return {"success": True, "sessions": sessions, "next_cursor": next_cursor}
 
 @app.get("/api/sessions/{session_id}")
 async def get_session(session_id: str):
     try:
-        session = await db.sessions.find_one({"_id": ObjectId(session_id)})
+        session = await db.sessions.find_one({"_id": ObjectId(session_id), "deleted_at": {"$exists": False}})
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         return {"success": True, "session": serialize_doc(session)}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.delete("/api/sessions/{session_id}")
+@app.delete("/api/sessions/{session_id}", status_code=202)
 async def delete_session(session_id: str):
+    """Tombstone a session and delete its recordings, audio and analyses in the background"""
     try:
-        result = await db.sessions.delete_one({"_id": ObjectId(session_id)})
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="Session not found")
-        # Delete associated recordings
-        await db.recordings.delete_many({"session_id": session_id})
-        return {"success": True, "message": "Session deleted"}
+        deleted_at = datetime.utcnow().isoformat()
+        result = await db.sessions.update_one(
+            {"_id": ObjectId(session_id), "deleted_at": {"$exists": False}},
+            {"$set": {"deleted_at": deleted_at}}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    job_id = await cleanup_jobs.submit({"type": "delete_session", "session_id": session_id})
+    return {
+        "success": True,
+        "message": "Session deleted",
+        "tombstone": {"session_id": session_id, "deleted_at": deleted_at, "job_id": job_id}
+    }
+
+# Session export
+EXPORT_ANALYSES_BATCH = 500
+
+def export_modified(doc):
+    try:
+        return datetime.fromisoformat(doc["created_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+@app.get("/api/sessions/{session_id}/export")
+async def export_session(session_id: str):
+    """Download a session as a ZIP of its audio files plus manifest.json.
+
+    The archive is generated while it is sent: audio is copied chunk by chunk
+    from the blob store and only the manifest metadata is kept in memory.
+    """
+    try:
+        session = await db.sessions.find_one({"_id": ObjectId(session_id), "deleted_at": {"$exists": False}})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    async def archive():
+        zip_file = ZipStream()
+        entries = {}
+        recordings = db.recordings.find({"session_id": session_id}).sort(
+            [("created_at", 1), ("_id", 1)]
+        ).batch_size(100)
+        async for recording in recordings:
+            recording = serialize_doc(recording)
+            legacy_audio = recording.pop("audio_base64", None)
+            extension = os.path.splitext(recording.get("audio_filename") or "")[1] or ".m4a"
+            path = f"recordings/{recording['id']}{extension}"
+            modified = export_modified(recording)
+
+            blob_id = recording.get("audio_blob_id")
+            size = None
+            if blob_id:
+                try:
+                    size = await blob_store.size(blob_id)
+                except BlobNotFound:
+                    pass
+            if size is not None:
+                yield zip_file.start_entry(path, modified=modified)
+                if size:
+                    async for chunk in blob_store.iter_range(blob_id, 0, size - 1):
+                        yield zip_file.write(chunk)
+                yield zip_file.end_entry()
+            elif legacy_audio:
+                # Recordings created before audio moved to the blob store
+                yield zip_file.add(path, base64.b64decode(legacy_audio), compress=False, modified=modified)
+            else:
+                path = None
+            entries[recording["id"]] = {**recording, "audio_path": path, "analyses": []}
+
+        recording_ids = list(entries)
+        for start in range(0, len(recording_ids), EXPORT_ANALYSES_BATCH):
+            analyses = db.evp_analyses.find(
+                {"recording_id": {"$in": recording_ids[start:start + EXPORT_ANALYSES_BATCH]}}
+            ).sort("created_at", 1)
+            async for analysis in analyses:
+                entries[analysis["recording_id"]]["analyses"].append(serialize_doc(analysis))
+
+        manifest = {
+            "session": serialize_doc(session),
+            "exported_at": datetime.utcnow().isoformat(),
+            "recordings": list(entries.values())
+        }
+        yield zip_file.add("manifest.json", orjson.dumps(manifest, default=str, option=orjson.OPT_INDENT_2))
+        yield zip_file.finish()
+
+    return StreamingResponse(
+        archive(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="session-{session_id}.zip"'}
+    )
+
+# EMF telemetry endpoints
+async def require_session(session_id):
+    try:
+        session = await db.sessions.find_one(
+            {"_id": ObjectId(session_id), "deleted_at": {"$exists": False}}, {"_id": 1}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+@app.post("/api/sessions/{session_id}/emf")
+async def ingest_emf(session_id: str, batch: EMFBatch):
+    """Store a packed batch of magnetometer readings for a session"""
+    await require_session(session_id)
+    try:
+        timestamps, xyz = decode_batch(batch.start_ms, batch.interval_ms, batch.xyz, batch.offsets_ms)
+    except TelemetryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    updates = bucket_updates(session_id, batch.start_ms, timestamps, xyz)
+    already_stored = 0
+    for query, update in updates:
+        try:
+            await db.emf_buckets.update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # The bucket exists: either it already holds this batch (a retry) or
+            # a concurrent batch created it first, in which case append again
+            result = await db.emf_buckets.update_one(query, update)
+            if not result.matched_count:
+                already_stored += 1
+    return {
+        "success": True,
+        "samples": len(timestamps),
+        "buckets": len(updates),
+        "duplicate": already_stored == len(updates),
+    }
+
+@app.get("/api/sessions/{session_id}/emf")
+async def get_emf(
+    session_id: str,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    points: int = Query(500, ge=1, le=5000),
+    channel: str = "magnitude"
+):
+    """Min/max/mean of a channel in `points` windows between start_ms and end_ms"""
+    if start_ms is None or end_ms is None:
+        first = await db.emf_buckets.find_one({"session_id": session_id}, {"t_min": 1}, sort=[("t_min", 1)])
+        if not first:
+            return {"success": True, "channel": channel, "windows": None}
+        last = await db.emf_buckets.find_one({"session_id": session_id}, {"t_max": 1}, sort=[("t_max", -1)])
+        start_ms = first["t_min"] if start_ms is None else start_ms
+        end_ms = max(last["t_max"], start_ms + 1) if end_ms is None else end_ms
+
+    in_range = {"session_id": session_id, "t_min": {"$lte": end_ms}, "t_max": {"$gte": start_ms}}
+    if channel == "magnitude" and points and (end_ms - start_ms) / points >= BUCKET_MS:
+        # Wide windows: whole buckets from their stored summaries, raw samples
+        # only for the (at most two) buckets cut by the range edges
+        summaries = await db.emf_buckets.find(in_range, {"t": 0, "xyz": 0, "batches": 0}).to_list(length=None)
+        inside = [b for b in summaries if b["t_min"] >= start_ms and b["t_max"] <= end_ms]
+        edge_ids = [b["_id"] for b in summaries if b["t_min"] < start_ms or b["t_max"] > end_ms]
+        edges = await db.emf_buckets.find({"_id": {"$in": edge_ids}}, {"t": 1, "xyz": 1}).to_list(length=None)
+
+        def compute():
+            timestamps, xyz = unpack_buckets(edges)
+            return downsample_summaries(inside, timestamps, channel_values(xyz, channel), start_ms, end_ms, points)
+    else:
+        buckets = await db.emf_buckets.find(in_range, {"t": 1, "xyz": 1}).sort("t_min", 1).to_list(length=None)
+
+        def compute():
+            timestamps, xyz = unpack_buckets(buckets)
+            return downsample(timestamps, channel_values(xyz, channel), start_ms, end_ms, points)
+
+    try:
+        windows = await asyncio.to_thread(compute)
+    except TelemetryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "channel": channel, "start_ms": start_ms, "end_ms": end_ms, "windows": windows}
 
 # Recording endpoints
 @app.post("/api/recordings")
 async def create_recording(recording: Recording):
+    # Before the blob write: recordings for a deleted session would be orphans
+    await require_session(recording.session_id)
     recording_dict = recording.dict()
-    recording_dict["created_at"] = datetime.utcnow().isoformat()
-    result = await db.recordings.insert_one(recording_dict)
-    recording_dict["id"] = str(result.inserted_id)
-    return {"success": True, "recording": serialize_doc(recording_dict)}
+    audio_bytes = base64.b64decode(recording_dict.pop("audio_base64"))
+    blob_id, size = await blob_store.put_bytes(audio_bytes, "recording.m4a", "audio/mp4")
+    saved = await store_recording(recording_dict, blob_id, size, "audio/mp4", "recording.m4a")
+    return {"success": True, "recording": saved}
 
-@app.get("/api/recordings/{session_id}")
-async def get_recordings(session_id: str):
-    recordings = []
-    async for recording in db.recordings.find({"session_id": session_id}).sort("created_at", -1):
-        recordings.append(serialize_doc(recording))
-    return {"success": True, "recordings": recordings}
+@app.post("/api/recordings/upload")
+async def upload_recording(
+    session_id: str = Form(...),
+    type: str = Form(...),
+    timestamp: str = Form(...),
+    transcription: str = Form(""),
+    file: UploadFile = File(...)
+):
+    """Create a recording from a multipart audio upload, streamed to the blob store in chunks"""
+    await require_session(session_id)
+    filename = file.filename or "recording.m4a"
+    content_type = file.content_type or "audio/mp4"
+    blob_id, size = await blob_store.put_stream(upload_chunks(file), filename, content_type)
+    recording_dict = {
+        "session_id": session_id,
+        "type": type,
+        "timestamp": timestamp,
+        "transcription": transcription
+    }
+    saved = await store_recording(recording_dict, blob_id, size, content_type, filename)
+    return {"success": True, "recording": saved}
+
+@app.get("/api/recordings/{recording_id}/audio")
+async def get_recording_audio(recording_id: str, range: Optional[str] = Header(None)):
+    """Stream a recording's audio, honouring HTTP Range requests"""
+    try:
+        recording = await db.recordings.find_one({"_id": ObjectId(recording_id)})
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not recording:
+        raise HTTPException(status_code=404, detail="Recording not found")
+
+    content_type = recording.get("audio_content_type", "audio/mp4")
+    blob_id = recording.get("audio_blob_id")
+    if blob_id:
+        try:
+            size = await blob_store.size(blob_id)
+        except BlobNotFound:
+            raise HTTPException(status_code=404, detail="Recording audio not found")
+    elif recording.get("audio_base64"):
+        # Recordings created before audio moved to the blob store
+        legacy_audio = base64.b64decode(recording["audio_base64"])
+        size = len(legacy_audio)
+    else:
+        raise HTTPException(status_code=404, detail="Recording audio not found")
+
+    start, end = (0, size - 1) if not range else parse_range_header(range, size)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start + 1)
+    }
+    if range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    if blob_id:
+        body = blob_store.iter_range(blob_id, start, end)
+    else:
+        body = iter([legacy_audio[start:end + 1]])
+    return StreamingResponse(body, status_code=206 if range else 200, media_type=content_type, headers=headers)
+
+@app.get("/api/recordings/{session_id}", response_model=RecordingList, response_model_exclude_unset=True)
+async def get_recordings(
+    session_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """List a session's recordings; `format=ndjson` streams all of them instead of one page"""
+    if format == "ndjson":
+        return ndjson_response(db.recordings, {"session_id": session_id}, cursor, fields)
+    recordings, next_cursor = await paginate(
+        db.recordings, {"session_id": session_id}, limit, cursor, fields
+    )
+    return {"success": True, "recordings": recordings, "next_cursor": next_cursor}
 
 # Transcription endpoint
-@app.post("/api/transcribe")
-async def transcribe_audio(file: UploadFile = File(...)):
+@app.post("/api/transcribe", dependencies=[Depends(require_ai_admission)])
+async def transcribe_audio(file: UploadFile = File(...), chunked: bool = False):
+    """Transcribe an upload; `chunked` splits long audio into parallel timestamped chunks"""
     try:
         # Read audio file
         audio_data = await file.read()
-        
-        # Create a file-like object for OpenAI
-        audio_file = io.BytesIO(audio_data)
-        audio_file.name = file.filename or "audio.m4a"
+
+        if chunked or len(audio_data) > WHISPER_MAX_BYTES:
+            samples = await decode_clip(audio_data)
+            if samples is None:
+                raise HTTPException(status_code=400, detail="Audio could not be decoded for chunked transcription")
+            segments = await transcribe_pcm(samples)
+            return {
+                "success": True,
+                "transcription": join_segments(segments),
+                "segments": segments
+            }
         
         # Call OpenAI Whisper
-        response = openai_client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            response_format="text"
-        )
+        response = await transcribe_cached(audio_data, file.filename or "audio.m4a")
         
         return {
             "success": True,
             "transcription": response
         }
+    except HTTPException:
+        raise
+    except AIBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except AITimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
 
-# EVP Analysis endpoint
-@app.post("/api/analyze-evp")
-async def analyze_evp(recording_id: str, audio_base64: str):
+# Live transcription over WebSocket
+STREAM_TRANSCRIBE_CONCURRENCY = int(os.getenv("STREAM_TRANSCRIBE_CONCURRENCY", "3"))
+STREAM_MIN_SAMPLE_RATE = 8000
+STREAM_MAX_SAMPLE_RATE = 48000
+
+def parse_control_message(text):
+    """A client's JSON control frame as a dict, or None if it isn't one"""
     try:
-        # First, transcribe the audio
-        audio_bytes = base64.b64decode(audio_base64)
-        audio_file = io.BytesIO(audio_bytes)
-        audio_file.name = "evp_audio.m4a"
-        
-        transcription = openai_client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            response_format="text"
-        )
-        
-        # Use GPT to analyze for anomalies
-        analysis_prompt = f"""
+        message = json.loads(text or "")
+    except ValueError:
+        return None
+    return message if isinstance(message, dict) else None
+
+@app.websocket("/api/transcribe/stream")
+async def transcribe_stream(websocket: WebSocket):
+    """Transcribe audio while it is being recorded.
+
+    Protocol: the client sends {"type": "start", "sample_rate": 16000} (audio is
+    mono 16-bit little-endian PCM), then binary audio frames of any size, then
+    {"type": "stop"}. Each utterance is cut at a pause and transcribed
+    concurrently; the server pushes {"type": "partial", ...} per segment as it
+    completes and a {"type": "final", ...} with the ordered text at the end.
+    Every segment takes an AI token (`user_id`/`queue` query parameters); a
+    rate-limited segment gets an error message with `retry_after` instead.
+    """
+    await websocket.accept()
+    user_id = websocket.query_params.get("user_id")
+    queue = websocket.query_params.get("queue") == "true"
+    send_lock = asyncio.Lock()
+    semaphore = asyncio.Semaphore(STREAM_TRANSCRIBE_CONCURRENCY)
+    tasks = []
+    results = {}
+
+    async def send(message):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def transcribe_segment(index, start_sample, samples, sample_rate):
+        segment = {
+            "segment": index,
+            "start": round(start_sample / sample_rate, 2),
+            "end": round((start_sample + len(samples)) / sample_rate, 2)
+        }
+        try:
+            await admit_ai_call(user_id, websocket.client, queue=queue)
+        except RateLimited as e:
+            await send({"type": "error", **segment, "detail": str(e), "retry_after": math.ceil(e.retry_after)})
+            return
+        async with semaphore:
+            try:
+                wav_bytes = await asyncio.to_thread(encode_wav, samples, sample_rate)
+                text = (await transcribe_cached(wav_bytes, f"segment_{index}.wav")).strip()
+            except Exception as e:
+                await send({"type": "error", **segment, "detail": str(e)})
+                return
+        results[index] = {**segment, "text": text}
+        await send({"type": "partial", **segment, "text": text})
+
+    def schedule(segments, sample_rate):
+        for start_sample, samples in segments:
+            tasks.append(asyncio.create_task(
+                transcribe_segment(len(tasks), start_sample, samples, sample_rate)
+            ))
+
+    try:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        start = parse_control_message(message.get("text"))
+        if start is None or start.get("type") != "start":
+            await websocket.close(code=1003, reason="Expected a start message")
+            return
+        try:
+            sample_rate = int(start.get("sample_rate", 16000))
+        except (TypeError, ValueError):
+            sample_rate = 0
+        if not STREAM_MIN_SAMPLE_RATE <= sample_rate <= STREAM_MAX_SAMPLE_RATE:
+            await websocket.close(code=1003, reason="Unsupported sample_rate")
+            return
+        segmenter = SilenceSegmenter(sample_rate)
+        leftover = b""
+        await send({"type": "ready"})
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                # Frames may split a 16-bit sample; carry the odd byte over
+                data = leftover + message["bytes"]
+                usable = len(data) - len(data) % 2
+                leftover = data[usable:]
+                samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+                schedule(segmenter.feed(samples), sample_rate)
+            elif message.get("text"):
+                control = parse_control_message(message["text"])
+                if control is None:
+                    await send({"type": "error", "detail": "Control messages must be JSON objects"})
+                elif control.get("type") == "stop":
+                    break
+
+        schedule(segmenter.flush(), sample_rate)
+        await asyncio.gather(*tasks)
+        segments = [results[index] for index in sorted(results)]
+        await send({
+            "type": "final",
+            "text": " ".join(segment["text"] for segment in segments if segment["text"]),
+            "segments": segments
+        })
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Nothing is left running once the socket is gone, whatever ended it
+        for task in tasks:
+            task.cancel()
+
+# EVP Analysis
+# Clips scoring below this on the acoustic pass skip Whisper and GPT entirely
+EVP_PREFILTER_MIN_CONFIDENCE = float(os.getenv("EVP_PREFILTER_MIN_CONFIDENCE", "5"))
+
+# Voice-activity trimming: only voiced regions of EVP clips go to Whisper
+EVP_VAD = os.getenv("EVP_VAD", "1") == "1"
+# When most of the clip is voiced, trimming saves too little to be worth it
+EVP_VAD_MAX_VOICED_SHARE = float(os.getenv("EVP_VAD_MAX_VOICED_SHARE", "0.8"))
+
+async def transcribe_voiced(audio_bytes, samples):
+    """Transcribe only the voiced parts of a clip.
+
+    Returns (transcription, segments, vad) where segments carry timestamps in
+    the original recording and vad summarizes what was trimmed. Long clips are
+    chunked; without decodable PCM the whole upload is transcribed as before.
+    """
+    if samples is None:
+        return await transcribe_cached(audio_bytes, "evp_audio.m4a"), None, None
+
+    clip, offsets, vad = samples, None, None
+    if EVP_VAD:
+        regions = await asyncio.to_thread(detect_voiced_regions, samples, 16000)
+        total_seconds = len(samples) / 16000
+        voiced_seconds = sum(end - start for start, end in regions)
+        vad = {
+            "regions": [{"start": start, "end": end} for start, end in regions],
+            "voiced_seconds": round(voiced_seconds, 2),
+            "total_seconds": round(total_seconds, 2)
+        }
+        if not regions:
+            return "", [], vad
+        if voiced_seconds / total_seconds <= EVP_VAD_MAX_VOICED_SHARE:
+            clip, offsets = await asyncio.to_thread(build_trimmed_clip, samples, 16000, regions)
+
+    if offsets is None and len(clip) <= LONG_AUDIO_SECONDS * 16000:
+        # Short and mostly voiced: send the original upload as-is
+        return await transcribe_cached(audio_bytes, "evp_audio.m4a"), None, vad
+
+    segments = await transcribe_pcm(clip, "evp_voiced.wav")
+    if offsets:
+        segments = [
+            {
+                "start": map_to_original(segment["start"], offsets),
+                "end": map_to_original(segment["end"], offsets),
+                "text": segment["text"].strip()
+            }
+            for segment in segments
+        ]
+    return join_segments(segments), segments, vad
+
+def describe_acoustic_anomaly(anomaly):
+    label = "Voice-like segment" if anomaly["type"] == "voice_like" else "Audio burst"
+    return f"{label} at {anomaly['start']:.2f}s-{anomaly['end']:.2f}s ({anomaly['peak_snr_db']} dB above noise)"
+
+PREFILTERED_ANALYSIS = "No voice-like activity or bursts detected in the audio; AI analysis skipped."
+
+async def transcribe_evp_clip(recording_id, audio_bytes, force=False):
+    """Acoustic pass and transcription of one EVP clip.
+
+    Returns the unsaved analysis document; its ai_analysis is None until the
+    transcription has been reviewed, unless the clip was prefiltered.
+    """
+    samples = await decode_clip(audio_bytes)
+    acoustic = await asyncio.to_thread(analyze_signal, samples, 16000) if samples is not None else None
+    prefiltered = (
+        not force
+        and acoustic is not None
+        and acoustic["confidence"] < EVP_PREFILTER_MIN_CONFIDENCE
+    )
+
+    transcript_segments = vad = None
+    if prefiltered:
+        transcription = ""
+        ai_analysis = PREFILTERED_ANALYSIS
+    else:
+        transcription, transcript_segments, vad = await transcribe_voiced(audio_bytes, samples)
+        ai_analysis = None
+    
+    # Extract anomalies
+    anomalies = []
+    if len(transcription) > 0:
+        words = transcription.split()
+        if len(words) < 10:  # Short, unusual phrases
+            anomalies.append("Brief communication detected")
+        if any(word.lower() in ['help', 'here', 'yes', 'no'] for word in words):
+            anomalies.append("Potential response words detected")
+    if acoustic:
+        anomalies.extend(describe_acoustic_anomaly(anomaly) for anomaly in acoustic["anomalies"])
+    
+    # Save analysis to database
+    analysis_dict = {
+        "recording_id": recording_id,
+        "transcription": transcription,
+        "anomalies_detected": anomalies,
+        "ai_analysis": ai_analysis,
+        # Without decodable PCM there is no signal evidence to score
+        "confidence": acoustic["confidence"] if acoustic else None,
+        "acoustic": acoustic,
+        "transcript_segments": transcript_segments,
+        "vad": vad,
+        "prefiltered": prefiltered,
+        "created_at": datetime.utcnow().isoformat()
+    }
+    return analysis_dict
+
+async def build_evp_analysis(recording_id, audio_bytes, force=False):
+    """Transcribe and analyze one EVP clip; returns the unsaved analysis document"""
+    analysis_dict = await transcribe_evp_clip(recording_id, audio_bytes, force)
+    if analysis_dict["ai_analysis"] is None:
+        analysis_dict["ai_analysis"] = await review_transcription(analysis_dict["transcription"])
+    return analysis_dict
+
+async def save_evp_analysis(analysis_dict):
+    result = await db.evp_analyses.insert_one(analysis_dict)
+    await index_for_search(search_index.index_analyses, [analysis_dict])
+    analysis_dict["id"] = str(result.inserted_id)
+    return serialize_doc(analysis_dict)
+
+async def run_evp_analysis(recording_id, audio_bytes, force=False):
+    """Transcribe, analyze and persist one EVP clip; returns the saved analysis"""
+    analysis_dict = await build_evp_analysis(recording_id, audio_bytes, force)
+    return await save_evp_analysis(analysis_dict)
+
+def review_messages(transcription):
+    """Chat messages asking GPT to review an EVP transcription"""
+    # Use GPT to analyze for anomalies
+    analysis_prompt = f"""
 Analyze this EVP (Electronic Voice Phenomenon) recording transcription for paranormal activity.
 Transcription: "{transcription}"
 
@@ -197,47 +1117,288 @@ Look for:
 
 Provide a detailed analysis with confidence level (0-100%).
 """
-        
-        gpt_response = openai_client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a paranormal investigator AI assistant analyzing EVP recordings."},
-                {"role": "user", "content": analysis_prompt}
-            ],
-            temperature=0.7
-        )
-        
-        ai_analysis = gpt_response.choices[0].message.content
-        
-        # Extract anomalies (simplified)
-        anomalies = []
-        if len(transcription) > 0:
-            words = transcription.split()
-            if len(words) < 10:  # Short, unusual phrases
-                anomalies.append("Brief communication detected")
-            if any(word.lower() in ['help', 'here', 'yes', 'no'] for word in words):
-                anomalies.append("Potential response words detected")
-        
-        # Save analysis to database
-        analysis_dict = {
-            "recording_id": recording_id,
-            "transcription": transcription,
-            "anomalies_detected": anomalies,
-            "ai_analysis": ai_analysis,
-            "confidence": 75.0,  # This would be calculated based on actual analysis
-            "created_at": datetime.utcnow().isoformat()
-        }
-        
-        result = await db.evp_analyses.insert_one(analysis_dict)
-        analysis_dict["id"] = str(result.inserted_id)
+    return [
+        {"role": "system", "content": "You are a paranormal investigator AI assistant analyzing EVP recordings."},
+        {"role": "user", "content": analysis_prompt}
+    ]
+
+async def review_transcription(transcription):
+    """GPT review of an EVP transcription"""
+    ai_analysis = await ai_client.chat(
+        messages=review_messages(transcription),
+        model="gpt-4",
+        temperature=0.7
+    )
+    return ai_analysis
+
+@app.post("/api/analyze-evp", dependencies=[Depends(require_ai_admission)])
+async def analyze_evp(recording_id: str, audio_base64: str, force: bool = False):
+    try:
+        audio_bytes = base64.b64decode(audio_base64)
+        analysis = await run_evp_analysis(recording_id, audio_bytes, force=force)
         
         return {
             "success": True,
-            "analysis": serialize_doc(analysis_dict)
+            "analysis": analysis
         }
+    except AIBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except AITimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"EVP analysis failed: {str(e)}")
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/analyze-evp/stream", dependencies=[Depends(require_ai_admission)])
+async def analyze_evp_stream(recording_id: str, audio_base64: str, force: bool = False):
+    """EVP analysis as Server-Sent Events, relaying GPT's text as it is written.
+
+    Events: `transcription` (the analysis so far, without ai_analysis), one
+    `token` per chunk of analysis text, then `analysis` with the saved
+    document. Failures end the stream with an `error` event carrying the
+    status code the plain endpoint would have returned. The analysis is only
+    stored once the completion finishes; a client that disconnects first
+    cancels it.
+    """
+    try:
+        audio_bytes = base64.b64decode(audio_base64)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid audio_base64: {str(e)}")
+
+    async def events():
+        try:
+            analysis_dict = await transcribe_evp_clip(recording_id, audio_bytes, force)
+            yield sse_event("transcription", {key: value for key, value in analysis_dict.items() if key != "ai_analysis"})
+
+            if analysis_dict["ai_analysis"] is None:
+                parts = []
+                async for text in ai_client.chat_stream(
+                    review_messages(analysis_dict["transcription"]), model="gpt-4", temperature=0.7
+                ):
+                    parts.append(text)
+                    yield sse_event("token", {"text": text})
+                analysis_dict["ai_analysis"] = "".join(parts)
+            else:
+                yield sse_event("token", {"text": analysis_dict["ai_analysis"]})
+
+            analysis_dict["created_at"] = datetime.utcnow().isoformat()
+            yield sse_event("analysis", await save_evp_analysis(analysis_dict))
+        except AIBusyError as e:
+            yield sse_event("error", {"status": 503, "detail": str(e)})
+        except AITimeoutError as e:
+            yield sse_event("error", {"status": 504, "detail": str(e)})
+        except Exception as e:
+            yield sse_event("error", {"status": 500, "detail": f"EVP analysis failed: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # No-transform/X-Accel-Buffering keep proxies from holding tokens back
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+    )
+
+# Batch EVP analysis
+EVP_BATCH_MAX_CONCURRENCY = int(os.getenv("EVP_BATCH_MAX_CONCURRENCY", "8"))
+EVP_BATCH_MAX_ITEMS = int(os.getenv("EVP_BATCH_MAX_ITEMS", "200"))
+
+@app.post("/api/analyze-evp/batch")
+async def analyze_evp_batch(
+    request: BatchAnalysisRequest,
+    http_request: Request,
+    user_id: Optional[str] = None,
+    queue: bool = False
+):
+    """Analyze many stored recordings at once with bounded parallelism.
+
+    Each recording takes an AI token; recordings over the caller's limit are
+    reported as failed with `retry_after`.
+    """
+    if request.recording_ids:
+        recording_ids = request.recording_ids
+    elif request.session_id:
+        recording_ids = [
+            str(doc["_id"]) async for doc in
+            db.recordings.find({"session_id": request.session_id}, {"_id": 1}).sort("created_at", 1)
+        ]
+    else:
+        raise HTTPException(status_code=400, detail="Provide session_id or recording_ids")
+
+    if len(recording_ids) > EVP_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch is limited to {EVP_BATCH_MAX_ITEMS} recordings")
+
+    concurrency = min(request.concurrency or EVP_BATCH_MAX_CONCURRENCY, EVP_BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def analyze_one(recording_id):
+        try:
+            await admit_ai_call(user_id, http_request.client, queue=queue)
+        except RateLimited as e:
+            return {
+                "recording_id": recording_id,
+                "success": False,
+                "error": str(e),
+                "retry_after": math.ceil(e.retry_after)
+            }
+        async with semaphore:
+            try:
+                # Load audio inside the semaphore so at most `concurrency` clips are in memory
+                recording = await db.recordings.find_one({"_id": ObjectId(recording_id)})
+                if not recording:
+                    return {"recording_id": recording_id, "success": False, "error": "Recording not found"}
+                audio_bytes = await load_recording_audio(recording)
+                analysis = await build_evp_analysis(recording_id, audio_bytes, request.force)
+                return {"recording_id": recording_id, "success": True, "analysis": analysis}
+            except Exception as e:
+                return {"recording_id": recording_id, "success": False, "error": str(e)}
+
+    results = await asyncio.gather(*(analyze_one(recording_id) for recording_id in recording_ids))
+
+    analyses = [result["analysis"] for result in results if result["success"]]
+    if analyses:
+        # insert_many sets _id on each document in place
+        await db.evp_analyses.insert_many(analyses, ordered=False)
+        await index_for_search(search_index.index_analyses, analyses)
+        for analysis in analyses:
+            serialize_doc(analysis)
+
+    succeeded = len(analyses)
+    return {
+        "success": True,
+        "results": results,
+        "summary": {
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded
+        }
+    }
+
+# EVP analysis jobs
+async def process_evp_job(payload):
+    """Job handler: load the clip's audio and run the full analysis"""
+    if payload.get("audio_blob_id"):
+        audio_bytes = await read_blob(payload["audio_blob_id"])
+    else:
+        recording = await db.recordings.find_one({"_id": ObjectId(payload["recording_id"])})
+        if not recording:
+            raise ValueError("Recording not found")
+        audio_bytes = await load_recording_audio(recording)
+
+    return await run_evp_analysis(payload["recording_id"], audio_bytes)
+
+async def release_evp_job_audio(job):
+    """Drop an uploaded clip once its job has succeeded or failed for good"""
+    if job["payload"].get("audio_blob_id"):
+        await blob_store.delete(job["payload"]["audio_blob_id"])
+
+evp_jobs = JobQueue(
+    db.evp_jobs,
+    process_evp_job,
+    concurrency=int(os.getenv("EVP_JOB_WORKERS", "2")),
+    lease_seconds=int(os.getenv("EVP_JOB_LEASE_SECONDS", "600")),
+    retry_on=(AIBusyError, AITimeoutError),
+    retry_backoff_seconds=float(os.getenv("EVP_JOB_RETRY_BACKOFF_SECONDS", "5")),
+    on_finished=release_evp_job_audio,
+)
+
+# Cleanup jobs: cascading session deletes and orphan sweeps
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "200"))
+
+async def process_cleanup_job(payload):
+    if payload["type"] == "delete_session":
+        return await cascade_delete_session(db, blob_store, payload["session_id"], CLEANUP_BATCH_SIZE)
+    if payload["type"] == "sweep_orphans":
+        return await sweep_orphans(db, blob_store, CLEANUP_BATCH_SIZE)
+    raise ValueError(f"Unknown cleanup job type: {payload['type']}")
+
+cleanup_jobs = JobQueue(db.cleanup_jobs, process_cleanup_job, concurrency=1, lease_seconds=1800)
+
+@app.post("/api/admin/sweep-orphans", status_code=202)
+async def schedule_orphan_sweep():
+    """Queue a sweep for recordings, analyses and tombstoned sessions left without a parent"""
+    job_id = await cleanup_jobs.submit({"type": "sweep_orphans"})
+    return {"success": True, "job_id": job_id, "status": "queued"}
+
+@app.get("/api/admin/cleanup-jobs/{job_id}")
+async def get_cleanup_job(job_id: str):
+    job = await cleanup_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "job": serialize_doc(job)}
+
+@app.post("/api/evp-jobs", status_code=202, dependencies=[Depends(require_ai_admission)])
+async def submit_evp_job(recording_id: str = Form(...), file: Optional[UploadFile] = File(None)):
+    """Queue an EVP analysis and return its job id immediately.
+
+    Send the clip as `file`, or omit it to analyze a stored recording by id.
+    """
+    payload = {"recording_id": recording_id}
+    if file is not None:
+        blob_id, _ = await blob_store.put_stream(
+            upload_chunks(file), file.filename or "evp_audio.m4a", file.content_type or "audio/mp4"
+        )
+        payload["audio_blob_id"] = blob_id
+    else:
+        try:
+            exists = await db.recordings.find_one({"_id": ObjectId(recording_id)}, {"_id": 1})
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not exists:
+            raise HTTPException(status_code=404, detail="Recording not found")
+
+    job_id = await evp_jobs.submit(payload)
+    return {"success": True, "job_id": job_id, "status": "queued"}
+
+@app.get("/api/evp-jobs/metrics")
+async def get_evp_job_metrics():
+    """Queue depth, wait time and run time for EVP analysis jobs"""
+    return {"success": True, "metrics": await evp_jobs.metrics()}
+
+@app.get("/api/evp-jobs/{job_id}")
+async def get_evp_job(job_id: str):
+    job = await evp_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "job": serialize_doc(job)}
+
+@app.get("/api/evp-jobs/{job_id}/events")
+async def stream_evp_job(job_id: str):
+    """Server-Sent Events stream of job status until it succeeds or fails"""
+    job = await evp_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_status = None
+        while True:
+            job = await evp_jobs.get(job_id)
+            if job is None:
+                # Nothing here deletes jobs, but an operator may purge the collection
+                yield sse_event("error", {"detail": "Job not found"})
+                break
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield sse_event("status", serialize_doc(job))
+            if last_status in TERMINAL_STATUSES:
+                break
+            # Wake early on local state changes; the timeout covers other workers
+            await evp_jobs.wait_for_change(timeout=1.0)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/ai/metrics")
+async def get_ai_metrics():
+    """Upstream AI bulkhead state, admission control, transcription cache and upload size counters"""
+    return {
+        "success": True,
+        "metrics": ai_client.metrics(),
+        "admission": ai_admission.stats(),
+        "transcription_cache": transcription_cache.stats(),
+        "audio_normalization": normalization_stats.snapshot(),
+        "ffmpeg_available": FFMPEG is not None
+    }
+
 @app.get("/api/evp-analyses/{recording_id}")
 async def get_evp_analysis(recording_id: str):
     analysis = await db.evp_analyses.find_one({"recording_id": recording_id})
@@ -245,6 +1406,24 @@ async def get_evp_analysis(recording_id: str):
         raise HTTPException(status_code=404, detail="Analysis not found")
     return {"success": True, "analysis": serialize_doc(analysis)}
 
+# Search
+@app.get("/api/search")
+async def search_transcripts(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000)
+):
+    """Search transcriptions and AI analyses: words, "exact phrases" and prefix* terms"""
+    try:
+        results, has_more = await search_index.search(q, limit, offset)
+    except SearchQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "results": results,
+        "next_offset": offset + limit if has_more else None
+    }
+
 # PayPal Subscription Endpoints
 class CheckoutRequest(BaseModel):
     user_id: str
@@ -256,28 +1435,16 @@ class CancelRequest(BaseModel):
 async def get_subscription_status(user_id: str):
     """Check if user has active subscription"""
     try:
-        # Find user's subscription in database
-        subscription = await db.subscriptions.find_one({"user_id": user_id})
-        
-        if not subscription:
-            return {
-                "success": True,
-                "is_subscribed": False,
-                "status": "inactive"
-            }
-        
-        # Check if subscription is active
-        is_active = subscription.get("status") == "active"
-        
-        return {
-            "success": True,
-            "is_subscribed": is_active,
-            "status": subscription.get("status", "inactive"),
-            "subscription_id": subscription.get("paypal_subscription_id")
-        }
+        status = await lookup_subscription_status(user_id)
+        return {"success": True, **status}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/subscription/cache-metrics")
+async def get_subscription_cache_metrics():
+    """Hit rate and invalidation counters for the subscription status cache"""
+    return {"success": True, "metrics": subscription_cache.stats()}
+
 @app.post("/api/subscription/create-checkout")
 async def create_paypal_subscription(request: CheckoutRequest):
     """Create PayPal subscription for user"""
@@ -288,19 +1455,7 @@ async def create_paypal_subscription(request: CheckoutRequest):
                 "message": "PayPal not configured. Please add PayPal credentials to .env file"
             }
         
-        # Get PayPal access token
-        access_token = get_paypal_access_token()
-        if not access_token:
-            return {"success": False, "message": "Failed to authenticate with PayPal"}
-        
         # Create PayPal subscription
-        url = f"{PAYPAL_BASE_URL}/v1/billing/subscriptions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}",
-            "Prefer": "return=representation"
-        }
-        
         subscription_data = {
             "plan_id": PAYPAL_PLAN_ID,
             "custom_id": request.user_id,
@@ -312,7 +1467,14 @@ async def create_paypal_subscription(request: CheckoutRequest):
             }
         }
         
-        response = requests.post(url, headers=headers, json=subscription_data)
+        response = await paypal_client.request(
+            "POST",
+            "/v1/billing/subscriptions",
+            headers={"Prefer": "return=representation"},
+            json=subscription_data
+        )
+        if response is None:
+            return {"success": False, "message": "Failed to authenticate with PayPal"}
         
         if response.status_code == 201:
             subscription = response.json()
@@ -348,19 +1510,10 @@ async def verify_paypal_subscription(subscription_id: str, user_id: str):
         if not PAYPAL_CLIENT_ID:
             return {"success": False, "message": "PayPal not configured"}
         
-        # Get PayPal access token
-        access_token = get_paypal_access_token()
-        if not access_token:
-            return {"success": False, "message": "Failed to authenticate with PayPal"}
-        
         # Get subscription details from PayPal
-        url = f"{PAYPAL_BASE_URL}/v1/billing/subscriptions/{subscription_id}"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}"
-        }
-        
-        response = requests.get(url, headers=headers)
+        response = await paypal_client.request("GET", f"/v1/billing/subscriptions/{subscription_id}")
+        if response is None:
+            return {"success": False, "message": "Failed to authenticate with PayPal"}
         
         if response.status_code == 200:
             subscription = response.json()
@@ -382,6 +1535,7 @@ async def verify_paypal_subscription(subscription_id: str, user_id: str):
                     },
                     upsert=True
                 )
+                await subscription_cache.invalidate(user_id)
                 
                 return {
                     "success": True,
@@ -401,64 +1555,22 @@ async def verify_paypal_subscription(subscription_id: str, user_id: str):
 
 @app.post("/api/subscription/webhook")
 async def paypal_webhook(request: dict):
-    """Handle PayPal webhooks for subscription events"""
+    """Handle PayPal webhooks for subscription events.
+
+    Events are durably recorded and acknowledged; the webhook queue applies them
+    in the background. PayPal retries of an already-recorded event are no-ops.
+    """
     try:
-        event_type = request.get("event_type")
-        resource = request.get("resource", {})
-        
-        if event_type == "BILLING.SUBSCRIPTION.ACTIVATED":
-            # Subscription activated
-            subscription_id = resource.get("id")
-            custom_id = resource.get("custom_id")  # This is our user_id
-            
-            await db.subscriptions.update_one(
-                {"user_id": custom_id},
-                {
-                    "$set": {
-                        "user_id": custom_id,
-                        "paypal_subscription_id": subscription_id,
-                        "status": "active",
-                        "paypal_status": "ACTIVE",
-                        "updated_at": datetime.utcnow().isoformat()
-                    }
-                },
-                upsert=True
-            )
-            
-        elif event_type == "BILLING.SUBSCRIPTION.CANCELLED":
-            # Subscription cancelled
-            subscription_id = resource.get("id")
-            
-            await db.subscriptions.update_one(
-                {"paypal_subscription_id": subscription_id},
-                {
-                    "$set": {
-                        "status": "cancelled",
-                        "paypal_status": "CANCELLED",
-                        "updated_at": datetime.utcnow().isoformat()
-                    }
-                }
-            )
-        
-        elif event_type == "BILLING.SUBSCRIPTION.SUSPENDED":
-            # Subscription suspended (payment failed)
-            subscription_id = resource.get("id")
-            
-            await db.subscriptions.update_one(
-                {"paypal_subscription_id": subscription_id},
-                {
-                    "$set": {
-                        "status": "suspended",
-                        "paypal_status": "SUSPENDED",
-                        "updated_at": datetime.utcnow().isoformat()
-                    }
-                }
-            )
-        
-        return {"success": True}
+        is_new = await webhook_queue.enqueue(request)
+        return {"success": True, "duplicate": not is_new}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/subscription/webhook-metrics")
+async def get_webhook_metrics():
+    """Pending webhook events, processing lag and batch counters"""
+    return {"success": True, "metrics": await webhook_queue.metrics()}
+
 @app.post("/api/subscription/cancel")
 async def cancel_paypal_subscription(request: CancelRequest):
     """Cancel user's PayPal subscription"""
@@ -472,24 +1584,20 @@ async def cancel_paypal_subscription(request: CancelRequest):
         if not PAYPAL_CLIENT_ID:
             return {"success": False, "message": "PayPal not configured"}
         
-        # Get PayPal access token
-        access_token = get_paypal_access_token()
-        if not access_token:
-            return {"success": False, "message": "Failed to authenticate with PayPal"}
-        
         # Cancel in PayPal
         paypal_subscription_id = subscription.get("paypal_subscription_id")
         if paypal_subscription_id:
-            url = f"{PAYPAL_BASE_URL}/v1/billing/subscriptions/{paypal_subscription_id}/cancel"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {access_token}"
-            }
             data = {
                 "reason": "User requested cancellation"
             }
             
-            response = requests.post(url, headers=headers, json=data)
+            response = await paypal_client.request(
+                "POST",
+                f"/v1/billing/subscriptions/{paypal_subscription_id}/cancel",
+                json=data
+            )
+            if response is None:
+                return {"success": False, "message": "Failed to authenticate with PayPal"}
             
             if response.status_code not in [200, 204]:
                 return {"success": False, "message": f"PayPal cancellation failed: {response.text}"}
@@ -504,6 +1612,7 @@ async def cancel_paypal_subscription(request: CancelRequest):
                 }
             }
         )
+        await subscription_cache.invalidate(request.user_id)
         
         return {"success": True, "message": "Subscription cancelled"}
     except Exception as e:
@@ -528,6 +1637,7 @@ async def dev_activate_subscription(request: CheckoutRequest):
             },
             upsert=True
         )
+        await subscription_cache.invalidate(request.user_id)
         
         return {
             "success": True,
@@ -537,6 +1647,12 @@ async def dev_activate_subscription(request: CheckoutRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/admin/indexes")
+async def get_index_report():
+    """Declared vs. actual indexes, including any that are missing or unused"""
+    return {"success": True, "indexes": await index_report(db)}
+
+# Development server; run serve.py for multi-worker production
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,173 @@
+"""Cold-start benchmark for the API.
+
+Each run boots the server in a fresh interpreter, with the same stand-ins as
+``benchmark.py`` (in-memory Mongo unless ``--mongo-url``, no network), and
+times:
+
+- ``import_ms``: importing ``server``
+- ``startup_ms``: uvicorn start including the lifespan (index provisioning,
+  background workers)
+- ``first_request_ms``: the first request that touches Mongo
+- ``total_ms``: process spawn until that first response
+
+The report has the median, min and max of each over ``--runs`` and, from
+one more boot under ``-X importtime``, the slowest imports by cumulative
+time. Pass a previous report as ``--compare`` to fail on regressions.
+
+    python startup_benchmark.py --runs 5 --output startup.json
+    python startup_benchmark.py --runs 5 --compare startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmark import git_revision
+
+# Nothing is called upstream while booting; lazy clients never connect here
+UNREACHABLE_UPSTREAM = "http://127.0.0.1:9"
+PHASES = ("import_ms", "startup_ms", "first_request_ms", "total_ms")
+
+
+def boot(mongo_url, spawned_at):
+    """Child process: boot the server once and print the phase timings"""
+    import httpx
+
+    from benchmark import load_server, serve_in_thread
+
+    with tempfile.TemporaryDirectory(prefix="startup-blobs-") as blob_dir:
+        started = time.perf_counter()
+        server = load_server(UNREACHABLE_UPSTREAM, mongo_url, blob_dir)
+        imported = time.perf_counter()
+        api_url, api = serve_in_thread(server.app)
+        ready = time.perf_counter()
+        try:
+            response = httpx.get(f"{api_url}/api/sessions", params={"limit": 1}, timeout=30.0)
+            response.raise_for_status()
+            answered = time.perf_counter()
+            # Wall clock: the only one shared with the parent that spawned us
+            total = time.time() - spawned_at
+        finally:
+            api.should_exit = True
+
+    print(json.dumps({
+        "import_ms": (imported - started) * 1000,
+        "startup_ms": (ready - imported) * 1000,
+        "first_request_ms": (answered - ready) * 1000,
+        "total_ms": total * 1000,
+    }))
+
+
+def run_once(mongo_url, importtime=False):
+    """Boot a fresh interpreter; returns (timings, its stderr)"""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += [os.path.abspath(__file__), "--boot", str(time.time())]
+    if mongo_url:
+        command += ["--mongo-url", mongo_url]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        sys.exit(f"Boot failed:\n{result.stderr[-4000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(stderr, count):
+    """Top modules by cumulative time from ``python -X importtime`` output"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            modules.append((int(cumulative), name.strip()))
+        except ValueError:
+            continue  # the header row
+    modules.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(micros / 1000, 1)} for micros, name in modules[:count]]
+
+
+def summarize(runs):
+    return {
+        phase: {
+            "median": round(statistics.median(run[phase] for run in runs), 1),
+            "min": round(min(run[phase] for run in runs), 1),
+            "max": round(max(run[phase] for run in runs), 1),
+        }
+        for phase in PHASES
+    }
+
+
+def compare(report, baseline, max_regression):
+    """Print median changes against a previous report; returns True if any regressed too far"""
+    regressed = False
+    for phase in PHASES:
+        previous = baseline["phases"][phase]["median"]
+        current = report["phases"][phase]["median"]
+        change = (current - previous) / previous * 100 if previous else 0.0
+        flag = ""
+        if change > max_regression:
+            regressed = True
+            flag = "  REGRESSION"
+        print(f"{phase:18} {previous:>8.1f} -> {current:>8.1f} ms ({change:+.0f}%){flag}", file=sys.stderr)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mongo-url", help="throwaway local mongod instead of the in-memory mock")
+    parser.add_argument("--top-imports", type=int, default=15, help="slowest imports to report")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    parser.add_argument("--max-regression", type=float, default=25.0, help="median increase (%%) that fails --compare")
+    parser.add_argument("--boot", type=float, metavar="SPAWNED_AT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.boot:
+        boot(args.mongo_url, args.boot)
+        return
+
+    runs = []
+    for index in range(max(args.runs, 1)):
+        timings, _ = run_once(args.mongo_url)
+        runs.append(timings)
+        print(f"run {index + 1}: " + ", ".join(f"{phase} {timings[phase]:.0f}" for phase in PHASES), file=sys.stderr)
+
+    imports = []
+    if args.top_imports > 0:
+        # A separate, unmeasured boot: -X importtime slows imports down
+        _, stderr = run_once(args.mongo_url, importtime=True)
+        imports = slowest_imports(stderr, args.top_imports)
+
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "runs": len(runs),
+        "mongo": "local mongod" if args.mongo_url else "in-memory",
+        "phases": summarize(runs),
+        "slowest_imports": imports,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Silence-based segmentation of live PCM audio.
+
+``SilenceSegmenter`` is fed arbitrary-size chunks of mono float32 samples as
+they arrive over the WebSocket and hands back complete utterances as soon as
+a long-enough pause follows speech, so each one can be transcribed while the
+user is still recording. Frame energies are computed with NumPy per chunk;
+only the per-frame state machine runs in Python (50 steps per second of
+audio).
+"""
+import numpy as np
+
+EPSILON = 1e-10
+
+
+class SilenceSegmenter:
+    def __init__(self, sample_rate, frame_ms=20, silence_threshold_db=-40.0,
+                 min_silence_ms=600, min_speech_ms=200, max_segment_ms=30000, pre_roll_ms=200):
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.silence_threshold_db = silence_threshold_db
+        self.min_silence_frames = max(int(min_silence_ms / frame_ms), 1)
+        self.min_speech_frames = max(int(min_speech_ms / frame_ms), 1)
+        self.max_segment_samples = int(sample_rate * max_segment_ms / 1000)
+        self.pre_roll_frames = int(pre_roll_ms / frame_ms)
+
+        self._buffer = np.empty(0, dtype=np.float32)
+        self._buffer_start = 0  # absolute sample index of _buffer[0]
+        self._scanned = 0  # samples of _buffer already classified
+        self._speech_frames = 0
+        self._silence_run = 0
+
+    def _cut(self, end):
+        """Emit _buffer[:end] as a segment and reset speech state"""
+        segment = (self._buffer_start, self._buffer[:end].copy())
+        self._buffer = self._buffer[end:]
+        self._buffer_start += end
+        self._scanned = max(self._scanned - end, 0)
+        self._speech_frames = 0
+        self._silence_run = 0
+        return segment
+
+    def _trim_to_pre_roll(self):
+        """Drop buffered silence, keeping only a short pre-roll before the next speech"""
+        drop = self._scanned - self.pre_roll_frames * self.frame_length
+        self._buffer = self._buffer[drop:]
+        self._buffer_start += drop
+        self._scanned -= drop
+        self._silence_run = self.pre_roll_frames
+
+    def feed(self, samples):
+        """Add samples; returns a list of (start_sample, segment_samples) ready to transcribe"""
+        self._buffer = np.concatenate((self._buffer, samples.astype(np.float32, copy=False)))
+        segments = []
+
+        usable = (len(self._buffer) - self._scanned) // self.frame_length * self.frame_length
+        frames = self._buffer[self._scanned:self._scanned + usable].reshape(-1, self.frame_length)
+        energy_db = 20.0 * np.log10(np.sqrt(np.mean(np.square(frames), axis=1)) + EPSILON)
+        loud = energy_db > self.silence_threshold_db
+
+        for is_loud in loud.tolist():
+            self._scanned += self.frame_length
+            if is_loud:
+                self._speech_frames += 1
+                self._silence_run = 0
+            else:
+                self._silence_run += 1
+
+            if self._speech_frames >= self.min_speech_frames and self._silence_run >= self.min_silence_frames:
+                segments.append(self._cut(self._scanned))
+            elif self._speech_frames and self._silence_run >= self.min_silence_frames:
+                # A click or pop too short to be speech, then a pause: forget it
+                self._speech_frames = 0
+                self._trim_to_pre_roll()
+            elif self._speech_frames == 0 and self._silence_run > self.pre_roll_frames:
+                # Still waiting for speech: drop leading silence but keep a short pre-roll
+                self._trim_to_pre_roll()
+            elif self._scanned >= self.max_segment_samples:
+                segments.append(self._cut(self._scanned))
+
+        return segments
+
+    def flush(self):
+        """Whatever speech is left when the stream ends"""
+        if self._speech_frames == 0 or len(self._buffer) == 0:
+            return []
+        return [self._cut(len(self._buffer))]
@@ -0,0 +1,190 @@
+"""In-process cache of subscription status per user.
+
+``/api/subscription/status`` is hit on every gated screen, so its answer is
+kept in memory for ``ttl_seconds`` (non-subscribers for
+``negative_ttl_seconds``). Every write to a subscription calls
+``invalidate``, which drops the local entry and publishes the user id on an
+invalidation channel so other workers drop theirs too.
+
+Channels:
+
+- ``LocalChannel``: in-process only (single worker, tests)
+- ``MongoChannel``: tails a capped collection, works across workers and hosts.
+  It connects in the background, retrying with backoff, so an unreachable
+  Mongo delays cross-worker invalidation (entries still expire by TTL)
+  rather than the worker's startup.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+
+class LocalChannel:
+    def __init__(self):
+        self.connected = True
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    async def publish(self, key):
+        for callback in self._subscribers:
+            callback(key)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class MongoChannel:
+    """Broadcast over a capped collection read with a tailable cursor"""
+
+    def __init__(self, db, name="cache_invalidations", size_bytes=1024 * 1024, max_retry_seconds=60.0):
+        self.db = db
+        self.name = name
+        self.size_bytes = size_bytes
+        self.max_retry_seconds = max_retry_seconds
+        self.connected = False
+        self._subscribers = []
+        self._task = None
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    async def publish(self, key):
+        await self.db[self.name].insert_one({"key": key})
+
+    async def start(self):
+        """Connect in the background; until then other workers' entries expire by TTL only"""
+        self._task = asyncio.create_task(self._run())
+
+    async def _open(self):
+        """Create and seed the capped collection; returns the id to tail after"""
+        try:
+            await self.db.create_collection(self.name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass
+        collection = self.db[self.name]
+        # A tailable cursor on an empty capped collection dies at once; seed it
+        last = await collection.find_one(sort=[("$natural", -1)])
+        if last is None:
+            await collection.insert_one({"key": None})
+            last = await collection.find_one(sort=[("$natural", -1)])
+        return last["_id"]
+
+    async def _run(self):
+        delay = 1.0
+        while True:
+            try:
+                last_id = await self._open()
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Invalidation channel unavailable (%s); retrying in %.0fs", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_seconds)
+        self.connected = True
+        await self._tail(last_id)
+
+    async def _tail(self, last_id):
+        collection = self.db[self.name]
+        while True:
+            try:
+                cursor = collection.find({"_id": {"$gt": last_id}}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for doc in cursor:
+                        last_id = doc["_id"]
+                        if doc.get("key") is not None:
+                            for callback in self._subscribers:
+                                callback(doc["key"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Invalidation channel cursor failed; reconnecting")
+            await asyncio.sleep(1.0)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class SubscriptionCache:
+    def __init__(self, channel, ttl_seconds=60, negative_ttl_seconds=30, max_entries=10000):
+        self.channel = channel
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Bumped on every invalidation so a lookup racing a write never caches stale data
+        self._generation = 0
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "invalidations": 0}
+        channel.subscribe(self._drop)
+
+    def generation(self):
+        return self._generation
+
+    def get(self, user_id):
+        """Cached status dict, or None on a miss"""
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(user_id, None)
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(user_id)
+        value = entry[1]
+        self._stats["hits" if value["is_subscribed"] else "negative_hits"] += 1
+        return value
+
+    def set(self, user_id, value, generation):
+        """Store a status read from Mongo at ``generation``; skipped if invalidated since"""
+        if generation != self._generation:
+            return
+        ttl = self.ttl_seconds if value["is_subscribed"] else self.negative_ttl_seconds
+        self._entries[user_id] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _drop(self, user_id):
+        self._generation += 1
+        self._entries.pop(user_id, None)
+
+    async def invalidate(self, user_id):
+        if not user_id:
+            return
+        self._stats["invalidations"] += 1
+        self._drop(user_id)
+        try:
+            await self.channel.publish(user_id)
+        except Exception:
+            # Other workers fall back to TTL expiry
+            logger.exception("Failed to broadcast invalidation for %s", user_id)
+
+    def stats(self):
+        lookups = self._stats["hits"] + self._stats["negative_hits"] + self._stats["misses"]
+        hits = lookups - self._stats["misses"]
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "channel_connected": self.channel.connected,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_subscription_cache(db, backend, **kwargs):
+    if backend == "mongo":
+        return SubscriptionCache(MongoChannel(db), **kwargs)
+    if backend == "local":
+        return SubscriptionCache(LocalChannel(), **kwargs)
+    raise ValueError(f"Unknown SUBSCRIPTION_CACHE_CHANNEL: {backend}")
@@ -0,0 +1,190 @@
+"""EMF magnetometer telemetry: packed ingestion, bucketed storage, downsampling.
+
+Clients send batches as packed little-endian arrays (base64 in JSON): float32
+``x, y, z`` triples interleaved, plus either a fixed sample interval or uint32
+per-sample offsets. Samples are stored in ``emf_buckets`` documents, one per
+session and ``BUCKET_MS`` slot of time: each batch is appended to the buckets
+it falls in as raw binary chunks (int64 ms timestamps and float32 xyz) while
+the bucket's magnitude min/max/sum are folded in. Wide queries read only
+those summaries; raw samples are unpacked just for narrow windows. Nothing is
+ever handled one sample at a time in Python.
+
+Each bucket lists the ``start_ms`` of the batches it holds, so a retried
+batch is not appended twice.
+"""
+import base64
+import binascii
+
+import numpy as np
+
+BUCKET_MS = 5 * 60 * 1000  # 3000 samples at 10 Hz
+MAX_BATCH_SAMPLES = 100_000
+CHANNELS = ("x", "y", "z", "magnitude")
+
+
+class TelemetryError(ValueError):
+    """Raised for malformed telemetry batches or queries"""
+
+
+def decode_batch(start_ms, interval_ms, xyz_b64, offsets_b64=None):
+    """Decode a packed batch into (timestamps int64 ms, xyz float32 [n, 3])"""
+    try:
+        xyz = np.frombuffer(base64.b64decode(xyz_b64, validate=True), dtype="<f4")
+    except (binascii.Error, ValueError):
+        raise TelemetryError("xyz must be base64 of little-endian float32 triples")
+    if len(xyz) % 3:
+        raise TelemetryError("xyz length must be a multiple of 3 floats")
+    xyz = xyz.reshape(-1, 3)
+    count = len(xyz)
+    if count == 0:
+        raise TelemetryError("Batch contains no samples")
+    if count > MAX_BATCH_SAMPLES:
+        raise TelemetryError(f"Batch is limited to {MAX_BATCH_SAMPLES} samples")
+
+    if offsets_b64:
+        try:
+            offsets = np.frombuffer(base64.b64decode(offsets_b64, validate=True), dtype="<u4")
+        except (binascii.Error, ValueError):
+            raise TelemetryError("offsets_ms must be base64 of little-endian uint32")
+        if len(offsets) != count:
+            raise TelemetryError("offsets_ms must have one entry per sample")
+        timestamps = start_ms + offsets.astype(np.int64)
+    else:
+        if interval_ms <= 0:
+            raise TelemetryError("interval_ms must be positive")
+        timestamps = start_ms + np.round(np.arange(count) * interval_ms).astype(np.int64)
+    return timestamps, xyz
+
+
+def bucket_updates(session_id, batch_start_ms, timestamps, xyz):
+    """(filter, update) upserts appending a batch to each bucket it falls in.
+
+    The filter excludes buckets already holding ``batch_start_ms``; for those
+    the upsert collides on ``_id`` with a DuplicateKeyError.
+    """
+    order = np.argsort(timestamps, kind="stable")
+    timestamps, xyz = timestamps[order], xyz[order]
+    magnitude = np.sqrt(np.square(xyz, dtype=np.float32).sum(axis=1))
+    slots = timestamps // BUCKET_MS
+    starts = np.flatnonzero(np.concatenate(([True], slots[1:] != slots[:-1])))
+
+    updates = []
+    for start, end in zip(starts, np.append(starts[1:], len(timestamps))):
+        t, m = timestamps[start:end], magnitude[start:end]
+        updates.append((
+            {"_id": f"{session_id}:{int(slots[start])}", "batches": {"$ne": batch_start_ms}},
+            {
+                "$setOnInsert": {"session_id": session_id},
+                "$min": {"t_min": int(t[0]), "magnitude_min": float(m.min())},
+                "$max": {"t_max": int(t[-1]), "magnitude_max": float(m.max())},
+                "$inc": {"count": int(end - start), "magnitude_sum": float(m.sum(dtype=np.float64))},
+                "$push": {
+                    "batches": batch_start_ms,
+                    "t": t.astype("<i8").tobytes(),
+                    "xyz": xyz[start:end].astype("<f4").tobytes(),
+                },
+            },
+        ))
+    return updates
+
+
+def _chunks(payload):
+    # Buckets written before appends held a single binary payload
+    return payload if isinstance(payload, list) else [payload]
+
+
+def unpack_buckets(buckets):
+    """Concatenate bucket payloads into time-ordered (timestamps, xyz) arrays"""
+    if not buckets:
+        return np.empty(0, dtype=np.int64), np.empty((0, 3), dtype=np.float32)
+    timestamps = np.concatenate([np.frombuffer(chunk, dtype="<i8") for b in buckets for chunk in _chunks(b["t"])])
+    xyz = np.concatenate([
+        np.frombuffer(chunk, dtype="<f4").reshape(-1, 3) for b in buckets for chunk in _chunks(b["xyz"])
+    ])
+    if len(timestamps) > 1 and np.any(np.diff(timestamps) < 0):
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, xyz = timestamps[order], xyz[order]
+    return timestamps, xyz
+
+
+def channel_values(xyz, channel):
+    if channel == "magnitude":
+        return np.sqrt(np.square(xyz, dtype=np.float32).sum(axis=1))
+    if channel in ("x", "y", "z"):
+        return xyz[:, "xyz".index(channel)]
+    raise TelemetryError(f"channel must be one of {', '.join(CHANNELS)}")
+
+
+def _window_result(width):
+    return {"window_ms": width, "t": [], "min": [], "max": [], "mean": [], "count": []}
+
+
+def _reduce_windows(result, window, mins, maxs, sums, counts, start_ms):
+    """Fill ``result`` from partial aggregates sorted by window index"""
+    starts = np.flatnonzero(np.concatenate(([True], window[1:] != window[:-1])))
+    counts = np.add.reduceat(counts, starts)
+    result["t"] = (start_ms + window[starts] * result["window_ms"]).round().astype(np.int64).tolist()
+    result["min"] = np.minimum.reduceat(mins, starts).round(3).tolist()
+    result["max"] = np.maximum.reduceat(maxs, starts).round(3).tolist()
+    result["mean"] = (np.add.reduceat(sums, starts) / counts).round(3).tolist()
+    result["count"] = counts.tolist()
+    return result
+
+
+def _window_index(timestamps, start_ms, width, points):
+    return np.minimum(((timestamps - start_ms) / width).astype(np.int64), points - 1)
+
+
+def downsample(timestamps, values, start_ms, end_ms, points):
+    """Min/max/mean per fixed-width window over [start_ms, end_ms]; empty windows are omitted"""
+    if end_ms <= start_ms:
+        raise TelemetryError("end_ms must be after start_ms")
+
+    mask = (timestamps >= start_ms) & (timestamps <= end_ms)
+    timestamps, values = timestamps[mask], values[mask].astype(np.float64)
+    result = _window_result(max((end_ms - start_ms) / points, 1.0))
+    if len(values) == 0:
+        return result
+
+    # Data is time-ordered, so each window is one contiguous run
+    window = _window_index(timestamps, start_ms, result["window_ms"], points)
+    return _reduce_windows(result, window, values, values, values, np.ones(len(values), dtype=np.int64), start_ms)
+
+
+def downsample_summaries(summaries, timestamps, values, start_ms, end_ms, points):
+    """Like ``downsample`` for magnitude, from bucket summaries plus raw samples.
+
+    ``summaries`` are buckets lying wholly inside [start_ms, end_ms]; each is
+    counted in the window holding its midpoint, which is exact enough once
+    windows are at least ``BUCKET_MS`` wide. ``timestamps``/``values`` are
+    the raw samples of buckets cut by the range edges.
+    """
+    if end_ms <= start_ms:
+        raise TelemetryError("end_ms must be after start_ms")
+
+    mask = (timestamps >= start_ms) & (timestamps <= end_ms)
+    timestamps, values = timestamps[mask], values[mask].astype(np.float64)
+    result = _window_result(max((end_ms - start_ms) / points, 1.0))
+    if not summaries and len(values) == 0:
+        return result
+
+    middles = np.array([(b["t_min"] + b["t_max"]) // 2 for b in summaries], dtype=np.int64)
+    counts = np.array([b["count"] for b in summaries], dtype=np.int64)
+    sums = np.array([
+        # Buckets written before appends stored a mean instead
+        b["magnitude_sum"] if "magnitude_sum" in b else b["magnitude_mean"] * b["count"] for b in summaries
+    ], dtype=np.float64)
+    window = np.concatenate((
+        _window_index(middles, start_ms, result["window_ms"], points),
+        _window_index(timestamps, start_ms, result["window_ms"], points),
+    ))
+    order = np.argsort(window, kind="stable")
+    return _reduce_windows(
+        result,
+        window[order],
+        np.concatenate(([b["magnitude_min"] for b in summaries], values))[order],
+        np.concatenate(([b["magnitude_max"] for b in summaries], values))[order],
+        np.concatenate((sums, values))[order],
+        np.concatenate((counts, np.ones(len(values), dtype=np.int64)))[order],
+        start_ms,
+    )
@@ -0,0 +1,115 @@
+"""Content-addressed cache for Whisper transcriptions.
+
+Entries are keyed by a SHA-256 of the audio bytes plus the model parameters,
+so retried uploads and re-analysis of the same clip never hit the provider
+twice. Lookups go through an in-process LRU first, then a Mongo collection
+whose documents expire via a TTL index on ``expires_at``. The Mongo tier is
+best-effort: when it errors, lookups miss and writes are dropped, so a cache
+outage costs upstream calls rather than failed requests.
+"""
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+def transcription_key(audio_bytes, model="whisper-1", response_format="text"):
+    digest = hashlib.sha256(audio_bytes)
+    digest.update(f"|{model}|{response_format}".encode())
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    def __init__(self, collection, max_entries=1024, ttl_seconds=30 * 24 * 3600):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._stats = {"memory_hits": 0, "mongo_hits": 0, "coalesced": 0, "misses": 0}
+        self._mongo_errors = 0
+
+    def _remember(self, key, text):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self._stats["memory_hits"] += 1
+            return self._memory[key]
+
+        try:
+            doc = await self.collection.find_one({"_id": key}, {"text": 1})
+        except PyMongoError as e:
+            self._mongo_errors += 1
+            logger.warning("Transcription cache lookup failed: %s", e)
+            return None
+        if doc:
+            self._stats["mongo_hits"] += 1
+            self._remember(key, doc["text"])
+            return doc["text"]
+        return None
+
+    async def put(self, key, text):
+        self._remember(key, text)
+        now = datetime.utcnow()
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {"text": text, "created_at": now, "expires_at": now + timedelta(seconds=self.ttl_seconds)}},
+                upsert=True
+            )
+        except PyMongoError as e:
+            self._mongo_errors += 1
+            logger.warning("Transcription cache write failed: %s", e)
+
+    async def _transcribe_and_store(self, key, transcribe):
+        text = await transcribe()
+        await self.put(key, text)
+        return text
+
+    def _settled(self, key, task):
+        self._pending.pop(key, None)
+        if not task.cancelled():
+            # Every waiter may have gone; don't leave an unretrieved exception behind
+            task.exception()
+
+    async def get_or_transcribe(self, key, transcribe):
+        """Return the cached text for ``key`` or await ``transcribe()`` once and store it.
+
+        Concurrent callers with the same key share a single upstream call.
+        """
+        text = await self.get(key)
+        if text is not None:
+            return text
+
+        pending = self._pending.get(key)
+        if pending:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        self._stats["misses"] += 1
+        # Owned by the cache, not the caller: a client that disconnects must not
+        # cancel the upstream call for everyone coalesced onto it
+        task = asyncio.create_task(self._transcribe_and_store(key, transcribe))
+        self._pending[key] = task
+        task.add_done_callback(lambda done: self._settled(key, done))
+        return await asyncio.shield(task)
+
+    def stats(self):
+        lookups = sum(self._stats.values())
+        hits = lookups - self._stats["misses"]
+        return {
+            **self._stats,
+            "entries_in_memory": len(self._memory),
+            "mongo_errors": self._mongo_errors,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,91 @@
+"""Energy / zero-crossing voice activity detection.
+
+EVP recordings are mostly room noise. ``detect_voiced_regions`` finds the
+stretches that could contain speech; ``build_trimmed_clip`` splices just those
+together (with short gaps) so only they are sent to Whisper, and
+``map_to_original`` translates timestamps in the trimmed clip back to the
+original recording. Everything is vectorized NumPy; no model or GPU needed.
+"""
+import numpy as np
+
+FRAME_SECONDS = 0.030
+EPSILON = 1e-10
+
+
+def _frame_stats(samples, sample_rate):
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    count = len(samples) // frame_length
+    frames = samples[:count * frame_length].reshape(count, frame_length)
+    energy_db = 20.0 * np.log10(np.sqrt(np.mean(np.square(frames), axis=1)) + EPSILON)
+    signs = np.signbit(frames)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return energy_db, zcr
+
+
+def _dilate(mask, frames):
+    if frames <= 0 or not mask.any():
+        return mask
+    kernel = np.ones(2 * frames + 1)
+    return np.convolve(mask.astype(np.float32), kernel, mode="same") > 0
+
+
+def detect_voiced_regions(samples, sample_rate, padding_seconds=0.2, merge_gap_seconds=0.3,
+                          min_region_seconds=0.15, min_level_db=-55.0):
+    """List of (start_seconds, end_seconds) regions that may contain speech"""
+    if len(samples) < int(sample_rate * FRAME_SECONDS):
+        return []
+    energy_db, zcr = _frame_stats(samples, sample_rate)
+    noise_floor = np.percentile(energy_db, 10)
+    above_floor = energy_db - noise_floor
+
+    # Voiced speech: clearly above the floor with a low zero-crossing rate.
+    # Unvoiced consonants cross zero a lot, so they need to be louder still.
+    voiced = (energy_db > min_level_db) & (
+        ((above_floor > 9.0) & (zcr < 0.25)) | (above_floor > 15.0)
+    )
+    # Pad each detection and bridge short pauses inside words/phrases
+    voiced = _dilate(voiced, int(max(padding_seconds, merge_gap_seconds / 2) / FRAME_SECONDS))
+
+    padded = np.concatenate(([False], voiced, [False]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    starts, ends = edges[::2] * FRAME_SECONDS, edges[1::2] * FRAME_SECONDS
+    duration = len(samples) / sample_rate
+    return [
+        (round(float(start), 3), round(float(min(end, duration)), 3))
+        for start, end in zip(starts, ends)
+        if end - start >= min_region_seconds
+    ]
+
+
+def build_trimmed_clip(samples, sample_rate, regions, gap_seconds=0.3):
+    """Concatenate regions with silent gaps.
+
+    Returns (trimmed_samples, offsets) where each offset is
+    (trimmed_start, original_start, duration) in seconds.
+    """
+    gap = np.zeros(int(sample_rate * gap_seconds), dtype=np.float32)
+    pieces = []
+    offsets = []
+    position = 0.0
+    for start, end in regions:
+        piece = samples[int(start * sample_rate):int(end * sample_rate)]
+        if pieces:
+            pieces.append(gap)
+            position += gap_seconds
+        pieces.append(piece)
+        offsets.append((position, start, len(piece) / sample_rate))
+        position += len(piece) / sample_rate
+    if not pieces:
+        return np.empty(0, dtype=np.float32), []
+    return np.concatenate(pieces).astype(np.float32, copy=False), offsets
+
+
+def map_to_original(seconds, offsets):
+    """Translate a time in the trimmed clip to the original recording"""
+    if not offsets:
+        return seconds
+    trimmed_starts = [offset[0] for offset in offsets]
+    index = max(int(np.searchsorted(trimmed_starts, seconds, side="right")) - 1, 0)
+    trimmed_start, original_start, duration = offsets[index]
+    # Times falling in a spliced gap snap to the end of the preceding region
+    return round(original_start + min(max(seconds - trimmed_start, 0.0), duration), 2)
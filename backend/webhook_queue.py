@@ -0,0 +1,216 @@
+"""Durable, deduplicated PayPal webhook ingestion.
+
+The webhook endpoint only appends the event to ``webhook_events`` (keyed by
+PayPal's event id, so retries are no-ops) and acknowledges. A background
+consumer claims pending events in batches, coalesces all events for the same
+subscription into one final state, and applies them with a single
+``bulk_write``. Claims carry a lease so several workers can run consumers and
+a crashed one's batch is picked up again.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# event_type -> (status, paypal_status)
+SUBSCRIPTION_EVENTS = {
+    "BILLING.SUBSCRIPTION.ACTIVATED": ("active", "ACTIVE"),
+    "BILLING.SUBSCRIPTION.CANCELLED": ("cancelled", "CANCELLED"),
+    "BILLING.SUBSCRIPTION.SUSPENDED": ("suspended", "SUSPENDED"),
+}
+
+
+def event_id(event):
+    """PayPal's event id, or a content hash for events that lack one"""
+    if event.get("id"):
+        return event["id"]
+    return "sha256:" + hashlib.sha256(json.dumps(event, sort_keys=True).encode()).hexdigest()
+
+
+def coalesce(events):
+    """Fold events (oldest first) into one UpdateOne per subscription.
+
+    Returns (operations, user_ids, paypal_subscription_ids) touched by the batch.
+    """
+    merged = {}
+    for event in events:
+        status = SUBSCRIPTION_EVENTS.get(event["event_type"])
+        subscription_id = (event.get("resource") or {}).get("id")
+        if not status or not subscription_id:
+            continue
+
+        entry = merged.setdefault(subscription_id, {"user_id": None, "fields": {}})
+        entry["fields"].update({
+            "status": status[0],
+            "paypal_status": status[1],
+            "updated_at": event["received_at"].isoformat(),
+        })
+        custom_id = event["resource"].get("custom_id")  # This is our user_id
+        if event["event_type"] == "BILLING.SUBSCRIPTION.ACTIVATED" and custom_id:
+            entry["user_id"] = custom_id
+
+    operations = []
+    user_ids = set()
+    for subscription_id, entry in merged.items():
+        if entry["user_id"]:
+            user_ids.add(entry["user_id"])
+            operations.append(UpdateOne(
+                {"user_id": entry["user_id"]},
+                {"$set": {**entry["fields"], "user_id": entry["user_id"], "paypal_subscription_id": subscription_id}},
+                upsert=True,
+            ))
+        else:
+            operations.append(UpdateOne(
+                {"paypal_subscription_id": subscription_id},
+                {"$set": entry["fields"]},
+            ))
+    return operations, user_ids, list(merged)
+
+
+class WebhookQueue:
+    def __init__(self, events, subscriptions, on_applied=None, batch_size=500,
+                 poll_interval=1.0, lease_seconds=60):
+        self.events = events
+        self.subscriptions = subscriptions
+        self.on_applied = on_applied
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self._stats = {
+            "received": 0,
+            "duplicates": 0,
+            "applied_events": 0,
+            "batches": 0,
+            "subscription_writes": 0,
+            "last_batch_max_lag_seconds": 0.0,
+        }
+
+    async def enqueue(self, event):
+        """Durably record an event; returns False if it was already received"""
+        doc = {
+            "_id": event_id(event),
+            "event_type": event.get("event_type"),
+            "resource": event.get("resource", {}),
+            "status": "pending",
+            "received_at": datetime.utcnow(),
+        }
+        try:
+            await self.events.insert_one(doc)
+        except DuplicateKeyError:
+            self._stats["duplicates"] += 1
+            return False
+        self._stats["received"] += 1
+        self._wakeup.set()
+        return True
+
+    async def _claim(self):
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        candidates = await self.events.find(
+            {
+                "$or": [
+                    {"status": "pending"},
+                    {"status": "processing", "lease_expires_at": {"$lt": now}},
+                ]
+            },
+            {"_id": 1},
+        ).sort("received_at", 1).limit(self.batch_size).to_list(length=self.batch_size)
+        if not candidates:
+            return []
+
+        # Re-check status in the update so two consumers never claim the same event
+        await self.events.update_many(
+            {
+                "_id": {"$in": [doc["_id"] for doc in candidates]},
+                "$or": [
+                    {"status": "pending"},
+                    {"status": "processing", "lease_expires_at": {"$lt": now}},
+                ],
+            },
+            {"$set": {
+                "status": "processing",
+                "claimed_by": token,
+                "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+            }},
+        )
+        return await self.events.find({"claimed_by": token, "status": "processing"}).sort("received_at", 1).to_list(length=None)
+
+    async def process_batch(self):
+        """Apply one batch of pending events; returns how many were handled"""
+        events = await self._claim()
+        if not events:
+            return 0
+
+        operations, user_ids, subscription_ids = coalesce(events)
+        if operations:
+            await self.subscriptions.bulk_write(operations, ordered=False)
+            # Cancel/suspend events only carry the PayPal id; resolve the owners
+            async for doc in self.subscriptions.find(
+                {"paypal_subscription_id": {"$in": subscription_ids}}, {"user_id": 1}
+            ):
+                user_ids.add(doc.get("user_id"))
+
+        now = datetime.utcnow()
+        await self.events.update_many(
+            {"_id": {"$in": [event["_id"] for event in events]}},
+            {"$set": {"status": "processed", "processed_at": now}, "$unset": {"claimed_by": "", "lease_expires_at": ""}},
+        )
+
+        self._stats["batches"] += 1
+        self._stats["applied_events"] += len(events)
+        self._stats["subscription_writes"] += len(operations)
+        self._stats["last_batch_max_lag_seconds"] = round(
+            max((now - event["received_at"]).total_seconds() for event in events), 3
+        )
+
+        if self.on_applied:
+            for user_id in user_ids:
+                if user_id:
+                    await self.on_applied(user_id)
+        return len(events)
+
+    async def _consume(self):
+        while True:
+            # Cleared before the batch so events arriving mid-batch still wake us
+            self._wakeup.clear()
+            try:
+                handled = await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Webhook batch failed; it will be retried after the lease expires")
+                handled = 0
+
+            if handled < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        self._task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def metrics(self):
+        pending = await self.events.count_documents({"status": {"$in": ["pending", "processing"]}})
+        oldest = await self.events.find_one({"status": {"$in": ["pending", "processing"]}}, sort=[("received_at", 1)])
+        lag = (datetime.utcnow() - oldest["received_at"]).total_seconds() if oldest else 0.0
+        return {
+            "pending": pending,
+            "lag_seconds": round(lag, 3),
+            **self._stats,
+        }
@@ -0,0 +1,131 @@
+"""Streaming ZIP writer.
+
+``ZipStream`` produces a ZIP archive as a sequence of byte strings without
+ever seeking or holding more than the chunk being written: each entry's CRC
+and sizes go in a data descriptor after its data, and the central directory
+is emitted at the end. Archives past 4 GiB or 65535 entries get ZIP64 end
+records; individual entries must stay under 4 GiB.
+"""
+import struct
+import zlib
+from datetime import datetime
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ENTRY_LIMIT = 0xFFFF
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+STORED = 0
+DEFLATED = 8
+
+
+def _dos_datetime(moment):
+    moment = max(moment, datetime(1980, 1, 1))
+    dos_time = moment.hour << 11 | moment.minute << 5 | moment.second // 2
+    dos_date = (moment.year - 1980) << 9 | moment.month << 5 | moment.day
+    return dos_time, dos_date
+
+
+class ZipStream:
+    def __init__(self):
+        self._entries = []
+        self._offset = 0
+        self._current = None
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def start_entry(self, name, compress=False, modified=None):
+        """Local file header for a new entry"""
+        if self._current:
+            raise RuntimeError("Previous entry was not ended")
+        encoded_name = name.encode("utf-8")
+        dos_time, dos_date = _dos_datetime(modified or datetime.utcnow())
+        self._current = {
+            "name": encoded_name,
+            "method": DEFLATED if compress else STORED,
+            "time": dos_time,
+            "date": dos_date,
+            "offset": self._offset,
+            "crc": 0,
+            "size": 0,
+            "compressed_size": 0,
+            "compressor": zlib.compressobj(6, zlib.DEFLATED, -15) if compress else None,
+        }
+        header = struct.pack(
+            "<IHHHHHIIIHH",
+            0x04034B50, 20, FLAG_DATA_DESCRIPTOR | FLAG_UTF8, self._current["method"],
+            dos_time, dos_date, 0, 0, 0, len(encoded_name), 0,
+        )
+        return self._emit(header + encoded_name)
+
+    def write(self, data):
+        """Entry data for ``data`` (possibly empty while the compressor buffers)"""
+        entry = self._current
+        entry["crc"] = zlib.crc32(data, entry["crc"])
+        entry["size"] += len(data)
+        if entry["compressor"]:
+            data = entry["compressor"].compress(data)
+        entry["compressed_size"] += len(data)
+        if entry["size"] > ZIP32_LIMIT or entry["compressed_size"] > ZIP32_LIMIT:
+            raise ValueError("ZIP entries are limited to 4 GiB")
+        return self._emit(data)
+
+    def end_entry(self):
+        """Flushes the entry and returns its data descriptor"""
+        entry = self._current
+        tail = b""
+        if entry["compressor"]:
+            tail = entry["compressor"].flush()
+            entry["compressed_size"] += len(tail)
+        descriptor = struct.pack(
+            "<IIII", 0x08074B50, entry["crc"], entry["compressed_size"], entry["size"]
+        )
+        self._entries.append(entry)
+        self._current = None
+        return self._emit(tail + descriptor)
+
+    def add(self, name, data, compress=True, modified=None):
+        """A whole small entry in one call"""
+        return self.start_entry(name, compress, modified) + self.write(data) + self.end_entry()
+
+    def finish(self):
+        """Central directory and end-of-archive records"""
+        if self._current:
+            raise RuntimeError("Last entry was not ended")
+        directory_offset = self._offset
+        records = []
+        for entry in self._entries:
+            extra = b""
+            offset = entry["offset"]
+            if offset > ZIP32_LIMIT:
+                extra = struct.pack("<HHQ", 0x0001, 8, offset)
+                offset = ZIP32_LIMIT
+            version = 45 if extra else 20
+            records.append(struct.pack(
+                "<IHHHHHHIIIHHHHHII",
+                0x02014B50, version, version, FLAG_DATA_DESCRIPTOR | FLAG_UTF8, entry["method"],
+                entry["time"], entry["date"], entry["crc"], entry["compressed_size"], entry["size"],
+                len(entry["name"]), len(extra), 0, 0, 0, 0, offset,
+            ) + entry["name"] + extra)
+        directory = b"".join(records)
+        directory_size = len(directory)
+        count = len(self._entries)
+        output = directory
+
+        if count >= ENTRY_LIMIT or directory_offset >= ZIP32_LIMIT or directory_size >= ZIP32_LIMIT:
+            zip64_offset = directory_offset + directory_size
+            output += struct.pack(
+                "<IQHHIIQQQQ",
+                0x06064B50, 44, 45, 45, 0, 0, count, count, directory_size, directory_offset,
+            )
+            output += struct.pack("<IIQI", 0x07064B50, 0, zip64_offset, 1)
+            count = min(count, ENTRY_LIMIT)
+            directory_size = min(directory_size, ZIP32_LIMIT)
+            directory_offset = min(directory_offset, ZIP32_LIMIT)
+
+        output += struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, count, count, directory_size, directory_offset, 0
+        )
+        return self._emit(output)
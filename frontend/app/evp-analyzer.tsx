@@ -238,18 +238,20 @@ export default function EVPAnalyzerScreen() {
                   <Text style={styles.analysisText}>{rec.analysis.ai_analysis}</Text>
                 </View>
 
-                <View style={styles.confidenceContainer}>
-                  <Text style={styles.confidenceLabel}>Confidence:</Text>
-                  <View style={styles.confidenceBar}>
-                    <View
-                      style={[
-                        styles.confidenceBarFill,
-                        { width: `${rec.analysis.confidence}%` },
-                      ]}
-                    />
+                {rec.analysis.confidence != null && (
+                  <View style={styles.confidenceContainer}>
+                    <Text style={styles.confidenceLabel}>Confidence:</Text>
+                    <View style={styles.confidenceBar}>
+                      <View
+                        style={[
+                          styles.confidenceBarFill,
+                          { width: `${rec.analysis.confidence}%` },
+                        ]}
+                      />
+                    </View>
+                    <Text style={styles.confidenceValue}>{rec.analysis.confidence}%</Text>
                   </View>
-                  <Text style={styles.confidenceValue}>{rec.analysis.confidence}%</Text>
-                </View>
+                )}
               </View>
             )}
           </View>
@@ -32,11 +32,23 @@ export default function SessionsScreen() {
   const loadSessions = async () => {
     try {
       setIsLoading(true);
-      const response = await fetch(`${BACKEND_URL}/api/sessions`);
-      const data = await response.json();
-      if (data.success) {
-        setSessions(data.sessions);
-      }
+      // The list is paginated; follow next_cursor until every session is loaded
+      const allSessions: any[] = [];
+      let cursor: string | null = null;
+      do {
+        const params = new URLSearchParams({ limit: '200' });
+        if (cursor) {
+          params.set('cursor', cursor);
+        }
+        const response = await fetch(`${BACKEND_URL}/api/sessions?${params}`);
+        const data = await response.json();
+        if (!data.success) {
+          return;
+        }
+        allSessions.push(...data.sessions);
+        cursor = data.next_cursor ?? null;
+      } while (cursor);
+      setSessions(allSessions);
     } catch (error) {
       console.error('Error loading sessions:', error);
       Alert.alert('Error', 'Failed to load sessions');
@@ -0,0 +1,87 @@
+import numpy as np
+
+from chunking import FRAME_SECONDS, plan_chunks, stitch_segments
+
+SR = 1000
+
+
+def noise(seconds, seed=0):
+    return np.random.default_rng(seed).uniform(-0.5, 0.5, int(seconds * SR)).astype(np.float32)
+
+
+def test_short_recording_is_one_chunk():
+    samples = noise(12)
+    assert plan_chunks(samples, SR, chunk_seconds=10) == [(0, len(samples), 0, len(samples))]
+
+
+def test_chunks_cover_the_recording_and_overlap():
+    samples = noise(95)
+    chunks = plan_chunks(samples, SR, chunk_seconds=20, overlap_seconds=2, search_seconds=5)
+
+    assert chunks[0][2] == 0 and chunks[-1][3] == len(samples)
+    for (_, _, _, owned_end), (_, _, owned_start, _) in zip(chunks, chunks[1:]):
+        assert owned_end == owned_start
+    for start, end, owned_start, owned_end in chunks:
+        assert start == max(owned_start - 2 * SR, 0)
+        assert end == min(owned_end + 2 * SR, len(samples))
+        # No chunk is longer than asked, and the last is not a sliver
+        assert owned_end - owned_start <= 20 * SR * 1.25
+
+
+def test_cuts_land_in_pauses():
+    samples = noise(50)
+    samples[int(17 * SR):int(18 * SR)] = 0.0  # a pause within the search window
+    chunks = plan_chunks(samples, SR, chunk_seconds=20, search_seconds=5)
+
+    cut = chunks[0][3]
+    assert 17 * SR <= cut <= 18 * SR
+    assert cut % int(SR * FRAME_SECONDS) == 0
+
+
+def test_stitch_keeps_segments_by_midpoint():
+    # Owned spans [0, 10) and [10, 20); the second chunk starts 2s early
+    chunks = [(0, 12000, 0, 10000), (8000, 20000, 10000, 20000)]
+    results = [
+        [
+            {"start": 0.0, "end": 4.0, "text": " is anyone here"},
+            {"start": 9.5, "end": 11.5, "text": " past the cut"},  # midpoint 10.5: the next chunk's
+        ],
+        [
+            {"start": 0.0, "end": 1.0, "text": " lead in"},  # midpoint 8.5: the first chunk's
+            {"start": 1.5, "end": 3.5, "text": "past the cut"},
+            {"start": 5.0, "end": 12.5, "text": "give us a sign"},
+        ],
+    ]
+
+    assert stitch_segments(chunks, results, SR) == [
+        {"start": 0.0, "end": 4.0, "text": "is anyone here"},
+        {"start": 9.5, "end": 11.5, "text": "past the cut"},
+        {"start": 13.0, "end": 20.5, "text": "give us a sign"},
+    ]
+
+
+def test_stitch_drops_words_repeated_across_the_seam():
+    chunks = [(0, 12000, 0, 10000), (8000, 20000, 10000, 20000)]
+    results = [
+        [{"start": 6.0, "end": 9.9, "text": "who is there"}],
+        [
+            {"start": 2.0, "end": 5.0, "text": "Is there, anybody?"},
+            {"start": 6.0, "end": 8.0, "text": "there there"},  # not at the seam: kept as heard
+        ],
+    ]
+
+    assert stitch_segments(chunks, results, SR) == [
+        {"start": 6.0, "end": 9.9, "text": "who is there"},
+        {"start": 10.0, "end": 13.0, "text": "anybody?"},
+        {"start": 14.0, "end": 16.0, "text": "there there"},
+    ]
+
+
+def test_stitch_drops_segments_that_were_all_repeat():
+    chunks = [(0, 12000, 0, 10000), (8000, 20000, 10000, 20000)]
+    results = [
+        [{"start": 5.0, "end": 9.8, "text": "hello"}],
+        [{"start": 2.0, "end": 2.6, "text": "Hello."}, {"start": 4.0, "end": 6.0, "text": "goodbye"}],
+    ]
+
+    assert [segment["text"] for segment in stitch_segments(chunks, results, SR)] == ["hello", "goodbye"]
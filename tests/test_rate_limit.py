@@ -0,0 +1,195 @@
+import asyncio
+
+import pytest
+
+import rate_limit
+from rate_limit import AdmissionController, BucketLimit, MemoryBucketStore, RateLimited
+
+
+class FakeClock:
+    """Drives time.monotonic() and asyncio.sleep() so queueing is instant"""
+
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        monkeypatch.setattr(rate_limit.time, "monotonic", lambda: self.now)
+        monkeypatch.setattr(rate_limit.asyncio, "sleep", self.sleep)
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    return FakeClock(monkeypatch)
+
+
+def controller(user="60/2", global_limit="600/100", max_wait_seconds=0.0):
+    decisions = []
+    admission = AdmissionController(
+        MemoryBucketStore(),
+        {"free": BucketLimit.parse(user)},
+        BucketLimit.parse(global_limit),
+        max_wait_seconds=max_wait_seconds,
+        on_decision=lambda tier, outcome, waited: decisions.append(outcome),
+    )
+    return admission, decisions
+
+
+def test_parse():
+    limit = BucketLimit.parse("30/10")
+    assert limit.describe() == {"per_minute": 30, "burst": 10.0}
+    assert BucketLimit.parse("12").capacity == 12.0
+
+
+def test_memory_store_refills_and_caps(clock):
+    store = MemoryBucketStore()
+    limit = BucketLimit(60, 2)
+
+    async def run():
+        assert await store.take("k", limit) == 0.0
+        assert await store.take("k", limit) == 0.0
+        assert await store.take("k", limit) == pytest.approx(1.0)
+        clock.now += 0.5
+        assert await store.take("k", limit) == pytest.approx(0.5)
+        clock.now += 60
+        # Refilled to capacity, not beyond
+        assert await store.take("k", limit, cost=2) == 0.0
+        assert await store.take("k", limit) == pytest.approx(1.0)
+        await store.refund("k", limit, 5)
+        assert store._buckets["k"][0] == limit.capacity
+
+    asyncio.run(run())
+
+
+def test_rejects_with_retry_after_once_burst_is_spent(clock):
+    admission, decisions = controller()
+
+    async def run():
+        await admission.admit("u1", "free")
+        await admission.admit("u1", "free")
+        with pytest.raises(RateLimited) as rejected:
+            await admission.admit("u1", "free")
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.scope == "user"
+    assert rejected.retry_after == pytest.approx(1.0)
+    assert decisions == ["admitted", "admitted", "rejected_user"]
+    # Other users have their own bucket
+    asyncio.run(admission.admit("u2", "free"))
+
+
+def test_batch_is_charged_per_item(clock):
+    admission, decisions = controller(user="60/3")
+
+    async def run():
+        outcomes = []
+        for _ in range(5):
+            try:
+                await admission.admit("u1", "free")
+                outcomes.append(True)
+            except RateLimited:
+                outcomes.append(False)
+        return outcomes
+
+    assert asyncio.run(run()) == [True, True, True, False, False]
+
+
+def test_cost_above_burst_is_refused(clock):
+    admission, _ = controller(user="60/2")
+    with pytest.raises(ValueError):
+        asyncio.run(admission.admit("u1", "free", cost=3))
+    admission, _ = controller(user="600/100", global_limit="60/2")
+    with pytest.raises(ValueError):
+        asyncio.run(admission.admit("u1", "free", cost=3))
+
+
+def test_global_bucket_rejects_and_refunds_user(clock):
+    admission, decisions = controller(user="60/5", global_limit="60/1")
+
+    async def run():
+        await admission.admit("u1", "free")
+        with pytest.raises(RateLimited) as rejected:
+            await admission.admit("u2", "free")
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.scope == "global"
+    assert decisions == ["admitted", "rejected_global"]
+    assert admission.store._buckets["user:u2"][0] == 5.0
+
+
+def test_queue_waits_for_global_without_draining_user(clock):
+    admission, decisions = controller(user="60/2", global_limit="6/1", max_wait_seconds=30)
+
+    async def run():
+        await admission.admit("other", "free")
+        started = clock.now
+        # The global bucket needs 10s; every retry before then must be refunded
+        await admission.admit("u1", "free", queue=True)
+        return clock.now - started
+
+    waited = asyncio.run(run())
+    assert waited == pytest.approx(10.0)
+    assert decisions == ["admitted", "admitted"]
+    # Only the one admitted request was charged to the user
+    assert admission.store._buckets["user:u1"][0] == pytest.approx(1.0)
+    stats = admission.stats()
+    assert stats["queued"] == 1
+    assert stats["wait_seconds_total"] == pytest.approx(10.0)
+
+
+def test_queue_gives_up_past_max_wait(clock):
+    admission, decisions = controller(user="60/5", global_limit="6/1", max_wait_seconds=5)
+
+    async def run():
+        await admission.admit("other", "free")
+        with pytest.raises(RateLimited) as rejected:
+            await admission.admit("u1", "free", queue=True)
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.scope == "global"
+    assert rejected.retry_after == pytest.approx(10.0)
+    assert clock.now == 1000.0
+    assert admission.store._buckets["user:u1"][0] == 5.0
+
+
+def test_memory_store_evicts_least_recently_used_but_keeps_global(clock):
+    store = MemoryBucketStore(max_entries=3)
+    free, global_limit = BucketLimit(60, 2), BucketLimit(600, 100)
+
+    async def run():
+        await store.take(rate_limit.GLOBAL_KEY, global_limit)
+        for user in ("a", "b", "c", "d"):
+            clock.now += 1
+            await store.take(f"user:{user}", free)
+
+    asyncio.run(run())
+    assert set(store._buckets) == {rate_limit.GLOBAL_KEY, "user:c", "user:d"}
+    # Each entry keeps its own limit, so the global bucket was not capped to the free tier
+    assert store._buckets[rate_limit.GLOBAL_KEY][0] == 99.0
+
+
+def test_unverified_user_ids_share_the_client_bucket(monkeypatch, clock):
+    import server
+
+    async def lookup_subscription_status(user_id):
+        return {"is_subscribed": user_id == "subscriber"}
+
+    admission, _ = controller(user="60/2")
+    admission.tiers["subscriber"] = BucketLimit.parse("60/5")
+    monkeypatch.setattr(server, "AI_RATE_LIMIT", True)
+    monkeypatch.setattr(server, "ai_admission", admission)
+    monkeypatch.setattr(server, "lookup_subscription_status", lookup_subscription_status)
+    client = type("Client", (), {"host": "203.0.113.7"})()
+
+    async def run():
+        await server.admit_ai_call("random-1", client)
+        await server.admit_ai_call("random-2", client)
+        with pytest.raises(RateLimited):
+            await server.admit_ai_call("random-3", client)
+        await server.admit_ai_call("subscriber", client)
+
+    asyncio.run(run())
+    assert set(admission.store._buckets) == {"user:ip:203.0.113.7", "user:subscriber", rate_limit.GLOBAL_KEY}
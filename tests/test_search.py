@@ -0,0 +1,52 @@
+import pytest
+
+from search import MAX_QUERY_TERMS, SearchQueryError, build_filter, parse_query, snippet, tokenize
+
+
+def test_tokenize_lowercases_and_keeps_contractions():
+    assert tokenize("Get OUT, don't stay!") == ["get", "out", "don't", "stay"]
+    assert tokenize(None) == []
+
+
+def test_parse_query_splits_phrases_words_and_prefixes():
+    phrases, words, prefixes = parse_query('"Get Out" help whisp* me')
+    assert phrases == ["get out"]
+    assert words == ["help", "me"]
+    assert prefixes == ["whisp"]
+
+
+def test_parse_query_ignores_empty_phrases_and_punctuation():
+    assert parse_query('"" ... hello') == ([], ["hello"], [])
+    # A star on a multi-token word is not a prefix
+    assert parse_query("o'clock-tower*") == ([], ["o'clock", "tower"], [])
+
+
+@pytest.mark.parametrize("query", ["", "   ", '""', "?!", "a*"])
+def test_parse_query_rejects_unusable_queries(query):
+    with pytest.raises(SearchQueryError):
+        parse_query(query)
+
+
+def test_parse_query_limits_terms():
+    parse_query(" ".join(f"w{i}" for i in range(MAX_QUERY_TERMS)))
+    with pytest.raises(SearchQueryError):
+        parse_query(" ".join(f"w{i}" for i in range(MAX_QUERY_TERMS + 1)))
+
+
+def test_build_filter():
+    query, ranked = build_filter(["get out"], ["help"], ["whi.sp"])
+    assert ranked
+    assert query["$text"] == {"$search": '"get out" help'}
+    assert query["$and"] == [{"terms": {"$regex": r"^whi\.sp"}}]
+
+    query, ranked = build_filter([], [], ["whisp"])
+    assert not ranked and "$text" not in query
+
+
+def test_snippet_centers_on_the_match():
+    text = "static " * 20 + "GET OUT of this house" + " static" * 20
+    excerpt = snippet(text, ["get out"])
+    assert "GET OUT" in excerpt
+    assert excerpt.startswith("…") and excerpt.endswith("…")
+    assert snippet("short", ["missing"]) == "short"
+    assert snippet(None, ["x"]) == ""
@@ -0,0 +1,31 @@
+import serve
+
+SET_BY_CONFIGURE = ("MONGO_MAX_POOL_SIZE", "MONGO_MIN_POOL_SIZE", "SUBSCRIPTION_CACHE_CHANNEL", "AI_RATE_LIMIT_BACKEND")
+
+
+def isolate_env(monkeypatch):
+    # monkeypatch restores whatever configure() sets
+    for name in SET_BY_CONFIGURE:
+        monkeypatch.setenv(name, "unset")
+        monkeypatch.delenv(name)
+
+
+def test_operator_multiproc_dir_keeps_other_files(monkeypatch, tmp_path):
+    isolate_env(monkeypatch)
+    (tmp_path / "counter_123.db").write_bytes(b"stale")
+    (tmp_path / "notes.txt").write_text("not ours")
+    (tmp_path / "nested").mkdir()
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+    assert serve.configure(4, 200) == str(tmp_path)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["nested", "notes.txt"]
+
+
+def test_pool_budget_is_split_between_workers(monkeypatch, tmp_path):
+    isolate_env(monkeypatch)
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+    serve.configure(8, 200)
+    assert serve.os.environ["MONGO_MAX_POOL_SIZE"] == "25"
+    assert serve.os.environ["MONGO_MIN_POOL_SIZE"] == "4"
+    assert serve.os.environ["SUBSCRIPTION_CACHE_CHANNEL"] == "mongo"
@@ -0,0 +1,61 @@
+import base64
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from server import decode_cursor, encode_cursor, parse_range_header
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=0-", (0, 999)),
+    ("bytes=500-", (500, 999)),
+    ("bytes=900-5000", (900, 999)),  # clamped to the last byte
+    ("bytes=-100", (900, 999)),  # suffix range
+    ("bytes=-5000", (0, 999)),
+    (" bytes = 10-10", (10, 10)),
+])
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=1000-", 1000),
+    ("bytes=50-10", 1000),
+    ("bytes=-0", 1000),
+    ("bytes=0-1,5-9", 1000),
+    ("items=0-1", 1000),
+    ("bytes=a-b", 1000),
+    ("bytes=0-", 0),
+])
+def test_parse_range_header_unsatisfiable(header, size):
+    with pytest.raises(HTTPException) as error:
+        parse_range_header(header, size)
+    assert error.value.status_code == 416
+    assert error.value.headers == {"Content-Range": f"bytes */{size}"}
+
+
+def test_cursor_round_trip():
+    doc = {"_id": ObjectId(), "created_at": datetime(2024, 10, 31, 23, 59, 59, 123000).isoformat()}
+    cursor = encode_cursor(doc)
+
+    assert "/" not in cursor and "+" not in cursor  # safe in a query string
+    assert decode_cursor(cursor) == (doc["created_at"], doc["_id"])
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    base64.urlsafe_b64encode(b'{"c": "2024-01-01"}').decode(),
+    base64.urlsafe_b64encode(b'{"c": "2024-01-01", "i": "nope"}').decode(),
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_cursor_for_rows_without_created_at():
+    doc = {"_id": ObjectId()}
+    assert decode_cursor(encode_cursor(doc)) == (None, doc["_id"])
@@ -0,0 +1,69 @@
+import numpy as np
+
+from streaming import SilenceSegmenter
+
+SR = 16000
+
+
+def tone(seconds):
+    t = np.arange(int(seconds * SR)) / SR
+    return (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SR), dtype=np.float32)
+
+
+def feed_in_chunks(segmenter, samples, chunk=1234):
+    segments = []
+    for start in range(0, len(samples), chunk):
+        segments += segmenter.feed(samples[start:start + chunk])
+    return segments
+
+
+def test_utterances_are_cut_at_pauses():
+    segmenter = SilenceSegmenter(SR)
+    audio = np.concatenate((silence(2), tone(1), silence(1), tone(0.5), silence(1)))
+    segments = feed_in_chunks(segmenter, audio)
+
+    assert len(segments) == 2
+    (first_start, first), (second_start, second) = segments
+    # Each keeps a 200 ms pre-roll and ends after the 600 ms pause
+    assert 1.75 * SR <= first_start <= 1.8 * SR
+    assert abs((first_start + len(first)) / SR - 3.6) < 0.05
+    assert second_start == int(3.8 * SR)  # the silence in between is not resent
+    assert 0.5 * SR < len(second) < 1.5 * SR
+    assert segmenter.flush() == []
+
+
+def test_speech_still_open_at_the_end_is_flushed():
+    segmenter = SilenceSegmenter(SR)
+    segments = feed_in_chunks(segmenter, np.concatenate((silence(0.5), tone(1))))
+    assert segments == []
+    [(start, samples)] = segmenter.flush()
+    assert start + len(samples) == int(1.5 * SR)
+
+
+def test_long_speech_is_split_at_max_segment():
+    segmenter = SilenceSegmenter(SR, max_segment_ms=5000)
+    segments = feed_in_chunks(segmenter, tone(12), chunk=SR)
+    assert [len(samples) for _, samples in segments] == [5 * SR, 5 * SR]
+
+
+def test_click_then_silence_is_dropped():
+    segmenter = SilenceSegmenter(SR)
+    audio = np.concatenate((silence(0.5), tone(0.04), silence(40)))
+    segments = feed_in_chunks(segmenter, audio, chunk=SR // 10)
+
+    assert segments == []
+    assert segmenter.flush() == []
+    # Only the pre-roll is buffered, not 40 s of silence
+    assert len(segmenter._buffer) < 0.5 * SR
+
+
+def test_click_does_not_leak_into_the_next_utterance():
+    segmenter = SilenceSegmenter(SR)
+    audio = np.concatenate((tone(0.04), silence(2), tone(1), silence(1)))
+    [(start, samples)] = feed_in_chunks(segmenter, audio)
+    assert start >= 1.8 * SR
+    assert len(samples) < 2 * SR
@@ -0,0 +1,98 @@
+import asyncio
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+import subscription_cache
+from subscription_cache import LocalChannel, MongoChannel, SubscriptionCache
+
+SUBSCRIBED = {"is_subscribed": True, "status": "active"}
+NOT_SUBSCRIBED = {"is_subscribed": False, "status": None}
+
+
+class FakeClock:
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        monkeypatch.setattr(subscription_cache.time, "monotonic", lambda: self.now)
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    clock = FakeClock(monkeypatch)
+    cache = SubscriptionCache(LocalChannel(), ttl_seconds=60, negative_ttl_seconds=10)
+    cache.set("subscriber", SUBSCRIBED, cache.generation())
+    cache.set("free", NOT_SUBSCRIBED, cache.generation())
+
+    assert cache.get("subscriber") == SUBSCRIBED
+    assert cache.get("free") == NOT_SUBSCRIBED
+    clock.now += 11
+    # Non-subscribers expire sooner so a new purchase shows up quickly
+    assert cache.get("free") is None
+    assert cache.get("subscriber") == SUBSCRIBED
+    clock.now += 50
+    assert cache.get("subscriber") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["negative_hits"], stats["misses"]) == (2, 1, 2)
+
+
+def test_lookup_racing_an_invalidation_is_not_cached():
+    cache = SubscriptionCache(LocalChannel())
+    generation = cache.generation()
+    asyncio.run(cache.invalidate("user-1"))
+    cache.set("user-1", NOT_SUBSCRIBED, generation)
+    assert cache.get("user-1") is None
+
+
+def test_invalidation_reaches_other_caches_on_the_channel():
+    channel = LocalChannel()
+    ours, theirs = SubscriptionCache(channel), SubscriptionCache(channel)
+    theirs.set("user-1", NOT_SUBSCRIBED, theirs.generation())
+
+    asyncio.run(ours.invalidate("user-1"))
+    assert theirs.get("user-1") is None
+
+
+def test_max_entries_evicts_least_recently_used():
+    cache = SubscriptionCache(LocalChannel(), max_entries=2)
+    for user_id in ("a", "b"):
+        cache.set(user_id, SUBSCRIBED, cache.generation())
+    cache.get("a")
+    cache.set("c", SUBSCRIBED, cache.generation())
+    assert cache.get("b") is None
+    assert cache.get("a") == cache.get("c") == SUBSCRIBED
+
+
+def test_mongo_channel_connects_in_the_background(monkeypatch):
+    real_sleep = asyncio.sleep
+    delays = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+        await real_sleep(0)
+
+    monkeypatch.setattr(subscription_cache.asyncio, "sleep", sleep)
+    channel = MongoChannel(db=None, max_retry_seconds=3)
+    attempts = []
+    tailed = asyncio.Event()
+
+    async def open_channel():
+        attempts.append(1)
+        if len(attempts) < 4:
+            raise ServerSelectionTimeoutError("no servers")
+        return "seed-id"
+
+    async def tail(last_id):
+        assert last_id == "seed-id"
+        tailed.set()
+
+    channel._open = open_channel
+    channel._tail = tail
+
+    async def run():
+        await channel.start()  # returns at once even though Mongo is down
+        assert not channel.connected
+        await asyncio.wait_for(tailed.wait(), 1)
+        await channel.stop()
+
+    asyncio.run(run())
+    assert channel.connected
+    assert delays == [1.0, 2.0, 3.0]
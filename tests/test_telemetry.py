@@ -0,0 +1,148 @@
+import base64
+
+import numpy as np
+import pytest
+
+from telemetry import (
+    BUCKET_MS, TelemetryError, bucket_updates, channel_values, decode_batch, downsample, downsample_summaries,
+    unpack_buckets,
+)
+
+T0 = 1_700_000_100_000
+
+
+def packed(array, dtype):
+    return base64.b64encode(np.asarray(array, dtype=dtype).tobytes()).decode()
+
+
+def apply(updates, buckets=None):
+    """Minimal in-memory stand-in for the upserts: enough to read them back"""
+    buckets = {} if buckets is None else buckets
+    for query, update in updates:
+        bucket = buckets.setdefault(query["_id"], {"_id": query["_id"], "batches": [], "t": [], "xyz": []})
+        if query["batches"]["$ne"] in bucket["batches"]:
+            continue
+        bucket.update(update["$setOnInsert"])
+        for field, value in update["$min"].items():
+            bucket[field] = min(bucket.get(field, value), value)
+        for field, value in update["$max"].items():
+            bucket[field] = max(bucket.get(field, value), value)
+        for field, value in update["$inc"].items():
+            bucket[field] = bucket.get(field, 0) + value
+        for field, value in update["$push"].items():
+            bucket[field].append(value)
+    return buckets
+
+
+def test_decode_batch_with_interval_and_offsets():
+    xyz = [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    timestamps, decoded = decode_batch(T0, 33.4, packed(xyz, "<f4"))
+    assert timestamps.tolist() == [T0, T0 + 33, T0 + 67]
+    assert decoded.tolist() == xyz
+
+    timestamps, _ = decode_batch(T0, 100, packed(xyz, "<f4"), packed([0, 5, 250], "<u4"))
+    assert timestamps.tolist() == [T0, T0 + 5, T0 + 250]
+
+
+@pytest.mark.parametrize("xyz, offsets, interval", [
+    ("not base64!", None, 100),
+    (packed([1, 2], "<f4"), None, 100),
+    (packed([], "<f4"), None, 100),
+    (packed([1, 2, 3], "<f4"), None, 0),
+    (packed([1, 2, 3], "<f4"), packed([0, 1], "<u4"), 100),
+])
+def test_decode_batch_rejects_malformed_input(xyz, offsets, interval):
+    with pytest.raises(TelemetryError):
+        decode_batch(T0, interval, xyz, offsets)
+
+
+def test_batches_append_into_time_buckets_once():
+    rng = np.random.default_rng(0)
+    buckets = {}
+    # Ten one-second batches at 10 Hz share one five-minute bucket
+    for second in range(10):
+        start = T0 + second * 1000
+        timestamps = start + np.arange(10, dtype=np.int64) * 100
+        apply(bucket_updates("s1", start, timestamps, rng.normal(45, 5, (10, 3)).astype(np.float32)), buckets)
+    retried = bucket_updates("s1", T0, T0 + np.arange(10, dtype=np.int64) * 100, np.ones((10, 3), np.float32))
+    apply(retried, buckets)
+
+    assert list(buckets) == [f"s1:{T0 // BUCKET_MS}"]
+    bucket = buckets[f"s1:{T0 // BUCKET_MS}"]
+    assert bucket["count"] == 100 and len(bucket["t"]) == 10
+    timestamps, xyz = unpack_buckets(list(buckets.values()))
+    assert timestamps.tolist() == (T0 + np.arange(100) * 100).tolist()
+    magnitude = channel_values(xyz, "magnitude")
+    assert bucket["magnitude_min"] == pytest.approx(magnitude.min())
+    assert bucket["magnitude_sum"] == pytest.approx(magnitude.sum(dtype=np.float64), rel=1e-6)
+
+
+def test_batch_spanning_slots_is_split():
+    start = (T0 // BUCKET_MS + 1) * BUCKET_MS - 500
+    timestamps = start + np.arange(10, dtype=np.int64) * 100
+    updates = bucket_updates("s1", start, timestamps, np.ones((10, 3), np.float32))
+    assert [update["$inc"]["count"] for _, update in updates] == [5, 5]
+
+
+def test_unpack_reads_single_payload_buckets():
+    legacy = {"t": np.array([2, 1], "<i8").tobytes(), "xyz": np.array([[2, 2, 2], [1, 1, 1]], "<f4").tobytes()}
+    timestamps, xyz = unpack_buckets([legacy])
+    assert timestamps.tolist() == [1, 2]
+    assert xyz[:, 0].tolist() == [1, 2]
+
+
+def test_channel_values():
+    xyz = np.array([[3, 4, 0]], np.float32)
+    assert channel_values(xyz, "magnitude").tolist() == [5]
+    assert channel_values(xyz, "y").tolist() == [4]
+    with pytest.raises(TelemetryError):
+        channel_values(xyz, "w")
+
+
+def test_downsample_windows():
+    timestamps = np.arange(10, dtype=np.int64) * 100
+    values = np.arange(10, dtype=np.float32)
+    result = downsample(timestamps, values, 0, 1000, 2)
+    assert result["window_ms"] == 500
+    assert result["t"] == [0, 500]
+    assert result["min"] == [0, 5] and result["max"] == [4, 9]
+    assert result["mean"] == [2, 7] and result["count"] == [5, 5]
+
+    # Empty windows are omitted; out of range samples ignored
+    result = downsample(timestamps, values, 0, 10_000, 10)
+    assert result["t"] == [0] and result["count"] == [10]
+    with pytest.raises(TelemetryError):
+        downsample(timestamps, values, 10, 10, 1)
+
+
+def coarse_and_exact(start_ms, end_ms, points):
+    rng = np.random.default_rng(1)
+    timestamps = T0 + np.arange(0, 4 * 3600 * 1000, 1000, dtype=np.int64)
+    xyz = rng.normal(45, 5, (len(timestamps), 3)).astype(np.float32)
+    buckets = list(apply(bucket_updates("s1", T0, timestamps, xyz)).values())
+
+    inside = [b for b in buckets if b["t_min"] >= start_ms and b["t_max"] <= end_ms]
+    edges = [b for b in buckets if b not in inside and b["t_max"] >= start_ms and b["t_min"] <= end_ms]
+    edge_t, edge_xyz = unpack_buckets(edges)
+    coarse = downsample_summaries(inside, edge_t, channel_values(edge_xyz, "magnitude"), start_ms, end_ms, points)
+    exact = downsample(timestamps, channel_values(xyz, "magnitude"), start_ms, end_ms, points)
+    return coarse, exact
+
+
+def test_summaries_match_raw_downsampling_on_bucket_aligned_windows():
+    start_ms = (T0 // BUCKET_MS + 2) * BUCKET_MS
+    coarse, exact = coarse_and_exact(start_ms, start_ms + 36 * BUCKET_MS, 12)
+
+    assert coarse["t"] == exact["t"]
+    assert coarse["count"] == exact["count"]
+    assert coarse["min"] == exact["min"] and coarse["max"] == exact["max"]
+    assert coarse["mean"] == pytest.approx(exact["mean"], abs=1e-3)
+
+
+def test_summaries_count_every_sample_in_range():
+    coarse, exact = coarse_and_exact(T0 + 7 * 60 * 1000, T0 + 3 * 3600 * 1000, 12)
+
+    assert coarse["t"] == exact["t"]
+    # Buckets straddling a window boundary land wholly in one of them
+    assert sum(coarse["count"]) == sum(exact["count"])
+    assert min(coarse["min"]) == min(exact["min"]) and max(coarse["max"]) == max(exact["max"])
@@ -0,0 +1,129 @@
+import asyncio
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+from transcription_cache import TranscriptionCache, transcription_key
+
+
+class FakeCollection:
+    def __init__(self, fail=False):
+        self.docs = {}
+        self.fail = fail
+
+    async def find_one(self, query, projection=None):
+        if self.fail:
+            raise ServerSelectionTimeoutError("no servers")
+        return self.docs.get(query["_id"])
+
+    async def update_one(self, query, update, upsert=False):
+        if self.fail:
+            raise ServerSelectionTimeoutError("no servers")
+        self.docs[query["_id"]] = {"_id": query["_id"], **update["$set"]}
+
+
+class Upstream:
+    def __init__(self, text="is anyone here", error=None):
+        self.calls = 0
+        self.text = text
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.text
+
+
+def test_key_depends_on_audio_and_format():
+    assert transcription_key(b"a") == transcription_key(b"a")
+    assert transcription_key(b"a") != transcription_key(b"b")
+    assert transcription_key(b"a") != transcription_key(b"a", response_format="verbose_json")
+
+
+def test_hits_memory_then_mongo():
+    collection = FakeCollection()
+    cache = TranscriptionCache(collection, max_entries=1)
+
+    async def run():
+        upstream = Upstream()
+        upstream.release.set()
+        assert await cache.get_or_transcribe("k1", upstream) == "is anyone here"
+        assert await cache.get_or_transcribe("k1", upstream) == "is anyone here"
+        await cache.put("k2", "other")  # evicts k1 from memory
+        assert await cache.get_or_transcribe("k1", upstream) == "is anyone here"
+        return upstream.calls
+
+    assert asyncio.run(run()) == 1
+    assert "k1" in collection.docs
+    stats = cache.stats()
+    assert (stats["misses"], stats["memory_hits"], stats["mongo_hits"]) == (1, 1, 1)
+
+
+def test_concurrent_callers_share_one_call():
+    cache = TranscriptionCache(FakeCollection())
+
+    async def run():
+        upstream = Upstream()
+        callers = [asyncio.create_task(cache.get_or_transcribe("k", upstream)) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await asyncio.gather(*callers), upstream.calls
+
+    results, calls = asyncio.run(run())
+    assert results == ["is anyone here"] * 3
+    assert calls == 1
+    assert cache.stats()["coalesced"] == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    cache = TranscriptionCache(FakeCollection())
+
+    async def run():
+        upstream = Upstream()
+        first = asyncio.create_task(cache.get_or_transcribe("k", upstream))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_transcribe("k", upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return first, await second
+
+    first, text = asyncio.run(run())
+    assert first.cancelled()
+    assert text == "is anyone here"
+    assert cache._pending == {}
+
+
+def test_upstream_errors_reach_every_caller_and_are_not_cached():
+    cache = TranscriptionCache(FakeCollection())
+
+    async def run():
+        failing = Upstream(error=RuntimeError("Whisper unavailable"))
+        callers = [asyncio.create_task(cache.get_or_transcribe("k", failing)) for _ in range(2)]
+        await asyncio.sleep(0)
+        failing.release.set()
+        errors = await asyncio.gather(*callers, return_exceptions=True)
+
+        retry = Upstream()
+        retry.release.set()
+        return errors, await cache.get_or_transcribe("k", retry)
+
+    errors, text = asyncio.run(run())
+    assert [str(error) for error in errors] == ["Whisper unavailable"] * 2
+    assert text == "is anyone here"
+
+
+def test_mongo_errors_fall_through_to_upstream():
+    cache = TranscriptionCache(FakeCollection(fail=True))
+
+    async def run():
+        upstream = Upstream()
+        upstream.release.set()
+        return await cache.get_or_transcribe("k", upstream), upstream.calls
+
+    # The paid transcription is returned even though it could not be stored
+    assert asyncio.run(run()) == ("is anyone here", 1)
+    assert cache.stats()["mongo_errors"] == 2
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from vad import build_trimmed_clip, detect_voiced_regions, map_to_original
+
+SR = 16000
+
+
+def room(seconds, seed=0):
+    return (np.random.default_rng(seed).normal(0, 0.002, int(seconds * SR))).astype(np.float32)
+
+
+def add_voice(samples, start, end):
+    t = np.arange(int((end - start) * SR)) / SR
+    samples[int(start * SR):int(end * SR)] += (0.2 * np.sin(2 * np.pi * 180 * t)).astype(np.float32)
+    return samples
+
+
+def test_finds_voiced_stretches_in_room_noise():
+    samples = add_voice(add_voice(room(10), 2.0, 3.0), 6.0, 6.5)
+    regions = detect_voiced_regions(samples, SR)
+
+    assert len(regions) == 2
+    (first_start, first_end), (second_start, second_end) = regions
+    # Padded by about 200 ms on each side
+    assert 1.7 <= first_start <= 2.0 and 3.0 <= first_end <= 3.3
+    assert 5.7 <= second_start <= 6.0 and 6.5 <= second_end <= 6.8
+
+
+def test_short_pauses_are_bridged():
+    samples = add_voice(add_voice(room(5), 1.0, 1.5), 1.7, 2.2)
+    assert len(detect_voiced_regions(samples, SR)) == 1
+
+
+def test_silence_and_tiny_clips_have_no_regions():
+    assert detect_voiced_regions(room(5), SR) == []
+    assert detect_voiced_regions(np.zeros(10, np.float32), SR) == []
+    # Quiet hum far below speech level is not voice, however far above the floor
+    assert detect_voiced_regions(add_voice(np.zeros(5 * SR, np.float32), 1, 2) * 1e-4, SR) == []
+
+
+def test_trimmed_clip_round_trips_timestamps():
+    samples = np.arange(10 * SR, dtype=np.float32)
+    trimmed, offsets = build_trimmed_clip(samples, SR, [(1.0, 2.0), (5.0, 5.5)], gap_seconds=0.3)
+
+    assert len(trimmed) == int(1.8 * SR)
+    assert offsets == [(0.0, 1.0, 1.0), (1.3, 5.0, 0.5)]
+    assert trimmed[0] == samples[SR]
+    assert trimmed[int(1.3 * SR)] == samples[5 * SR]
+
+    assert map_to_original(0.5, offsets) == 1.5
+    assert map_to_original(1.4, offsets) == 5.1
+    # Inside the spliced gap: snapped to the end of the first region
+    assert map_to_original(1.15, offsets) == 2.0
+    assert map_to_original(9.0, offsets) == 5.5
+
+
+def test_no_regions_gives_an_empty_clip():
+    trimmed, offsets = build_trimmed_clip(room(1), SR, [])
+    assert len(trimmed) == 0 and offsets == []
+    assert map_to_original(1.25, offsets) == pytest.approx(1.25)
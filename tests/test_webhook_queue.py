@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from webhook_queue import coalesce, event_id
+
+T0 = datetime(2024, 10, 31, 23, 0, 0)
+
+
+def event(event_type, subscription_id, minutes=0, custom_id=None):
+    resource = {"id": subscription_id}
+    if custom_id:
+        resource["custom_id"] = custom_id
+    return {"event_type": event_type, "resource": resource, "received_at": T0 + timedelta(minutes=minutes)}
+
+
+def test_last_event_wins_per_subscription():
+    operations, user_ids, subscription_ids = coalesce([
+        event("BILLING.SUBSCRIPTION.ACTIVATED", "I-1", 0, custom_id="user-1"),
+        event("BILLING.SUBSCRIPTION.SUSPENDED", "I-1", 1),
+        event("BILLING.SUBSCRIPTION.CANCELLED", "I-1", 2),
+    ])
+
+    assert subscription_ids == ["I-1"]
+    assert user_ids == {"user-1"}
+    assert operations == [UpdateOne(
+        {"user_id": "user-1"},
+        {"$set": {
+            "status": "cancelled",
+            "paypal_status": "CANCELLED",
+            "updated_at": (T0 + timedelta(minutes=2)).isoformat(),
+            "user_id": "user-1",
+            "paypal_subscription_id": "I-1",
+        }},
+        upsert=True,
+    )]
+
+
+def test_without_activation_updates_by_subscription_id():
+    operations, user_ids, subscription_ids = coalesce([
+        # custom_id is only trusted on activation
+        event("BILLING.SUBSCRIPTION.CANCELLED", "I-2", 0, custom_id="user-2"),
+    ])
+
+    assert user_ids == set()
+    assert subscription_ids == ["I-2"]
+    assert operations == [UpdateOne(
+        {"paypal_subscription_id": "I-2"},
+        {"$set": {"status": "cancelled", "paypal_status": "CANCELLED", "updated_at": T0.isoformat()}},
+    )]
+
+
+def test_one_operation_per_subscription():
+    operations, user_ids, subscription_ids = coalesce([
+        event("BILLING.SUBSCRIPTION.ACTIVATED", "I-1", 0, custom_id="user-1"),
+        event("BILLING.SUBSCRIPTION.ACTIVATED", "I-2", 1, custom_id="user-2"),
+        event("BILLING.SUBSCRIPTION.SUSPENDED", "I-1", 2),
+    ])
+
+    assert len(operations) == 2
+    assert user_ids == {"user-1", "user-2"}
+    assert subscription_ids == ["I-1", "I-2"]
+
+
+def test_skips_unknown_events_and_missing_resources():
+    operations, user_ids, subscription_ids = coalesce([
+        event("PAYMENT.SALE.COMPLETED", "I-1"),
+        {"event_type": "BILLING.SUBSCRIPTION.CANCELLED", "resource": None, "received_at": T0},
+        {"event_type": "BILLING.SUBSCRIPTION.CANCELLED", "resource": {}, "received_at": T0},
+    ])
+
+    assert (operations, user_ids, subscription_ids) == ([], set(), [])
+
+
+def test_event_id_falls_back_to_content_hash():
+    assert event_id({"id": "WH-1", "event_type": "x"}) == "WH-1"
+    unnamed = {"event_type": "x", "resource": {"id": "I-1"}}
+    assert event_id(unnamed).startswith("sha256:")
+    assert event_id(unnamed) == event_id(dict(reversed(list(unnamed.items()))))
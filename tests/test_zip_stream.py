@@ -0,0 +1,69 @@
+import io
+import struct
+import zipfile
+from datetime import datetime
+
+import zip_stream
+from zip_stream import ZipStream
+
+
+def build(entries, chunked=False):
+    stream = ZipStream()
+    parts = []
+    for name, data, compress in entries:
+        if chunked:
+            parts.append(stream.start_entry(name, compress, datetime(2024, 5, 17, 21, 30, 10)))
+            for i in range(0, len(data), 1000):
+                parts.append(stream.write(data[i:i + 1000]))
+            parts.append(stream.end_entry())
+        else:
+            parts.append(stream.add(name, data, compress, datetime(2024, 5, 17, 21, 30, 10)))
+    parts.append(stream.finish())
+    return b"".join(parts)
+
+
+def test_round_trip_stored_and_deflated():
+    audio = bytes(range(256)) * 40
+    manifest = b'{"session": "Old mill"}' * 50
+    archive = build([("recordings/a.m4a", audio, False), ("manifest.json", manifest, True)], chunked=True)
+
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["recordings/a.m4a", "manifest.json"]
+        assert zf.read("recordings/a.m4a") == audio
+        assert zf.read("manifest.json") == manifest
+        assert zf.getinfo("recordings/a.m4a").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("manifest.json").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.getinfo("manifest.json").date_time == (2024, 5, 17, 21, 30, 10)
+
+
+def test_utf8_names_and_empty_entries():
+    archive = build([("séance/café.wav", b"", False), ("notes.txt", b"", True)])
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.namelist() == ["séance/café.wav", "notes.txt"]
+        assert zf.read("séance/café.wav") == b""
+        assert zf.read("notes.txt") == b""
+
+
+def test_zip64_end_records(monkeypatch):
+    # Lower the threshold rather than writing 65535 entries
+    monkeypatch.setattr(zip_stream, "ENTRY_LIMIT", 3)
+    entries = [(f"recordings/{i}.wav", f"clip {i}".encode() * 100, i % 2 == 0) for i in range(5)]
+    archive = build(entries)
+
+    assert struct.pack("<I", 0x06064B50) in archive  # ZIP64 end of central directory
+    assert struct.pack("<I", 0x07064B50) in archive  # ZIP64 locator
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert [zf.read(name) for name, _, _ in entries] == [data for _, data, _ in entries]
+
+
+def test_unfinished_entry_is_rejected():
+    stream = ZipStream()
+    stream.start_entry("a.wav")
+    try:
+        stream.finish()
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("finish() accepted an open entry")